@@ -0,0 +1,122 @@
+"""
+Process-wide index of the academic calendar.
+
+Weeks are held as a sorted list of Monday dates, so mapping a date to its
+week is a bisect and a week to its dates a dict lookup, instead of a query.
+The index reloads after a Week is saved or deleted in this process, and at
+most every CALENDAR_CHECK_INTERVAL seconds it compares the 'week' change
+counter (see etags.py) to pick up changes made by other processes.
+"""
+import bisect
+import threading
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+from django.conf import settings
+from django.db import transaction
+from .models import Week, TableVersion
+
+WEEK_LENGTH = timedelta(days=7)
+
+
+class CalendarWeek(namedtuple('CalendarWeek', ['id', 'monday_date'])):
+    __slots__ = ()
+
+    @property
+    def sunday_date(self) -> date:
+        return self.monday_date + timedelta(days=6)
+
+    def __contains__(self, day: date) -> bool:
+        return self.monday_date <= day <= self.sunday_date
+
+
+class CalendarIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mondays = []
+        self._weeks = []
+        self._by_id = {}
+        self._version = None
+        self._checked = None
+        # moved by invalidate(), a load that raced with it stays stale
+        self._generation = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._checked = None
+            self._generation += 1
+
+    def _refresh(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._checked is not None and now - self._checked < settings.CALENDAR_CHECK_INTERVAL:
+                return
+            generation = self._generation
+            loaded = self._checked is not None
+
+        version = TableVersion.objects.filter(
+            table='week').values_list('version', flat=True).first()
+        if loaded and version == self._version:
+            with self._lock:
+                if generation == self._generation:
+                    self._checked = now
+            return
+
+        weeks = [CalendarWeek(week_id, monday) for monday, week_id in
+                 sorted(Week.objects.values_list('monday_date', 'id'))]
+        with self._lock:
+            self._weeks = weeks
+            self._mondays = [week.monday_date for week in weeks]
+            self._by_id = {week.id: week for week in weeks}
+            self._version = version
+            if generation == self._generation:
+                self._checked = now
+
+    def week_of(self, day: date):
+        """
+        The CalendarWeek containing the day, or None.
+        """
+        self._refresh()
+        with self._lock:
+            i = bisect.bisect_right(self._mondays, day)
+            if i == 0:
+                return None
+            week = self._weeks[i - 1]
+        return week if day - week.monday_date < WEEK_LENGTH else None
+
+    def week(self, week_id: int):
+        self._refresh()
+        with self._lock:
+            return self._by_id.get(week_id)
+
+    def weeks_of_dates(self, dates) -> dict:
+        """
+        {date: week id} for the dates that fall into a week.
+        """
+        weeks = {}
+        for day in set(dates):
+            if day is None:
+                continue
+            week = self.week_of(day)
+            if week:
+                weeks[day] = week.id
+        return weeks
+
+
+calendar = CalendarIndex()
+
+
+def week_of(day: date):
+    return calendar.week_of(day)
+
+
+def week_by_id(week_id: int):
+    return calendar.week(week_id)
+
+
+def weeks_of_dates(dates) -> dict:
+    return calendar.weeks_of_dates(dates)
+
+
+def invalidate_calendar():
+    transaction.on_commit(calendar.invalidate)
@@ -0,0 +1,124 @@
+"""
+Materialized access control.
+
+Staff access to groups (and so to their sessions and records) comes from
+three many-to-many paths: the group's TAs, the coordinators of its course
+and the executives of its lab. GroupAccess keeps one row per (user, group)
+pair reachable through any of them, so permission checks become a single
+indexed semi-join instead of an OR over several join paths.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from .etags import bump
+from .models import Course, Group, GroupAccess
+
+REFRESH_BATCH_SIZE = 500
+
+
+def _desired_access(group_ids: list) -> dict:
+    desired = {}
+
+    def grant(group_id, user_id, role):
+        flags = desired.setdefault((user_id, group_id), [False, False, False])
+        flags[role] = True
+
+    for group_id, user_id in Group.teaching_assistants.through.objects.filter(
+            group_id__in=group_ids).values_list('group_id', 'user_id'):
+        grant(group_id, user_id, 0)
+    for group_id, user_id in Group.objects.filter(
+            id__in=group_ids, course__course_coordinators__isnull=False).values_list(
+                'id', 'course__course_coordinators'):
+        grant(group_id, user_id, 1)
+    for group_id, user_id in Group.objects.filter(
+            id__in=group_ids, lab__lab_executives__isnull=False).values_list(
+                'id', 'lab__lab_executives'):
+        grant(group_id, user_id, 2)
+
+    return {key: (ta, coordinator, executive, coordinator or executive)
+            for key, (ta, coordinator, executive) in desired.items()}
+
+
+def _refresh_batch(group_ids: list):
+    desired = _desired_access(group_ids)
+    existing = {
+        (row[1], row[2]): (row[0], row[3:])
+        for row in GroupAccess.objects.filter(group_id__in=group_ids).values_list(
+            'id', 'user_id', 'group_id', 'as_ta', 'as_coordinator', 'as_executive', 'can_write')
+    }
+
+    to_delete = [pk for key, (pk, _) in existing.items() if key not in desired]
+    to_create, to_update = [], []
+    for (user_id, group_id), flags in desired.items():
+        access = GroupAccess(user_id=user_id, group_id=group_id, as_ta=flags[0],
+                             as_coordinator=flags[1], as_executive=flags[2], can_write=flags[3])
+        if (user_id, group_id) not in existing:
+            to_create.append(access)
+        elif existing[(user_id, group_id)][1] != flags:
+            access.id = existing[(user_id, group_id)][0]
+            to_update.append(access)
+
+    if to_delete:
+        GroupAccess.objects.filter(id__in=to_delete).delete()
+    if to_update:
+        GroupAccess.objects.bulk_update(
+            to_update, ['as_ta', 'as_coordinator', 'as_executive', 'can_write'])
+    if to_create:
+        GroupAccess.objects.bulk_create(to_create, ignore_conflicts=True)
+    if to_delete or to_update or to_create:
+        bump('group_access')
+
+
+def refresh_group_access(group_ids=None):
+    """
+    Bring the GroupAccess rows of the given groups (all groups when None)
+    in line with the TA, coordinator and executive relations.
+    """
+    if group_ids is None:
+        group_ids = Group.objects.order_by('id').values_list('id', flat=True)
+        GroupAccess.objects.exclude(group_id__in=Group.objects.values('id')).delete()
+    group_ids = list(group_ids)
+
+    with transaction.atomic():
+        for i in range(0, len(group_ids), REFRESH_BATCH_SIZE):
+            _refresh_batch(group_ids[i:i+REFRESH_BATCH_SIZE])
+
+
+def refresh_course_access(course_ids):
+    refresh_group_access(Group.objects.filter(
+        course_id__in=course_ids).values_list('id', flat=True))
+
+
+def refresh_lab_access(lab_ids):
+    refresh_group_access(Group.objects.filter(
+        lab_id__in=lab_ids).values_list('id', flat=True))
+
+
+def refresh_user_access(user_ids):
+    """
+    Refresh every group a user may have gained or lost access to, for
+    relation changes made from the user's side.
+    """
+    group_ids = Group.objects.filter(
+        Q(teaching_assistants__in=user_ids) |
+        Q(course__course_coordinators__in=user_ids) |
+        Q(lab__lab_executives__in=user_ids) |
+        Q(access__user_id__in=user_ids)
+    ).values_list('id', flat=True).distinct()
+    refresh_group_access(group_ids)
+
+
+def readable_groups(user: User):
+    return GroupAccess.objects.filter(user=user).values('group_id')
+
+
+def writable_groups(user: User):
+    return GroupAccess.objects.filter(user=user, can_write=True).values('group_id')
+
+
+def ta_courses(user: User):
+    return GroupAccess.objects.filter(user=user, as_ta=True).values('group__course_id')
+
+
+def coordinated_courses(user: User):
+    return Course.course_coordinators.through.objects.filter(user=user).values('course_id')
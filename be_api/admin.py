@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Week, Profile, Lab, Course, Group, BaseSession, RegularSession, SpecialSession, MakeUpSession, CheckInRecord
+from .models import Week, Profile, Lab, Course, Group, BaseSession, RegularSession, SpecialSession, MakeUpSession, CheckInRecord, MaterializedDay
 
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
@@ -34,3 +34,4 @@ admin.site.register(RegularSession)
 admin.site.register(SpecialSession)
 admin.site.register(MakeUpSession)
 admin.site.register(CheckInRecord)
+admin.site.register(MaterializedDay)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BeApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'be_api'
+
+    def ready(self):
+        from . import signals
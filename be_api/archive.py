@@ -0,0 +1,132 @@
+"""
+Archival of closed semesters.
+
+Sessions held before a cutoff date, and their records, are moved from
+BaseSession and CheckInRecord into ArchivedSession and
+ArchivedCheckInRecord, so the tables and indexes every request works on
+only hold the current semesters. Ids are kept. The counters of
+SessionAttendance move onto the archived session; the group/week, course
+and student/course rollups are left as they are, they still count the
+archived records (rebuild_rollups() counts both tables).
+
+Sessions that are part of a make up are not archived. Reads leave the
+archive out unless asked to include it.
+"""
+from datetime import date, timedelta
+from django.db import connection, transaction
+from django.db.models import F
+from .encoding import model_fields
+from .etags import bump
+from .models import (BaseSession, RegularSession, SpecialSession, CheckInRecord, SessionAttendance,
+                     ArchivedSession, ArchivedCheckInRecord)
+from .record_filters import refresh_record_users
+from .records import materialize_absent_records
+
+# sessions moved per transaction
+ARCHIVE_CHUNK_SIZE = 100
+
+SESSION_COLUMNS = [
+    'id', 'group_id', 'check_in_ddl_mins', 'allow_late_check_in', 'compulsory', 'active',
+    'effective_lab_id', 'effective_room', 'effective_date', 'effective_start', 'effective_end',
+]
+SUBTYPE_COLUMNS = {
+    'week_id': 'regularsession__week_id',
+    'lab_id': 'specialsession__lab_id',
+    'lab_room': 'specialsession__lab_room',
+    'lab_date': 'specialsession__lab_date',
+    'start_time': 'specialsession__start_time',
+    'end_time': 'specialsession__end_time',
+}
+
+
+def wants_archived(params) -> bool:
+    return params.get('include_archived', '0') not in ('', '0', 'false')
+
+
+def archivable_sessions(before: date):
+    return BaseSession.objects.filter(effective_date__lt=before).exclude(
+        original_sessions_of__isnull=False).exclude(make_up_session_of__isnull=False)
+
+
+def latest_cutoff() -> date:
+    # the current week is never closed
+    today = date.today()
+    return today - timedelta(days=today.weekday())
+
+
+def _delete(model, column: str, ids: list):
+    # a plain DELETE: the signals of a queryset delete() would take the
+    # records out of the rollups
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {qn(model._meta.db_table)} WHERE {qn(column)} IN '
+                       f'({", ".join(["%s"] * len(ids))})', ids)
+
+
+def _archive_chunk(session_ids: list) -> dict:
+    with transaction.atomic():
+        # days no one opened have no absent records yet
+        materialize_absent_records(BaseSession.objects.filter(
+            id__in=session_ids, active=True).values_list('id', flat=True))
+
+        counters = {row['session_id']: row for row in SessionAttendance.objects.filter(
+            session_id__in=session_ids).values('session_id', 'absent', 'late', 'attended')}
+        sessions = BaseSession.objects.filter(id__in=session_ids).values(
+            *SESSION_COLUMNS, **{name: F(path) for name, path in SUBTYPE_COLUMNS.items()})
+        archived = []
+        for row in sessions:
+            counts = counters.get(row['id'], {})
+            archived.append(ArchivedSession(
+                absent=counts.get('absent', 0), late=counts.get('late', 0),
+                attended=counts.get('attended', 0), **row))
+        ArchivedSession.objects.bulk_create(archived, batch_size=1000)
+
+        # locked so a concurrent update cannot land between the copy and
+        # the delete and be lost
+        fields = model_fields(CheckInRecord)
+        records = CheckInRecord.objects.filter(
+            session_id__in=session_ids).select_for_update().values_list(*fields)
+        moved = ArchivedCheckInRecord.objects.bulk_create([
+            ArchivedCheckInRecord(**dict(zip(fields, row))) for row in records
+        ], batch_size=1000)
+
+        _delete(CheckInRecord, 'session_id', session_ids)
+        _delete(SessionAttendance, 'session_id', session_ids)
+        _delete(RegularSession, 'basesession_ptr_id', session_ids)
+        _delete(SpecialSession, 'basesession_ptr_id', session_ids)
+        _delete(BaseSession, 'id', session_ids)
+        bump('session', 'record', 'attendance')
+
+    return {
+        'sessions': len(archived),
+        'records': len(moved),
+        'groups': {session.group_id for session in archived},
+    }
+
+
+def archive_sessions(before: date, chunk_size: int = ARCHIVE_CHUNK_SIZE, log=None) -> dict:
+    """
+    Move the sessions held before `before` and their records into the
+    archive, `chunk_size` sessions per transaction. Returns counts.
+    """
+    if before > latest_cutoff():
+        raise ValueError('sessions of the current week cannot be archived')
+
+    stats = {'sessions': 0, 'records': 0}
+    groups = set()
+    while True:
+        session_ids = list(archivable_sessions(before).order_by(
+            'id').values_list('id', flat=True)[:chunk_size])
+        if not session_ids:
+            break
+        moved = _archive_chunk(session_ids)
+        stats['sessions'] += moved['sessions']
+        stats['records'] += moved['records']
+        groups |= moved['groups']
+        if log:
+            log(f"{stats['sessions']} sessions, {stats['records']} records archived")
+
+    # the filter options only list users of records that are not archived
+    if groups:
+        refresh_record_users(groups)
+    return stats
@@ -0,0 +1,134 @@
+import json
+import math
+import os
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+
+
+@contextmanager
+def throwaway_database():
+    """
+    Run the body against a freshly migrated test database that is dropped
+    afterwards, so benchmarks never touch real data. SQLite gets a temporary
+    file instead of the shared in-memory database so that several threads
+    can write to it.
+    """
+    old_name = connection.settings_dict['NAME']
+    tmp_path = None
+    if connection.vendor == 'sqlite':
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = tmp_path
+
+    connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False)
+    # replicas read the throwaway database too, as in tests
+    replica_names = {alias: connections[alias].settings_dict['NAME']
+                     for alias in settings.REPLICA_DATABASES}
+    for alias in replica_names:
+        connections[alias].close()
+        connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+    try:
+        yield
+    finally:
+        for alias, name in replica_names.items():
+            connections[alias].close()
+            connections[alias].settings_dict['NAME'] = name
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # nearest rank
+    index = min(len(sorted_values) - 1,
+                max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class ViewBenchmark:
+    """
+    Drives views through the test client. A spec is a dict with
+    `route`, `user` (a username or None), `method` ('get' or 'post') and
+    `params(i)` returning the query parameters or the JSON body of the
+    i-th call; `fresh_login` logs the user in again before every call and
+    `expect_status` is the status the first call must answer with.
+    """
+
+    def __init__(self, iterations: int = 20, warmup: int = 2):
+        self.iterations = iterations
+        self.warmup = warmup
+        setup_test_environment()
+
+    def _client(self, username):
+        from django.contrib.auth.models import User
+        client = Client()
+        if username:
+            client.force_login(User.objects.get(username=username))
+        return client
+
+    def _call(self, client, spec, url, i):
+        params = spec['params'](i) if 'params' in spec else {}
+        if spec.get('method', 'get') == 'post':
+            resp = client.post(url, json.dumps(params),
+                               content_type='application/json')
+        else:
+            resp = client.get(url, params)
+        if resp.streaming:
+            b''.join(resp.streaming_content)
+        return resp
+
+    def _check_status(self, spec, resp):
+        expected = spec.get('expect_status')
+        if expected is not None and resp.status_code != expected:
+            raise AssertionError(f'{spec["route"]} answered {resp.status_code}, expected {expected}')
+
+    def run(self, spec, url) -> dict:
+        client = self._client(spec.get('user'))
+        for i in range(self.warmup):
+            resp = self._call(client, spec, url, -1 - i)
+            if i == 0:
+                self._check_status(spec, resp)
+
+        latencies, queries, statuses = [], [], set()
+        for i in range(self.iterations):
+            if spec.get('fresh_login'):
+                client = self._client(spec.get('user'))
+            with CaptureQueriesContext(connection) as captured:
+                begin = time.perf_counter()
+                resp = self._call(client, spec, url, i)
+                latencies.append(time.perf_counter() - begin)
+            if i == 0 and not self.warmup:
+                self._check_status(spec, resp)
+            queries.append(len(captured))
+            statuses.add(resp.status_code)
+
+        if spec.get('fresh_login'):
+            client = self._client(spec.get('user'))
+        tracemalloc.start()
+        try:
+            self._call(client, spec, url, self.iterations)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        latencies.sort()
+        return {
+            'route': spec['route'],
+            'iterations': self.iterations,
+            'status': sorted(statuses),
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'mean_queries': sum(queries) / len(queries) if queries else 0,
+            'max_queries': max(queries) if queries else 0,
+            'peak_memory_bytes': peak,
+        }
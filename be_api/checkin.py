@@ -0,0 +1,202 @@
+import threading
+import time as time_module
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.db.models import Q, Case, When, Value, IntegerField, DateTimeField
+from django.utils import timezone
+from .models import Group, BaseSession, CheckInRecord, modify_stamp
+from .etags import bump
+from .lab_cache import invalidate_sessions
+from .live import publish_records
+from .records import materialize_absent_records
+from .rollups import apply_record_changes
+
+# students may check in this many minutes before a session starts
+CHECK_IN_OPEN_MINS = 15
+
+
+class CheckInRejected(Exception):
+    pass
+
+
+def _member_of_group(user: User, prefix: str) -> Q:
+    return Q(**{f'{prefix}students': user}) | Q(**{f'{prefix}teaching_assistants': user})
+
+
+def find_current_session(user: User, lab_id: int, lab_room: int, now: datetime):
+    """
+    The active session the user belongs to that is open for check in in the
+    lab room at `now`, as (session_id, start, deadline, end, allow_late), or
+    None.
+    """
+    local_now = timezone.localtime(now)
+    today = local_now.date()
+    opens_before = (local_now + timedelta(minutes=CHECK_IN_OPEN_MINS)).time()
+    now_time = local_now.time()
+
+    groups = Group.objects.filter(_member_of_group(user, ''))
+    sessions = BaseSession.objects.filter(
+        active=True, effective_lab_id=lab_id, effective_room=lab_room, effective_date=today,
+        effective_start__lte=opens_before, effective_end__gt=now_time, group__in=groups).order_by(
+            'effective_start', 'id').values_list(
+                'id', 'effective_start', 'effective_end', 'check_in_ddl_mins', 'allow_late_check_in')[:1]
+    if not sessions:
+        return None
+
+    session_id, start_time, end_time, ddl_mins, allow_late = sessions[0]
+    start = datetime.combine(today, start_time, tzinfo=local_now.tzinfo)
+    end = datetime.combine(today, end_time, tzinfo=local_now.tzinfo)
+    return session_id, start, start + timedelta(minutes=ddl_mins), end, allow_late
+
+
+def write_check_ins(check_ins: dict) -> int:
+    """
+    Apply {record_id: (check_in_state, check_in_time)} with one UPDATE.
+    Records that are no longer absent are left alone.
+    """
+    if not check_ins:
+        return 0
+    ids = list(check_ins.keys())
+    stamp = modify_stamp()
+    with transaction.atomic():
+        updated = CheckInRecord.objects.filter(pk__in=ids, check_in_state=CheckInRecord.ABSENT).update(
+            check_in_state=Case(*[When(pk=pk, then=Value(state)) for pk, (state, _) in check_ins.items()],
+                                output_field=IntegerField()),
+            check_in_time=Case(*[When(pk=pk, then=Value(when)) for pk, (_, when) in check_ins.items()],
+                               output_field=DateTimeField()),
+            last_modify_time=stamp,
+        )
+        if updated:
+            written = CheckInRecord.objects.filter(pk__in=ids, last_modify_time=stamp).values_list(
+                'id', 'session_id', 'user_id', 'user_type')
+            removed, added = [], []
+            for pk, session_id, user_id, user_type in written:
+                removed.append((session_id, user_id, user_type, CheckInRecord.ABSENT))
+                added.append((session_id, user_id, user_type, check_ins[pk][0]))
+            apply_record_changes(removed=removed, added=added)
+            bump('record')
+            invalidate_sessions({row[0] for row in added})
+            publish_records(CheckInRecord.objects.filter(
+                pk__in=ids, last_modify_time=stamp))
+    return updated
+
+
+class _PendingCheckIn:
+    def __init__(self, state: int, when: datetime):
+        self.state = state
+        self.when = when
+        self.done = threading.Event()
+        self.error = None
+
+
+class CheckInWriter:
+    """
+    Buffers check ins from concurrent requests and flushes them from a
+    background thread as batched UPDATEs every `interval` seconds.
+    """
+
+    def __init__(self, interval: float, max_batch: int):
+        self.interval = interval
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def submit(self, record_id: int, state: int, when: datetime, timeout: float = 5.0):
+        with self._lock:
+            item = self._pending.get(record_id)
+            if item is None:
+                item = _PendingCheckIn(state, when)
+                self._pending[record_id] = item
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='check-in-writer', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+        if not item.done.wait(timeout):
+            raise TimeoutError('check in was not written in time')
+        if item.error:
+            raise item.error
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            time_module.sleep(self.interval)
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._wakeup.clear()
+            if pending:
+                self._flush(pending)
+
+    def _flush(self, pending: dict):
+        close_old_connections()
+        items = list(pending.items())
+        for i in range(0, len(items), self.max_batch):
+            chunk = items[i:i+self.max_batch]
+            error = None
+            try:
+                write_check_ins({pk: (item.state, item.when)
+                                for pk, item in chunk})
+            except Exception as e:
+                error = e
+            for _, item in chunk:
+                item.error = error
+                item.done.set()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> CheckInWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = CheckInWriter(settings.CHECK_IN_FLUSH_INTERVAL,
+                                    settings.CHECK_IN_MAX_BATCH)
+        return _writer
+
+
+def check_in(user: User, lab_id: int, lab_room: int, now: datetime = None, coalesce: bool = None) -> dict:
+    if now is None:
+        now = timezone.now()
+    if coalesce is None:
+        coalesce = settings.CHECK_IN_COALESCE
+
+    session = find_current_session(user, lab_id, lab_room, now)
+    if not session:
+        raise CheckInRejected('no session to check in')
+    session_id, start, deadline, end, allow_late = session
+
+    if now <= deadline:
+        state = CheckInRecord.ATTENDED
+    elif allow_late:
+        state = CheckInRecord.LATE
+    else:
+        raise CheckInRejected('check in deadline passed')
+
+    record = CheckInRecord.objects.filter(session_id=session_id, user=user).values(
+        'id', 'check_in_state', 'check_in_time').first()
+    if not record:
+        materialize_absent_records([session_id])
+        record = CheckInRecord.objects.filter(session_id=session_id, user=user).values(
+            'id', 'check_in_state', 'check_in_time').first()
+        if not record:
+            raise CheckInRejected('no session to check in')
+
+    if record['check_in_state'] != CheckInRecord.ABSENT:
+        # already checked in, report the existing state
+        return {'record_id': record['id'], 'session_id': session_id,
+                'check_in_state': record['check_in_state'], 'check_in_time': record['check_in_time']}
+
+    if coalesce:
+        get_writer().submit(record['id'], state, now)
+    else:
+        write_check_ins({record['id']: (state, now)})
+
+    return {'record_id': record['id'], 'session_id': session_id,
+            'check_in_state': state, 'check_in_time': now}
@@ -0,0 +1,124 @@
+"""
+Strong ETags for read endpoints.
+
+Every logical table a response may depend on has a change counter in
+TableVersion that all write paths bump. The ETag of a GET is a hash of the
+route, its query string, the requesting user and the counters of the tables
+the view reads, so a conditional request costs one small query and gets a
+304 before the view runs.
+"""
+import hashlib
+from functools import wraps
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpRequest, HttpResponseNotModified
+from .models import TableVersion
+
+TABLES = [
+    'user', 'lab', 'lab_executives', 'course', 'course_coordinators', 'group', 'group_members',
+    'week', 'session', 'record', 'group_access', 'record_users', 'attendance',
+]
+
+
+def _bump(names: list):
+    updated = TableVersion.objects.filter(
+        table__in=names).update(version=F('version') + 1)
+    if updated < len(names):
+        TableVersion.objects.bulk_create(
+            [TableVersion(table=name, version=0) for name in names], ignore_conflicts=True)
+        existing = set(TableVersion.objects.filter(
+            table__in=names, version=0).values_list('table', flat=True))
+        TableVersion.objects.filter(
+            table__in=existing).update(version=F('version') + 1)
+
+
+class _PendingBumps:
+    """
+    The tables bumped in the current savepoint of a connection's
+    transaction, written with one UPDATE when the transaction commits.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.savepoint_ids = list(connection.savepoint_ids)
+        self.names = set()
+
+    def scheduled(self) -> bool:
+        # the commit hook goes with a rollback of its savepoint or
+        # transaction, later bumps then need a hook of their own
+        return self.savepoint_ids == self.connection.savepoint_ids and \
+            any(hook[1] == self.flush for hook in self.connection.run_on_commit)
+
+    def flush(self):
+        if getattr(self.connection, 'pending_bumps', None) is self:
+            self.connection.pending_bumps = None
+        _bump(sorted(self.names))
+
+
+def bump(*names):
+    """
+    Mark tables as changed once the current transaction commits, so a
+    reader never pairs the new version with the old data. The bumps of a
+    transaction are coalesced per savepoint.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        _bump(sorted(set(names)))
+        return
+    pending = getattr(connection, 'pending_bumps', None)
+    if pending is None or not pending.scheduled():
+        pending = connection.pending_bumps = _PendingBumps(connection)
+        transaction.on_commit(pending.flush)
+    pending.names.update(names)
+
+
+def compute_etag(request: HttpRequest, names) -> str:
+    versions = sorted(TableVersion.objects.filter(
+        table__in=names).values_list('table', 'version'))
+    user = request.user
+    match = request.resolver_match
+    key = '|'.join([
+        match.url_name if match and match.url_name else request.path,
+        '&'.join(sorted(request.GET.urlencode().split('&'))),
+        f'{user.pk}:{int(user.is_staff)}:{int(user.is_superuser)}',
+        ','.join(f'{t}={v}' for t, v in versions),
+    ])
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def conditional_get(*names):
+    """
+    Answer GETs whose If-None-Match still matches with 304, and tag 200
+    responses with the ETag. `names` are the TABLES the view reads.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def f(request: HttpRequest):
+            if request.method not in ('GET', 'HEAD'):
+                return handler(request)
+
+            etag = compute_etag(request, names)
+            if_none_match = request.headers.get('If-None-Match')
+            if if_none_match and _matches(if_none_match, etag):
+                resp = HttpResponseNotModified()
+                resp['ETag'] = etag
+                return resp
+
+            resp = handler(request)
+            if resp.status_code == 200:
+                resp['ETag'] = etag
+            return resp
+        return f
+    return decorator
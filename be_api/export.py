@@ -0,0 +1,92 @@
+import csv
+from .models import CheckInRecord
+from .rowjson import row_encoder
+
+EXPORT_CHUNK_SIZE = 2000
+
+RECORD_COLUMNS = [
+    ('id', 'id'),
+    ('session_id', 'session_id'),
+    ('user_id', 'user_id'),
+    ('user_type', 'user_type'),
+    ('check_in_state', 'check_in_state'),
+    ('check_in_time', 'check_in_time'),
+    ('last_modify_time', 'last_modify_time'),
+    ('remark', 'remark'),
+]
+
+# joined in the same query when the export is expanded
+EXPANDED_RECORD_COLUMNS = [
+    ('user__username', 'username'),
+    ('user__first_name', 'first_name'),
+    ('user__last_name', 'last_name'),
+    ('session__group_id', 'group_id'),
+    ('session__group__group_name', 'group_name'),
+    ('session__group__course_id', 'course_id'),
+    ('session__group__course__course_code', 'course_code'),
+    ('session__regularsession__week_id', 'week_id'),
+    ('session__specialsession__lab_date', 'lab_date'),
+]
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def record_columns(expand: bool) -> list:
+    return RECORD_COLUMNS + EXPANDED_RECORD_COLUMNS if expand else RECORD_COLUMNS
+
+
+def _rows(queryset, columns):
+    return queryset.order_by('id').values_list(
+        *[lookup for lookup, _ in columns]).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _batched(lines, size: int = 500):
+    # the first line, the CSV header, goes out on its own so the download
+    # starts before the first batch of rows is read
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    yield first
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def ndjson_lines(queryset, columns):
+    encoder = row_encoder(CheckInRecord, [lookup for lookup, _ in columns],
+                          [name for _, name in columns])
+    for row in _rows(queryset, columns):
+        yield encoder.encode_object(row) + '\n'
+
+
+def csv_lines(queryset, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for _, name in columns])
+    for row in _rows(queryset, columns):
+        yield writer.writerow(['' if v is None else v.isoformat() if hasattr(v, 'isoformat') else v
+                               for v in row])
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+    'csv': ('text/csv', csv_lines),
+}
+
+
+def export_stream(queryset, fmt: str, expand: bool):
+    """
+    (content_type, iterator of text chunks) exporting the queryset in the
+    given format. Rows are read with a chunked iterator so memory use does
+    not depend on the number of rows.
+    """
+    content_type, lines = EXPORT_FORMATS[fmt]
+    return content_type, _batched(lines(queryset, record_columns(expand)))
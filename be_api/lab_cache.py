@@ -0,0 +1,133 @@
+"""
+Cache of the serialized records_of_lab_today snapshot per (lab, date).
+
+Every reader allowed to see a lab today gets the same payload (the
+permission check itself runs before the cache is consulted), so one entry
+per lab and date serves all of them. Entries live in the `lab_day` cache
+alias, locmem by default or file based when LAB_DAY_CACHE_LOCATION is set;
+use the file based cache when several worker processes serve the API, so
+an invalidation in one reaches the others.
+
+Invalidation is by generation: each lab has a token in the cache that is
+part of the entry key, and writers replace the token of the labs they touch
+once their transaction commits. Tokens are random rather than counters, so
+an evicted token can never bring an old entry back. The number of entries
+is bounded by an LRU kept on top of the backend.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import date
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from . import metrics
+from .models import Group, BaseSession
+
+CACHE_ALIAS = 'lab_day'
+ALL_LABS = 'all'
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _generation_key(scope) -> str:
+    return f'lab_day:gen:{scope}'
+
+
+def _generation(scope) -> str:
+    cache = _cache()
+    token = cache.get(_generation_key(scope))
+    if token is None:
+        cache.add(_generation_key(scope), uuid.uuid4().hex, None)
+        token = cache.get(_generation_key(scope))
+    return token
+
+
+class _LRU:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+
+    def touch(self, key: str):
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+
+    def add(self, key: str) -> list:
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            evicted = []
+            while len(self._keys) > settings.LAB_DAY_CACHE_MAX_ENTRIES:
+                evicted.append(self._keys.popitem(last=False)[0])
+            return evicted
+
+
+_lru = _LRU()
+
+
+def _entry_key(lab_id: int, day: date, variant: str) -> str:
+    return f'lab_day:{lab_id}:{day.isoformat()}:{variant}:{_generation(ALL_LABS)}:{_generation(lab_id)}'
+
+
+def cached_snapshot(lab_id: int, day: date, build, variant: str = '') -> str:
+    """
+    The JSON text of the snapshot of a lab on a day, calling `build()` for
+    the JSON text on a miss. `variant` tells apart encodings of the same
+    snapshot.
+    """
+    # the key is taken before building, so a write that commits while the
+    # snapshot is built leaves the new entry unreachable instead of stale
+    key = _entry_key(lab_id, day, variant)
+    cache = _cache()
+    text = cache.get(key)
+    if text is not None:
+        _lru.touch(key)
+        metrics.inc('lab_day_cache_hits')
+        return text
+
+    metrics.inc('lab_day_cache_misses')
+    text = build()
+    cache.set(key, text, settings.LAB_DAY_CACHE_TIMEOUT)
+    evicted = _lru.add(key)
+    if evicted:
+        cache.delete_many(evicted)
+        metrics.inc('lab_day_cache_evictions', len(evicted))
+    return text
+
+
+def _replace_generations(scopes):
+    cache = _cache()
+    cache.set_many({_generation_key(scope): uuid.uuid4().hex
+                    for scope in scopes}, None)
+
+
+def invalidate_labs(lab_ids):
+    scopes = {lab_id for lab_id in lab_ids if lab_id is not None}
+    if scopes:
+        transaction.on_commit(lambda: _replace_generations(scopes))
+
+
+def invalidate_all():
+    transaction.on_commit(lambda: _replace_generations([ALL_LABS]))
+
+
+def labs_of_sessions(session_ids) -> set:
+    return set(BaseSession.objects.filter(id__in=session_ids).values_list('effective_lab_id', flat=True))
+
+
+def labs_of_groups(group_ids) -> set:
+    group_ids = list(group_ids)
+    # special sessions of a group may be held in another lab
+    return set(Group.objects.filter(id__in=group_ids).values_list('lab_id', flat=True)) | \
+        set(BaseSession.objects.filter(group_id__in=group_ids).values_list('effective_lab_id', flat=True))
+
+
+def invalidate_sessions(session_ids):
+    invalidate_labs(labs_of_sessions(session_ids))
+
+
+def invalidate_groups(group_ids):
+    invalidate_labs(labs_of_groups(group_ids))
@@ -0,0 +1,203 @@
+"""
+Live check in feed of a lab over server-sent events.
+
+GET /api/lab_events?lab_id=<id> is served by a plain ASGI app (see
+lab_attendance_system_be/asgi.py). A subscriber first receives a
+`snapshot` event with the records_of_lab_today payload, then a `records`
+event with the changed CheckInRecord rows whenever records of the lab are
+written. Writers call publish_records() once per write; the rows are read
+once and fanned out to every subscriber of the affected labs by an
+in-process pub/sub, so the cost of a write does not depend on how many
+dashboards are open.
+"""
+import asyncio
+import json
+import threading
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from . import metrics
+
+SUBSCRIBER_QUEUE_SIZE = 1000
+KEEP_ALIVE_SECONDS = 15
+
+
+class _Subscriber:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, rows):
+        try:
+            self.queue.put_nowait(rows)
+        except asyncio.QueueFull:
+            # too slow to keep up, the stream is closed and the client
+            # reconnects to a fresh snapshot
+            self.overflowed = True
+
+
+class LiveFeed:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, lab_id: int, subscriber: _Subscriber):
+        with self._lock:
+            self._subscribers.setdefault(lab_id, set()).add(subscriber)
+
+    def unsubscribe(self, lab_id: int, subscriber: _Subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(lab_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[lab_id]
+
+    def watched_labs(self) -> set:
+        with self._lock:
+            return set(self._subscribers)
+
+    def broadcast(self, lab_id: int, rows: list):
+        with self._lock:
+            subscribers = list(self._subscribers.get(lab_id, ()))
+        for subscriber in subscribers:
+            subscriber.loop.call_soon_threadsafe(subscriber.deliver, rows)
+
+
+feed = LiveFeed()
+
+
+def _publish(records):
+    labs = feed.watched_labs()
+    if not labs:
+        return
+    rows = records.annotate(lab_id=F('session__effective_lab_id')).filter(
+        lab_id__in=labs).values()
+
+    by_lab = {}
+    for row in rows:
+        by_lab.setdefault(row.pop('lab_id'), []).append(row)
+    for lab_id, lab_rows in by_lab.items():
+        feed.broadcast(lab_id, lab_rows)
+        metrics.inc('live_broadcasts')
+
+
+def publish_records(records):
+    """
+    Push the rows of a CheckInRecord queryset to the subscribers of their
+    labs once the current transaction commits. Costs nothing when no one is
+    watching.
+    """
+    if not feed.watched_labs():
+        return
+    transaction.on_commit(lambda: _publish(records))
+
+
+def _sse_text(event: str, text: str) -> bytes:
+    return f'event: {event}\ndata: {text}\n\n'.encode()
+
+
+def _sse(event: str, data) -> bytes:
+    return _sse_text(event, json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def _authorize(headers: dict, lab_id: int, token: str = None) -> bool:
+    from django.contrib.auth import get_user
+    from django.http import HttpRequest
+    from importlib import import_module
+    from .tokens import bearer_token, read_token, token_user
+    from .views import lab_today_readable_by
+
+    close_old_connections()
+    try:
+        # EventSource cannot set headers, so the token may come in the query
+        token = bearer_token(headers.get('authorization', '')) or token
+        payload = read_token(token) if token else None
+        if payload:
+            return lab_today_readable_by(token_user(payload), lab_id)
+
+        cookie = SimpleCookie(headers.get('cookie', ''))
+        session_key = cookie[settings.SESSION_COOKIE_NAME].value if settings.SESSION_COOKIE_NAME in cookie else None
+        request = HttpRequest()
+        request.session = import_module(
+            settings.SESSION_ENGINE).SessionStore(session_key)
+        user = get_user(request)
+        return user.is_authenticated and lab_today_readable_by(user, lab_id)
+    finally:
+        close_old_connections()
+
+
+def _snapshot(lab_id: int) -> str:
+    from .views import cached_lab_today_snapshot
+
+    close_old_connections()
+    try:
+        return cached_lab_today_snapshot(lab_id)
+    finally:
+        close_old_connections()
+
+
+async def _send_response(send, status: int, body: bytes, content_type: bytes = b'application/json'):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type)]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lab_events_app(scope, receive, send):
+    headers = {k.decode('latin-1'): v.decode('latin-1')
+               for k, v in scope.get('headers', [])}
+    query = parse_qs(scope.get('query_string', b'').decode())
+    try:
+        lab_id = int(query['lab_id'][0])
+    except (KeyError, ValueError):
+        await _send_response(send, 400, b'{"ok": false, "error": {"code": 400, "msg": "bad request"}}')
+        return
+
+    token = query.get('token', [None])[0]
+    if not await sync_to_async(_authorize)(headers, lab_id, token):
+        await _send_response(send, 401, b'{"ok": false, "error": {"code": 401, "msg": "unauthorized"}}')
+        return
+
+    subscriber = _Subscriber(asyncio.get_running_loop())
+    # subscribe before taking the snapshot so no write falls in between
+    feed.subscribe(lab_id, subscriber)
+    metrics.inc('live_connections')
+    try:
+        snapshot = await sync_to_async(_snapshot)(lab_id)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': _sse_text('snapshot', snapshot), 'more_body': True})
+
+        disconnected = asyncio.ensure_future(receive())
+        try:
+            while not subscriber.overflowed:
+                changed = asyncio.ensure_future(subscriber.queue.get())
+                done, _ = await asyncio.wait({changed, disconnected}, timeout=KEEP_ALIVE_SECONDS,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    if disconnected.result()['type'] == 'http.disconnect':
+                        changed.cancel()
+                        return
+                    disconnected = asyncio.ensure_future(receive())
+                if changed not in done:
+                    changed.cancel()
+                    await send({'type': 'http.response.body', 'body': b': keep-alive\n\n', 'more_body': True})
+                    continue
+
+                rows = changed.result()
+                while not subscriber.queue.empty():
+                    rows = rows + subscriber.queue.get_nowait()
+                await send({'type': 'http.response.body', 'body': _sse('records', rows), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+    finally:
+        feed.unsubscribe(lab_id, subscriber)
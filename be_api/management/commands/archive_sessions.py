@@ -0,0 +1,34 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from be_api.archive import archive_sessions, ARCHIVE_CHUNK_SIZE
+from be_api.models import Week
+
+
+class Command(BaseCommand):
+    help = 'Move the sessions and check in records of closed semesters into the archive tables'
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group(required=True)
+        cutoff.add_argument('--through-week', type=int,
+                            help='id of the last week of the closed semester')
+        cutoff.add_argument('--before', type=date.fromisoformat,
+                            help='archive the sessions held before this day')
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE,
+                            help='sessions moved per transaction')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('chunk size must be positive')
+        before = options['before']
+        if options['through_week'] is not None:
+            week = Week.objects.filter(id=options['through_week']).first()
+            if not week:
+                raise CommandError(f"no week {options['through_week']}")
+            before = week.monday_date + timedelta(days=7)
+
+        try:
+            stats = archive_sessions(before, chunk_size=options['chunk_size'], log=self.stdout.write)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"archived {stats['sessions']} sessions and {stats['records']} records held before {before}"))
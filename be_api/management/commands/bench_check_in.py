@@ -0,0 +1,87 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time as dtime
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from be_api.bench import throwaway_database
+from be_api.checkin import check_in
+from be_api.models import Week, Lab, Course, Group, RegularSession, CheckInRecord
+from be_api.records import materialize_absent_records
+
+
+class Command(BaseCommand):
+    help = 'Measure sustained check ins per second with and without write coalescing on a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--groups', type=int, default=40)
+        parser.add_argument('--students', type=int, default=50,
+                            help='students per group')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--json', action='store_true',
+                            help='print the results as JSON')
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            users, lab_id = self.seed(options['groups'], options['students'])
+            results = {}
+            for mode, coalesce in (('direct', False), ('coalesced', True)):
+                CheckInRecord.objects.update(
+                    check_in_state=CheckInRecord.ABSENT, check_in_time=None)
+                results[mode] = self.run(
+                    users, lab_id, coalesce, options['threads'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+        for mode, r in results.items():
+            self.stdout.write(
+                f"{mode:>10}: {r['check_ins']} check ins in {r['seconds']:.2f}s, "
+                f"{r['per_second']:.0f}/s, {r['written']} written, {r['errors']} errors")
+
+    def seed(self, group_count: int, student_count: int):
+        today = timezone.localdate()
+        week = Week.objects.create(
+            monday_date=today - timezone.timedelta(days=today.weekday()))
+        lab = Lab.objects.create(lab_name='bench', room_count=1)
+        course = Course.objects.create(course_code='BENCH', title='bench')
+        User.objects.bulk_create([
+            User(username=f'bench{i}') for i in range(group_count * student_count)])
+        users = list(User.objects.order_by('id'))
+
+        session_ids = []
+        for g in range(group_count):
+            group = Group.objects.create(
+                course=course, group_name=str(g), lab=lab, lab_room=1,
+                day_of_week=today.isoweekday(), start_time=dtime(0, 0),
+                end_time=dtime(23, 59, 59))
+            group.students.set(
+                users[g * student_count:(g + 1) * student_count])
+            session_ids.append(RegularSession.objects.create(
+                group=group, week=week, check_in_ddl_mins=24 * 60).id)
+        materialize_absent_records(session_ids)
+        return users, lab.id
+
+    def run(self, users, lab_id: int, coalesce: bool, threads: int) -> dict:
+        def one(user):
+            try:
+                check_in(user, lab_id, 1, coalesce=coalesce)
+                return True
+            except Exception:
+                return False
+
+        begin = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            ok = sum(pool.map(one, users))
+        seconds = time.perf_counter() - begin
+        written = CheckInRecord.objects.exclude(
+            check_in_state=CheckInRecord.ABSENT).count()
+
+        return {
+            'check_ins': ok,
+            'errors': len(users) - ok,
+            'written': written,
+            'seconds': seconds,
+            'per_second': ok / seconds if seconds else 0,
+        }
@@ -0,0 +1,147 @@
+import json
+import random
+import time
+from datetime import date, time as dtime, timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from be_api import views
+from be_api.access import refresh_group_access
+from be_api.bench import throwaway_database
+from be_api.models import Week, Lab, Course, Group, BaseSession, RegularSession, CheckInRecord
+
+
+# the permission predicates before the group access table, kept for comparison
+def legacy_course_can_read_by(user):
+    return Q(course_coordinators=user) | Q(groups__teaching_assistants=user)
+
+
+def legacy_group_can_read_by(user):
+    return Q(course__course_coordinators=user) | Q(lab__lab_executives=user) | Q(teaching_assistants=user)
+
+
+def legacy_session_can_read_by(user):
+    return Q(group__course__course_coordinators=user) | Q(group__lab__lab_executives=user) | Q(group__teaching_assistants=user)
+
+
+def legacy_record_can_read_by(user):
+    return Q(user=user) | Q(session__group__teaching_assistants=user) | Q(session__group__course__course_coordinators=user) | Q(session__group__lab__lab_executives=user)
+
+
+PREDICATES = [
+    ('course', Course, legacy_course_can_read_by, views.course_can_read_by),
+    ('group', Group, legacy_group_can_read_by, views.group_can_read_by),
+    ('session', BaseSession, legacy_session_can_read_by, views.session_can_read_by),
+    ('record', CheckInRecord, legacy_record_can_read_by, views.record_can_read_by),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare the legacy OR-of-joins permission predicates with the group access table on a seeded throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--labs', type=int, default=10)
+        parser.add_argument('--courses', type=int, default=40)
+        parser.add_argument('--groups', type=int, default=200)
+        parser.add_argument('--students', type=int, default=30,
+                            help='students per group')
+        parser.add_argument('--weeks', type=int, default=13)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--json', action='store_true',
+                            help='print the results as JSON')
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.seed(options)
+            results = self.run(options['repeat'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+        for r in results:
+            self.stdout.write(
+                f"{r['role']:>12} {r['object']:>8}: legacy {r['legacy_ms']:8.2f}ms "
+                f"({r['legacy_rows']} rows), access table {r['access_ms']:8.2f}ms "
+                f"({r['access_rows']} rows), same result: {r['same']}")
+
+    @transaction.atomic
+    def seed(self, options):
+        rnd = random.Random(0)
+        group_count, student_count = options['groups'], options['students']
+
+        User.objects.bulk_create(
+            [User(username=f'student{i}') for i in range(group_count * student_count)] +
+            [User(username=f'staff{i}') for i in range(group_count * 2)])
+        students = list(User.objects.filter(
+            username__startswith='student').order_by('id'))
+        staff = list(User.objects.filter(
+            username__startswith='staff').order_by('id'))
+
+        labs = [Lab.objects.create(lab_name=f'lab{i}', room_count=4)
+                for i in range(options['labs'])]
+        courses = [Course.objects.create(course_code=f'C{i}', title=f'course {i}')
+                   for i in range(options['courses'])]
+        for lab in labs:
+            lab.lab_executives.set(rnd.sample(staff, 2))
+        for course in courses:
+            course.course_coordinators.set(rnd.sample(staff, 2))
+
+        monday = date(2022, 8, 8)
+        weeks = [Week.objects.create(monday_date=monday + timedelta(weeks=i))
+                 for i in range(options['weeks'])]
+
+        now = timezone.now()
+        records = []
+        for g in range(group_count):
+            group = Group.objects.create(
+                course=courses[g % len(courses)], group_name=f'G{g}', lab=labs[g % len(labs)],
+                lab_room=1 + g % 4, day_of_week=1 + g % 5,
+                start_time=dtime(8 + g % 8), end_time=dtime(10 + g % 8))
+            members = students[g * student_count:(g + 1) * student_count]
+            group.students.set(members)
+            group.teaching_assistants.set(staff[2 * g:2 * g + 2])
+            for week in weeks:
+                session = RegularSession.objects.create(
+                    group=group, week=week, check_in_ddl_mins=15)
+                records += [CheckInRecord(session=session, user=u, user_type=CheckInRecord.STUDENT,
+                                          check_in_state=rnd.randrange(3), last_modify_time=now)
+                            for u in members]
+        CheckInRecord.objects.bulk_create(records, batch_size=2000)
+        refresh_group_access()
+
+        self.sample_users = {
+            'student': students[len(students) // 2],
+            'ta': staff[len(staff) // 2],
+            'coordinator': courses[0].course_coordinators.first(),
+            'executive': labs[0].lab_executives.first(),
+        }
+
+    def time_ids(self, model, cond, repeat: int):
+        best, ids = None, None
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            ids = list(model.objects.filter(cond).values_list('id', flat=True))
+            elapsed = time.perf_counter() - begin
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000, ids
+
+    def run(self, repeat: int) -> list:
+        results = []
+        for role, user in self.sample_users.items():
+            for name, model, legacy, current in PREDICATES:
+                legacy_ms, legacy_ids = self.time_ids(
+                    model, legacy(user), repeat)
+                access_ms, access_ids = self.time_ids(
+                    model, current(user), repeat)
+                results.append({
+                    'role': role,
+                    'object': name,
+                    'legacy_ms': legacy_ms,
+                    'legacy_rows': len(legacy_ids),
+                    'access_ms': access_ms,
+                    'access_rows': len(access_ids),
+                    'same': set(legacy_ids) == set(access_ids),
+                })
+        return results
@@ -0,0 +1,112 @@
+import json
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.http import JsonResponse
+from django.utils import timezone
+from be_api.bench import throwaway_database, percentile
+from be_api.encoding import columnar, model_fields
+from be_api.models import Group, BaseSession, CheckInRecord
+from be_api.rowjson import row_encoder
+from be_api.seed import seed_campus
+
+DEFAULT_FIELDS = {
+    'record': ['id', 'user_id', 'check_in_state', 'last_modify_time'],
+    'group': ['id', 'group_name', 'day_of_week'],
+    'session': ['id', 'group_id', 'effective_date'],
+}
+
+
+def payloads(limit: int) -> dict:
+    return {
+        'record': CheckInRecord.objects.order_by('last_modify_time', 'id')[:limit],
+        'group': Group.objects.order_by('id')[:limit],
+        'session': BaseSession.objects.order_by('id')[:limit],
+    }
+
+
+def encoders(fields: list) -> list:
+    """
+    (name, encode) pairs; encode(queryset) selects the rows and returns
+    the response body bytes.
+    """
+    def objects(qs):
+        return JsonResponse({'ok': True, 'data': list(qs.values())}).content
+
+    def objects_fields(qs):
+        return JsonResponse({'ok': True, 'data': list(qs.values(*fields))}).content
+
+    def columnar_all(qs):
+        return JsonResponse({'ok': True, 'data': columnar(list(qs.values()))}).content
+
+    def columnar_fields(qs):
+        return JsonResponse({'ok': True, 'data': columnar(list(qs.values(*fields)), fields)}).content
+
+    def compiled(columns, as_columnar):
+        def encode(qs):
+            rows = qs.values_list(*(columns or model_fields(qs.model)))
+            data = row_encoder(qs.model, columns or model_fields(qs.model)).encode(rows, as_columnar)
+            return ('{"ok": true, "data": ' + data + '}').encode()
+        return encode
+
+    return [
+        ('objects', objects),
+        ('objects+fields', objects_fields),
+        ('columnar', columnar_all),
+        ('columnar+fields', columnar_fields),
+        ('compiled objects', compiled(None, False)),
+        ('compiled objects+fields', compiled(fields, False)),
+        ('compiled columnar', compiled(None, True)),
+        ('compiled columnar+fields', compiled(fields, True)),
+    ]
+
+
+def run(name: str, encode, queryset, iterations: int) -> tuple:
+    """
+    (result, body) of encoding the queryset `iterations` times.
+    """
+    timings = []
+    body = b''
+    for _ in range(iterations):
+        begin = time.perf_counter()
+        body = encode(queryset.all())
+        timings.append((time.perf_counter() - begin) * 1000)
+    timings.sort()
+    return {
+        'encoder': name,
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'bytes': len(body),
+    }, body
+
+
+class Command(BaseCommand):
+    help = 'Compare the JSON, sparse fieldset and columnar encodings of list payloads on a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--rows', type=int, default=5000,
+                            help='rows per payload')
+        parser.add_argument('--courses', type=int, default=10)
+        parser.add_argument('--students-per-group', type=int, default=30)
+        parser.add_argument('--weeks', type=int, default=13)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            today = timezone.localdate()
+            seed_campus(first_monday=today - timedelta(days=today.weekday(), weeks=options['weeks'] - 2),
+                        courses=options['courses'], students_per_group=options['students_per_group'],
+                        weeks=options['weeks'])
+
+            results = []
+            for payload, queryset in payloads(options['rows']).items():
+                self.stderr.write(f'{payload}...')
+                bodies = {}
+                for name, encode in encoders(DEFAULT_FIELDS[payload]):
+                    result, bodies[name] = run(name, encode, queryset, options['iterations'])
+                    if name.startswith('compiled '):
+                        # the compiled encoders must write the same bytes as JsonResponse
+                        result['identical'] = bodies[name] == bodies[name[len('compiled '):]]
+                    results.append({'payload': payload, 'rows': queryset.count(), **result})
+
+        self.stdout.write(json.dumps({'iterations': options['iterations'], 'results': results}, indent=2))
@@ -0,0 +1,162 @@
+import json
+from datetime import time, timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from django.utils import timezone
+from be_api import urls
+from be_api.bench import throwaway_database, ViewBenchmark
+from be_api.models import Group, BaseSession, SpecialSession, CheckInRecord
+from be_api.seed import seed_campus
+
+FAR_FUTURE = '2100-01-01T00:00:00+00:00'
+
+
+def view_specs(ctx: dict) -> list:
+    """
+    One spec per route of be_api.urls, see ViewBenchmark. `ctx` holds the
+    ids and usernames returned by seed_campus.
+    """
+    admin, executive, student = ctx['admin'], ctx['lab_executive'], ctx['student']
+    lab_room = Group.objects.get(id=ctx['group_id']).lab_room
+    return [
+        {'route': 'ping', 'user': student},
+        {'route': 'login', 'user': None, 'method': 'post',
+         'params': lambda i: {'username': student, 'password': 'password'}},
+        {'route': 'logout', 'user': student, 'fresh_login': True},
+        {'route': 'user_info', 'user': student},
+        {'route': 'get_user', 'user': admin,
+            'params': lambda i: {'username': student}},
+        {'route': 'list_user', 'user': admin},
+        {'route': 'add_user', 'user': admin, 'method': 'post',
+         'params': lambda i: {'username': f'bench-user{i}', 'password': 'password'}},
+        {'route': 'update_user', 'user': admin, 'method': 'post',
+         'params': lambda i: {'id': ctx['student_id'], 'first_name': f'Student{i}'}},
+        {'route': 'import_roster', 'user': admin, 'method': 'post',
+         'params': lambda i: {'format': 'csv', 'data': 'username,password,student_groups\n' + ''.join(
+             f'bench-roster{i}-{n},password,{ctx["group_id"]}\n' for n in range(2))}},
+        {'route': 'get_lab', 'user': admin,
+            'params': lambda i: {'id': ctx['lab_id']}},
+        {'route': 'list_lab', 'user': admin},
+        {'route': 'add_lab', 'user': admin, 'method': 'post',
+         'params': lambda i: {'lab_name': f'bench{i}', 'room_count': 2}},
+        {'route': 'update_lab', 'user': admin, 'method': 'post',
+         'params': lambda i: {'id': ctx['lab_id'], 'active': True}},
+        {'route': 'get_course', 'user': admin,
+            'params': lambda i: {'id': ctx['course_id']}},
+        {'route': 'list_course', 'user': admin},
+        {'route': 'add_course', 'user': admin, 'method': 'post',
+         'params': lambda i: {'course_code': f'bench{i}', 'title': 'bench'}},
+        {'route': 'update_course', 'user': admin, 'method': 'post',
+         'params': lambda i: {'id': ctx['course_id'], 'title': f'Course {i}'}},
+        {'route': 'get_group', 'user': admin,
+            'params': lambda i: {'id': ctx['group_id']}},
+        {'route': 'list_group', 'user': executive},
+        {'route': 'add_group', 'user': admin, 'method': 'post',
+         'params': lambda i: {'course_id': ctx['course_id'], 'group_name': f'bench{i}', 'lab_id': ctx['lab_id'],
+                              'lab_room': 1, 'day_of_week': 1, 'start_time': '08:00', 'end_time': '10:00'}},
+        {'route': 'update_group', 'user': admin, 'method': 'post',
+         'params': lambda i: {'id': ctx['group_id'], 'active': True}},
+        {'route': 'get_session', 'user': admin,
+            'params': lambda i: {'id': ctx['session_id']}},
+        {'route': 'list_session', 'user': executive,
+            'params': lambda i: {'lab_id': ctx['lab_id']}},
+        {'route': 'add_regular_session', 'user': admin, 'method': 'post',
+         'params': lambda i: {'group_id': ctx['group_id'], 'week_id': ctx['week_id'], 'check_in_ddl_mins': 15}},
+        {'route': 'generate_regular_sessions', 'user': admin, 'method': 'post',
+         'params': lambda i: {'first_week_id': ctx['week_id'], 'last_week_id': ctx['week_id'], 'dry_run': True}},
+        {'route': 'add_special_session', 'user': admin, 'method': 'post',
+         'params': lambda i: {'group_id': ctx['group_id'], 'check_in_ddl_mins': 15, 'lab_id': ctx['lab_id'],
+                              'lab_room': 1, 'lab_date': str(timezone.localdate()),
+                              'start_time': '20:00', 'end_time': '21:00'}},
+        {'route': 'update_session', 'user': admin, 'method': 'post',
+         'params': lambda i: {'id': ctx['session_id'], 'compulsory': True}},
+        {'route': 'get_record', 'user': admin,
+            'params': lambda i: {'id': ctx['record_id']}},
+        {'route': 'list_record', 'user': executive,
+            'params': lambda i: {'course_id': ctx['course_id']}},
+        {'route': 'export_record', 'user': admin,
+            'params': lambda i: {'course_id': ctx['course_id'], 'format': 'csv'}},
+        {'route': 'update_record', 'user': admin, 'method': 'post',
+         'params': lambda i: {'id': ctx['record_id'], 'last_modify_time': FAR_FUTURE, 'remark': f'bench {i}'}},
+        {'route': 'update_records', 'user': admin, 'method': 'post',
+         'params': lambda i: {'records': [
+             {'id': record_id, 'last_modify_time': FAR_FUTURE, 'check_in_state': i % 3, 'remark': f'bulk {i}'}
+             for record_id in ctx['session_record_ids']]}},
+        {'route': 'attendance_stats', 'user': admin,
+            'params': lambda i: {'course_id': ctx['course_id']}},
+        {'route': 'list_record_filters', 'user': executive},
+        {'route': 'records_of_lab_today', 'user': executive,
+            'params': lambda i: {'lab_id': ctx['lab_id']}},
+        {'route': 'check_in', 'user': student, 'method': 'post', 'expect_status': 200,
+         'params': lambda i: {'lab_id': ctx['lab_id'], 'lab_room': lab_room}},
+        {'route': 'batch', 'user': admin, 'method': 'post',
+         'params': lambda i: {'operations': [
+             {'route': 'update_record', 'params': {
+                 'id': ctx['record_id'], 'last_modify_time': FAR_FUTURE, 'remark': f'batch {i}'}},
+             {'route': 'update_group', 'params': {
+                 'id': ctx['group_id'], 'active': True}},
+             {'route': 'get_record', 'params': {'id': ctx['record_id']}},
+         ]}},
+        {'route': 'metrics', 'user': admin},
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Seed a throwaway database and report latency percentiles, query counts and peak memory of every view as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--courses', type=int, default=10)
+        parser.add_argument('--groups-per-course', type=int, default=4)
+        parser.add_argument('--students-per-group', type=int, default=30)
+        parser.add_argument('--weeks', type=int, default=13)
+        parser.add_argument('--route', action='append',
+                            help='only run these routes (repeatable)')
+        parser.add_argument('--output', help='write the JSON report to this file')
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            today = timezone.localdate()
+            # most of the semester lies in the past so it has records
+            first_monday = today - \
+                timedelta(days=today.weekday(), weeks=options['weeks'] - 2)
+            ctx = seed_campus(first_monday=first_monday, courses=options['courses'],
+                              groups_per_course=options['groups_per_course'],
+                              students_per_group=options['students_per_group'], weeks=options['weeks'])
+            ctx['student_id'] = User.objects.get(username=ctx['student']).id
+            ctx['session_id'] = BaseSession.objects.filter(
+                group_id=ctx['group_id']).order_by('id').values_list('id', flat=True).first()
+            ctx['session_record_ids'] = list(CheckInRecord.objects.filter(
+                session_id=ctx['session_id']).values_list('id', flat=True))
+            # open all of today so the student has a session to check in
+            SpecialSession.objects.create(
+                group_id=ctx['group_id'], check_in_ddl_mins=24 * 60, lab_id=ctx['lab_id'],
+                lab_room=Group.objects.get(id=ctx['group_id']).lab_room, lab_date=today,
+                start_time=time(0), end_time=time(23, 59, 59))
+
+            specs = {spec['route']: spec for spec in view_specs(ctx)}
+            routes = [p.name for p in urls.urlpatterns]
+            if options['route']:
+                routes = [r for r in routes if r in options['route']]
+
+            bench = ViewBenchmark(iterations=options['iterations'])
+            results, uncovered = [], []
+            for route in routes:
+                if route not in specs:
+                    uncovered.append(route)
+                    continue
+                self.stderr.write(f'{route}...')
+                results.append(bench.run(specs[route], reverse(route)))
+
+        report = {
+            'iterations': options['iterations'],
+            'results': results,
+            'uncovered_routes': uncovered,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
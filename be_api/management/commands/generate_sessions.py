@@ -0,0 +1,45 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from be_api.models import Group
+from be_api.semester import generate_regular_sessions, SemesterError
+
+
+class Command(BaseCommand):
+    help = 'Create the missing regular sessions of groups in a range of weeks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('first_week', type=int, help='id of the first week')
+        parser.add_argument('last_week', type=int, help='id of the last week')
+        groups = parser.add_mutually_exclusive_group()
+        groups.add_argument('--group', type=int, action='append', dest='groups',
+                            help='only this group (repeatable)')
+        groups.add_argument('--course', type=int,
+                            help='only the active groups of this course')
+        parser.add_argument('--check-in-ddl-mins', type=int, default=15)
+        parser.add_argument('--no-late-check-in', action='store_true')
+        parser.add_argument('--optional', action='store_true',
+                            help='create sessions that are not compulsory')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='list the sessions that would be created')
+
+    def handle(self, *args, **options):
+        group_ids = options['groups']
+        if options['course'] is not None:
+            group_ids = list(Group.objects.filter(
+                course_id=options['course'], active=True).values_list('id', flat=True))
+
+        try:
+            stats = generate_regular_sessions(
+                group_ids, options['first_week'], options['last_week'],
+                check_in_ddl_mins=options['check_in_ddl_mins'],
+                allow_late_check_in=not options['no_late_check_in'],
+                compulsory=not options['optional'], dry_run=options['dry_run'])
+        except SemesterError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(json.dumps(stats, indent=2))
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"{stats['missing']} sessions would be created"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{stats['created']} sessions created in {stats['seconds']}s"))
@@ -0,0 +1,31 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from be_api.roster import parse_roster, import_roster, RosterError, IMPORT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Create users from a CSV or JSON roster and enrol them in their groups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='roster file, see be_api/roster.py for the columns')
+        parser.add_argument('--format', choices=['csv', 'json'],
+                            help='default from the file extension')
+        parser.add_argument('--workers', type=int,
+                            help='password hashing processes (default ROSTER_HASH_WORKERS or the CPU count)')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('json' if path.endswith('.json') else 'csv')
+        with open(path, newline='') as f:
+            text = f.read()
+
+        try:
+            stats = import_roster(parse_roster(text, fmt), workers=options['workers'],
+                                  batch_size=options['batch_size'])
+        except RosterError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(json.dumps(stats, indent=2))
+        self.stdout.write(self.style.SUCCESS(
+            f'{stats["created"]} users created, {stats["users_per_second"]} users/s'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from datetime import date, timedelta
+from be_api.records import materialize_days, MATERIALIZE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Create the absent check in records of every active session in a date window ahead of time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat,
+                            help='first day of the window (default today)')
+        parser.add_argument('--end', type=date.fromisoformat,
+                            help='last day of the window (default start + --days)')
+        parser.add_argument('--days', type=int, default=7,
+                            help='days after start to cover when --end is not given')
+        parser.add_argument('--batch-size', type=int,
+                            default=MATERIALIZE_BATCH_SIZE)
+        parser.add_argument('--force', action='store_true',
+                            help='process days that are already covered again')
+
+    def handle(self, *args, **options):
+        start = options['start'] or date.today()
+        end = options['end'] or start + timedelta(days=options['days'])
+        if end < start:
+            raise CommandError('end must not be earlier than start')
+        if options['batch_size'] < 1:
+            raise CommandError('batch size must be positive')
+
+        stats = materialize_days(start, end, batch_size=options['batch_size'],
+                                 force=options['force'], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(
+            f"materialized {stats['records']} records over {stats['days']} days "
+            f"({stats['skipped_days']} days already covered)"))
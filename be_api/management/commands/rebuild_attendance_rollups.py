@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from be_api.rollups import rebuild_rollups, ROLLUPS
+
+
+class Command(BaseCommand):
+    help = 'Recompute the attendance rollup counters from the check in records'
+
+    def handle(self, *args, **options):
+        rebuild_rollups()
+        for model, _ in ROLLUPS:
+            self.stdout.write(
+                f'{model.__name__}: {model.objects.count()} rows')
+        self.stdout.write(self.style.SUCCESS('rollups rebuilt'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from be_api.access import refresh_group_access
+from be_api.models import GroupAccess
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized group access table from the TA, coordinator and executive relations'
+
+    def handle(self, *args, **options):
+        refresh_group_access()
+        self.stdout.write(self.style.SUCCESS(
+            f'{GroupAccess.objects.count()} group access rows'))
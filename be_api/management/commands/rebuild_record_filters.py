@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from be_api.models import GroupRecordUser
+from be_api.record_filters import refresh_record_users
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the summary behind list_record_filters from the check in records'
+
+    def handle(self, *args, **options):
+        refresh_record_users()
+        self.stdout.write(self.style.SUCCESS(
+            f'{GroupRecordUser.objects.count()} group record users'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from be_api.schedule import refresh_effective_schedule
+
+
+class Command(BaseCommand):
+    help = 'Recompute the effective lab, room, date and times of every session'
+
+    def handle(self, *args, **options):
+        changed = refresh_effective_schedule()
+        self.stdout.write(self.style.SUCCESS(
+            f'{changed} sessions updated'))
@@ -0,0 +1,33 @@
+import json
+from datetime import date
+from django.core.management.base import BaseCommand
+from be_api.seed import seed_campus, DEFAULTS, SEED_PASSWORD
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a synthetic campus: labs, courses, groups, users, a semester of sessions and records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--labs', type=int)
+        parser.add_argument('--rooms', type=int, help='rooms per lab')
+        parser.add_argument('--courses', type=int)
+        parser.add_argument('--groups-per-course', type=int)
+        parser.add_argument('--students-per-group', type=int)
+        parser.add_argument('--tas-per-group', type=int)
+        parser.add_argument('--weeks', type=int)
+        parser.add_argument('--special-sessions-per-group', type=int)
+        parser.add_argument('--make-ups-per-group', type=int)
+        parser.add_argument('--no-records', dest='records', action='store_false', default=None,
+                            help='do not create check in records')
+        parser.add_argument('--first-monday', type=date.fromisoformat,
+                            help='monday of the first week (default this week)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='random seed, also prefixes the seeded names so several seeds can coexist')
+
+    def handle(self, *args, **options):
+        sizes = {k: options[k] for k in DEFAULTS}
+        seeded = seed_campus(first_monday=options['first_monday'], seed=options['seed'],
+                             log=self.stdout.write, **sizes)
+        self.stdout.write(json.dumps(seeded, indent=2))
+        self.stdout.write(self.style.SUCCESS(
+            f'seeded, every user has the password "{SEED_PASSWORD}"'))
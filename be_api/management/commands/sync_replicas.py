@@ -0,0 +1,31 @@
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = 'Copy the default SQLite database over every SQLite replica, to try out read replicas locally'
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('only SQLite databases can be copied, use the replication of the database instead')
+        if not settings.REPLICA_DATABASES:
+            raise CommandError('no replicas, set REPLICA_DATABASE_URLS')
+
+        source = sqlite3.connect(primary.settings_dict['NAME'])
+        try:
+            for alias in settings.REPLICA_DATABASES:
+                replica = connections[alias]
+                if replica.vendor != 'sqlite':
+                    raise CommandError(f'{alias} is not an SQLite database')
+                replica.close()
+                target = sqlite3.connect(replica.settings_dict['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                self.stdout.write(self.style.SUCCESS(f'copied to {alias}'))
+        finally:
+            source.close()
@@ -0,0 +1,256 @@
+"""
+Process-local request metrics, rendered in the Prometheus text format.
+
+Every worker process keeps its own counters. When METRICS_DIR is set each
+process also dumps a snapshot into that directory (at most once every
+METRICS_FLUSH_INTERVAL seconds), and the metrics endpoint sums the
+snapshots of all processes, so the numbers are right no matter which worker
+answers the scrape. A process writes its last snapshot when it exits; the
+snapshots of processes that are gone are folded into EXITED_SNAPSHOT once
+they are older than METRICS_SNAPSHOT_MAX_AGE seconds, so the sums never go
+down (Prometheus would take that for a counter reset).
+"""
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ROUTE_FIELDS = ('requests', 'latency_sum', 'sql_queries',
+                'sql_seconds', 'response_bytes')
+
+# the counters of every process that exited, and the lock that is held
+# while snapshots are read or folded into it
+EXITED_SNAPSHOT = 'metrics-exited.json'
+LOCK_FILE = 'metrics.lock'
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.started = int(time.time() * 1000)
+        self.routes = {}
+        self.counters = {}
+        self.last_flush = 0.0
+
+    def _check_fork(self):
+        # a forked worker must not report the counters of its parent again
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def _route(self, route: str) -> dict:
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = dict.fromkeys(ROUTE_FIELDS, 0)
+            stats['latency_buckets'] = [0] * len(LATENCY_BUCKETS)
+            self.routes[route] = stats
+        return stats
+
+    def observe_request(self, route: str, seconds: float, sql_queries: int, sql_seconds: float,
+                        response_bytes: int):
+        with self._lock:
+            self._check_fork()
+            stats = self._route(route)
+            stats['requests'] += 1
+            stats['latency_sum'] += seconds
+            stats['sql_queries'] += sql_queries
+            stats['sql_seconds'] += sql_seconds
+            stats['response_bytes'] += response_bytes
+            buckets = stats['latency_buckets']
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+        self.maybe_flush()
+
+    def add_response_bytes(self, route: str, response_bytes: int):
+        with self._lock:
+            self._check_fork()
+            self._route(route)['response_bytes'] += response_bytes
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self._check_fork()
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._check_fork()
+            return json.loads(json.dumps({'routes': self.routes, 'counters': self.counters}))
+
+    def _snapshot_path(self, directory: str) -> str:
+        return os.path.join(directory, f'metrics-{self.pid}-{self.started}.json')
+
+    def maybe_flush(self, force: bool = False):
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_flush < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self.last_flush = now
+
+        _write(self._snapshot_path(directory), self.snapshot())
+
+    def collect(self) -> list:
+        """
+        Snapshots of every process: the files in METRICS_DIR, with this
+        process's own file replaced by its live counters.
+        """
+        directory = settings.METRICS_DIR
+        own = self.snapshot()
+        if not directory:
+            return [own]
+
+        own_path = self._snapshot_path(directory)
+        exited_path = os.path.join(directory, EXITED_SNAPSHOT)
+        snapshots = [own]
+        with open(os.path.join(directory, LOCK_FILE), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+                if path in (own_path, exited_path):
+                    continue
+                if _fold_if_exited(path, exited_path):
+                    continue
+                snapshot = _read(path)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+            exited = _read(exited_path)
+            if exited is not None:
+                snapshots.append(exited)
+        return snapshots
+
+
+def _read(path: str):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path: str, snapshot: dict):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # someone else's process
+        return True
+    return True
+
+
+def _fold_if_exited(path: str, exited_path: str) -> bool:
+    """
+    Add the snapshot at `path` to the one at `exited_path` and delete it,
+    if its process is gone and it is older than METRICS_SNAPSHOT_MAX_AGE.
+    Returns whether it was folded. Called with the lock held.
+    """
+    try:
+        pid = int(os.path.basename(path).split('-')[1])
+        if _process_alive(pid) or time.time() - os.path.getmtime(path) < settings.METRICS_SNAPSHOT_MAX_AGE:
+            return False
+    except (IndexError, ValueError, OSError):
+        return False
+    snapshot = _read(path)
+    if snapshot is None:
+        return False
+    routes, counters = _merge([_read(exited_path) or {}, snapshot])
+    _write(exited_path, {'routes': routes, 'counters': counters})
+    os.remove(path)
+    return True
+
+
+registry = MetricsRegistry()
+
+
+@atexit.register
+def _flush_at_exit():
+    if registry.pid == os.getpid():
+        registry.maybe_flush(force=True)
+
+
+def inc(name: str, value: float = 1):
+    registry.inc(name, value)
+
+
+def _merge(snapshots: list) -> tuple:
+    routes, counters = {}, {}
+    for snapshot in snapshots:
+        for route, stats in snapshot.get('routes', {}).items():
+            total = routes.setdefault(route, dict.fromkeys(ROUTE_FIELDS, 0))
+            total.setdefault('latency_buckets', [0] * len(LATENCY_BUCKETS))
+            for field in ROUTE_FIELDS:
+                total[field] += stats.get(field, 0)
+            for i, n in enumerate(stats.get('latency_buckets', [])):
+                total['latency_buckets'][i] += n
+        for name, value in snapshot.get('counters', {}).items():
+            counters[name] = counters.get(name, 0) + value
+    return routes, counters
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(snapshots: list) -> str:
+    routes, counters = _merge(snapshots)
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    simple = [
+        ('be_api_requests_total', 'requests', 'Requests handled per route.'),
+        ('be_api_sql_queries_total', 'sql_queries',
+         'SQL queries run per route.'),
+        ('be_api_sql_duration_seconds_total', 'sql_seconds',
+         'Time spent in SQL per route.'),
+        ('be_api_response_bytes_total', 'response_bytes',
+         'Response body bytes per route.'),
+    ]
+    for name, field, help_text in simple:
+        family(name, 'counter', help_text)
+        for route, stats in sorted(routes.items()):
+            lines.append(f'{name}{{route="{_escape(route)}"}} {stats[field]}')
+
+    family('be_api_request_duration_seconds',
+           'histogram', 'Request latency per route.')
+    for route, stats in sorted(routes.items()):
+        label = f'route="{_escape(route)}"'
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS, stats['latency_buckets']):
+            cumulative += n
+            lines.append(
+                f'be_api_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(
+            f'be_api_request_duration_seconds_bucket{{{label},le="+Inf"}} {stats["requests"]}')
+        lines.append(
+            f'be_api_request_duration_seconds_sum{{{label}}} {stats["latency_sum"]}')
+        lines.append(
+            f'be_api_request_duration_seconds_count{{{label}}} {stats["requests"]}')
+
+    for name, value in sorted(counters.items()):
+        metric = f'be_api_{name}_total'
+        family(metric, 'counter', f'{name} events.')
+        lines.append(f'{metric} {value}')
+
+    return '\n'.join(lines) + '\n'
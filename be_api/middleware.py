@@ -0,0 +1,78 @@
+import time
+from contextlib import ExitStack
+from django.db import connections
+from .metrics import registry
+from .tokens import bearer_token, read_token, token_user
+
+
+class MetricsMiddleware:
+    """
+    Counts requests, latency, SQL queries and time, and response size per
+    URL name. Put it first in MIDDLEWARE so the whole stack is timed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sql = [0, 0.0]
+
+        def count_sql(execute, sql_text, params, many, context):
+            begin = time.perf_counter()
+            try:
+                return execute(sql_text, params, many, context)
+            finally:
+                sql[0] += 1
+                sql[1] += time.perf_counter() - begin
+
+        begin = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_sql))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - begin
+
+        match = request.resolver_match
+        route = match.url_name if match and match.url_name else 'unmatched'
+
+        if response.streaming:
+            response.streaming_content = self._count_stream(
+                route, response.streaming_content)
+            size = 0
+        else:
+            size = len(response.content)
+
+        registry.observe_request(route, elapsed, sql[0], sql[1], size)
+        return response
+
+    @staticmethod
+    def _count_stream(route, content):
+        size = 0
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            registry.add_response_bytes(route, size)
+
+
+class TokenAuthMiddleware:
+    """
+    Authenticates requests bearing a token from login. Put it after
+    AuthenticationMiddleware: the session user is replaced before it is
+    loaded, so token requests touch neither the session nor the user table.
+    Requests without a valid token keep the session user.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = bearer_token(request.headers.get('Authorization', ''))
+        payload = read_token(token) if token else None
+        if payload:
+            request.user = token_user(payload)
+            request.auth_token = payload
+            # the token is not sent automatically by browsers like a cookie
+            request._dont_enforce_csrf_checks = True
+        return self.get_response(request)
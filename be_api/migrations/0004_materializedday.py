@@ -0,0 +1,27 @@
+# Generated by Django 4.1 on 2026-10-18 06:55
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('be_api', '0003_alter_checkinrecord_remark_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterializedDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('materialized_time', models.DateTimeField()),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='checkinrecord',
+            name='last_modify_time',
+            field=models.DateTimeField(default=datetime.datetime(2000, 1, 1, 0, 0)),
+        ),
+    ]
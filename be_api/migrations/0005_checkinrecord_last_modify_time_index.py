@@ -0,0 +1,17 @@
+# Generated by Django 4.1 on 2026-10-18 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('be_api', '0004_materializedday'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='checkinrecord',
+            index=models.Index(fields=['last_modify_time', 'id'], name='be_api_chec_last_mo_202c14_idx'),
+        ),
+    ]
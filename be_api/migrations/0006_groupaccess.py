@@ -0,0 +1,54 @@
+# Generated by Django 4.1 on 2026-10-18 06:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_group_access(apps, schema_editor):
+    Group = apps.get_model('be_api', 'Group')
+    GroupAccess = apps.get_model('be_api', 'GroupAccess')
+
+    flags = {}
+    for group_id, user_id in Group.teaching_assistants.through.objects.values_list('group_id', 'user_id'):
+        flags.setdefault((user_id, group_id), [False, False, False])[0] = True
+    for group_id, user_id in Group.objects.filter(
+            course__course_coordinators__isnull=False).values_list('id', 'course__course_coordinators'):
+        flags.setdefault((user_id, group_id), [False, False, False])[1] = True
+    for group_id, user_id in Group.objects.filter(
+            lab__lab_executives__isnull=False).values_list('id', 'lab__lab_executives'):
+        flags.setdefault((user_id, group_id), [False, False, False])[2] = True
+
+    GroupAccess.objects.bulk_create([
+        GroupAccess(user_id=user_id, group_id=group_id, as_ta=ta, as_coordinator=coordinator,
+                    as_executive=executive, can_write=coordinator or executive)
+        for (user_id, group_id), (ta, coordinator, executive) in flags.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('be_api', '0005_checkinrecord_last_modify_time_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_ta', models.BooleanField(default=False)),
+                ('as_coordinator', models.BooleanField(default=False)),
+                ('as_executive', models.BooleanField(default=False)),
+                ('can_write', models.BooleanField(default=False)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='be_api.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_access', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='groupaccess',
+            constraint=models.UniqueConstraint(fields=('user', 'group'), name='one_access_per_user_per_group'),
+        ),
+        migrations.RunPython(populate_group_access, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.1 on 2026-10-18 07:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_group_record_users(apps, schema_editor):
+    CheckInRecord = apps.get_model('be_api', 'CheckInRecord')
+    GroupRecordUser = apps.get_model('be_api', 'GroupRecordUser')
+
+    GroupRecordUser.objects.bulk_create([
+        GroupRecordUser(group_id=group_id, user_id=user_id)
+        for group_id, user_id in CheckInRecord.objects.values_list('session__group_id', 'user_id').distinct()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('be_api', '0006_groupaccess'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupRecordUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='record_users', to='be_api.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='record_groups', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='grouprecorduser',
+            constraint=models.UniqueConstraint(fields=('group', 'user'), name='one_record_user_per_group'),
+        ),
+        migrations.RunPython(populate_group_record_users, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 4.1 on 2026-10-18 07:02
+
+from django.conf import settings
+from django.db import migrations, models
+import bisect
+from collections import defaultdict
+from datetime import timedelta
+import django.db.models.deletion
+
+STUDENT = 0
+STATE_FIELDS = {0: 'absent', 1: 'late', 2: 'attended'}
+
+
+def populate_rollups(apps, schema_editor):
+    Week = apps.get_model('be_api', 'Week')
+    CheckInRecord = apps.get_model('be_api', 'CheckInRecord')
+    rollups = {name: apps.get_model('be_api', name) for name in (
+        'SessionAttendance', 'GroupWeekAttendance', 'CourseAttendance', 'StudentCourseAttendance')}
+
+    weeks = sorted(Week.objects.values_list('monday_date', 'id'))
+    mondays = [monday for monday, _ in weeks]
+
+    def week_of(day):
+        i = bisect.bisect_right(mondays, day)
+        if i == 0 or day - weeks[i - 1][0] >= timedelta(days=7):
+            return None
+        return weeks[i - 1][1]
+
+    totals = {name: defaultdict(lambda: defaultdict(int)) for name in rollups}
+    records = CheckInRecord.objects.filter(user_type=STUDENT, check_in_state__in=STATE_FIELDS).values_list(
+        'session_id', 'user_id', 'check_in_state', 'session__group_id', 'session__group__course_id',
+        'session__regularsession__week_id', 'session__specialsession__lab_date')
+    for session_id, user_id, state, group_id, course_id, week_id, lab_date in records.iterator(chunk_size=2000):
+        field = STATE_FIELDS[state]
+        totals['SessionAttendance'][(('session_id', session_id),)][field] += 1
+        totals['CourseAttendance'][(('course_id', course_id),)][field] += 1
+        totals['StudentCourseAttendance'][(('user_id', user_id), ('course_id', course_id))][field] += 1
+        if week_id is None and lab_date is not None:
+            week_id = week_of(lab_date)
+        if week_id is not None:
+            totals['GroupWeekAttendance'][(('group_id', group_id), ('week_id', week_id))][field] += 1
+
+    for name, model in rollups.items():
+        model.objects.bulk_create([model(**dict(key), **counts) for key, counts in totals[name].items()],
+                                  batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('be_api', '0007_grouprecorduser'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentCourseAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('absent', models.IntegerField(default=0)),
+                ('late', models.IntegerField(default=0)),
+                ('attended', models.IntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_attendance', to='be_api.course')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_attendance', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SessionAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('absent', models.IntegerField(default=0)),
+                ('late', models.IntegerField(default=0)),
+                ('attended', models.IntegerField(default=0)),
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='attendance', to='be_api.basesession')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupWeekAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('absent', models.IntegerField(default=0)),
+                ('late', models.IntegerField(default=0)),
+                ('attended', models.IntegerField(default=0)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_attendance', to='be_api.group')),
+                ('week', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_attendance', to='be_api.week')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CourseAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('absent', models.IntegerField(default=0)),
+                ('late', models.IntegerField(default=0)),
+                ('attended', models.IntegerField(default=0)),
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='attendance', to='be_api.course')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='studentcourseattendance',
+            constraint=models.UniqueConstraint(fields=('user', 'course'), name='one_attendance_per_student_per_course'),
+        ),
+        migrations.AddConstraint(
+            model_name='groupweekattendance',
+            constraint=models.UniqueConstraint(fields=('group', 'week'), name='one_attendance_per_group_per_week'),
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
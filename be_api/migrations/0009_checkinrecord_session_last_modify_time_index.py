@@ -0,0 +1,17 @@
+# Generated by Django 4.1 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('be_api', '0008_attendance_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='checkinrecord',
+            index=models.Index(fields=['session', 'last_modify_time'], name='be_api_chec_session_4471a8_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.1 on 2026-10-18 07:13
+
+import datetime
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_effective_schedule(apps, schema_editor):
+    BaseSession = apps.get_model('be_api', 'BaseSession')
+
+    sessions = []
+    for row in BaseSession.objects.values_list(
+            'id', 'regularsession__week__monday_date', 'group__day_of_week', 'group__lab_id', 'group__lab_room',
+            'group__start_time', 'group__end_time', 'specialsession__lab_id', 'specialsession__lab_room',
+            'specialsession__lab_date', 'specialsession__start_time', 'specialsession__end_time'):
+        (id, monday, day_of_week, group_lab, group_room, group_start, group_end,
+         sp_lab, sp_room, sp_date, sp_start, sp_end) = row
+        if monday is not None:
+            schedule = (group_lab, group_room, monday + datetime.timedelta(days=day_of_week - 1),
+                        group_start, group_end)
+        elif sp_lab is not None:
+            schedule = (sp_lab, sp_room, sp_date, sp_start, sp_end)
+        else:
+            continue
+        lab_id, room, day, start, end = schedule
+        sessions.append(BaseSession(id=id, effective_lab_id=lab_id, effective_room=room,
+                                    effective_date=day, effective_start=start, effective_end=end))
+
+    BaseSession.objects.bulk_update(sessions, [
+        'effective_lab', 'effective_room', 'effective_date', 'effective_start', 'effective_end'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('be_api', '0010_tableversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basesession',
+            name='effective_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='basesession',
+            name='effective_end',
+            field=models.TimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='basesession',
+            name='effective_lab',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='effective_sessions', to='be_api.lab'),
+        ),
+        migrations.AddField(
+            model_name='basesession',
+            name='effective_room',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='basesession',
+            name='effective_start',
+            field=models.TimeField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='basesession',
+            index=models.Index(fields=['effective_lab', 'effective_date'], name='be_api_base_effecti_2fe2fd_idx'),
+        ),
+        migrations.RunPython(populate_effective_schedule, migrations.RunPython.noop),
+    ]
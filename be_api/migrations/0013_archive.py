@@ -0,0 +1,65 @@
+# Generated by Django 4.1 on 2026-10-18 07:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('be_api', '0012_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedSession',
+            fields=[
+                ('absent', models.IntegerField(default=0)),
+                ('late', models.IntegerField(default=0)),
+                ('attended', models.IntegerField(default=0)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('check_in_ddl_mins', models.IntegerField()),
+                ('allow_late_check_in', models.BooleanField()),
+                ('compulsory', models.BooleanField()),
+                ('active', models.BooleanField()),
+                ('effective_room', models.IntegerField(null=True)),
+                ('effective_date', models.DateField(null=True)),
+                ('effective_start', models.TimeField(null=True)),
+                ('effective_end', models.TimeField(null=True)),
+                ('lab_room', models.IntegerField(null=True)),
+                ('lab_date', models.DateField(null=True)),
+                ('start_time', models.TimeField(null=True)),
+                ('end_time', models.TimeField(null=True)),
+                ('effective_lab', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='be_api.lab')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_sessions', to='be_api.group')),
+                ('lab', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='be_api.lab')),
+                ('week', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='be_api.week')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedCheckInRecord',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('user_type', models.IntegerField(choices=[(0, 'student'), (1, 'TA')])),
+                ('check_in_state', models.IntegerField(choices=[(0, 'absent'), (1, 'late'), (2, 'attended')])),
+                ('check_in_time', models.DateTimeField(null=True)),
+                ('last_modify_time', models.DateTimeField()),
+                ('remark', models.CharField(blank=True, max_length=256)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='check_in_records', to='be_api.archivedsession')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_attendance_records', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedcheckinrecord',
+            index=models.Index(fields=['last_modify_time', 'id'], name='be_api_arch_last_mo_4acc91_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='archivedcheckinrecord',
+            constraint=models.UniqueConstraint(fields=('session', 'user'), name='one_archived_record_per_user_per_session'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1 on 2026-10-18 08:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('be_api', '0013_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTokenCutoff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('not_before', models.DateTimeField(db_index=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='token_cutoff', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
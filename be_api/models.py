@@ -1,9 +1,26 @@
 from django.db import models
 from django.db.models import F, Q
 from django.contrib.auth.models import User
+from django.utils import timezone
 import datetime
 
 
+def session_date(monday: datetime.date, day_of_week: int) -> datetime.date:
+    return monday + datetime.timedelta(days=day_of_week - 1)
+
+
+def to_milliseconds(value: datetime.datetime) -> datetime.datetime:
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def modify_stamp() -> datetime.datetime:
+    """
+    The current time as a last_modify_time. JSON carries milliseconds, so
+    the stamp a client reads back must compare equal to the stored one.
+    """
+    return to_milliseconds(timezone.now())
+
+
 class Week(models.Model):
     monday_date = models.DateField()
 
@@ -97,11 +114,40 @@ class BaseSession(models.Model):
         through_fields=('original_session', 'student')
     )
     active = models.BooleanField(default=True)
+    # where and when the session is held: taken from the group and week of
+    # a regular session or from a special session itself, so sessions of
+    # both kinds in a lab on a date are found with one index range scan
+    effective_lab = models.ForeignKey(
+        Lab, on_delete=models.PROTECT, null=True, related_name='effective_sessions')
+    effective_room = models.IntegerField(null=True)
+    effective_date = models.DateField(null=True)
+    effective_start = models.TimeField(null=True)
+    effective_end = models.TimeField(null=True)
+
+    EFFECTIVE_FIELDS = ('effective_lab', 'effective_room',
+                        'effective_date', 'effective_start', 'effective_end')
 
     def __str__(self):
         return f'{self.group.course.course_code} {self.group.group_name} {self.id}'
 
+    def effective_schedule(self):
+        # (lab_id, room, date, start, end), None when unknown
+        return None
+
+    def save(self, *args, **kwargs):
+        schedule = self.effective_schedule()
+        if schedule is not None:
+            self.effective_lab_id, self.effective_room, self.effective_date, \
+                self.effective_start, self.effective_end = schedule
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(
+                    kwargs['update_fields']) | set(self.EFFECTIVE_FIELDS)
+        super().save(*args, **kwargs)
+
     class Meta:
+        indexes = [
+            models.Index(fields=['effective_lab', 'effective_date']),
+        ]
         constraints = [
             models.CheckConstraint(check=Q(check_in_ddl_mins__gt=0),
                                    name='positive_deadline_minutes',
@@ -116,6 +162,11 @@ class RegularSession(BaseSession):
     def __str__(self):
         return f'{self.group.course.course_code} {self.group.group_name} week {self.week.id}'
 
+    def effective_schedule(self):
+        group = self.group
+        return (group.lab_id, group.lab_room, session_date(self.week.monday_date, group.day_of_week),
+                group.start_time, group.end_time)
+
 
 class SpecialSession(BaseSession):
     lab = models.ForeignKey(Lab, on_delete=models.PROTECT,
@@ -128,6 +179,9 @@ class SpecialSession(BaseSession):
     def __str__(self):
         return f'{self.group.course.course_code} {self.group.group_name} sp {self.lab_date}'
 
+    def effective_schedule(self):
+        return self.lab_id, self.lab_room, self.lab_date, self.start_time, self.end_time
+
     class Meta:
         indexes = [
             models.Index(fields=['lab', 'lab_date']),
@@ -175,8 +229,170 @@ class CheckInRecord(models.Model):
     remark = models.CharField(max_length=256, blank=True)
 
     class Meta:
+        indexes = [
+            models.Index(fields=['last_modify_time', 'id']),
+            models.Index(fields=['session', 'last_modify_time']),
+        ]
         constraints = [
             models.UniqueConstraint(fields=['session', 'user'],
                                     name='one_record_per_user_per_session',
                                     violation_error_message='each session each person can has only one record'),
         ]
+
+
+class MaterializedDay(models.Model):
+    date = models.DateField(unique=True)
+    materialized_time = models.DateTimeField()
+
+    def __str__(self):
+        return str(self.date)
+
+
+class GroupAccess(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='group_access')
+    group = models.ForeignKey(
+        Group, on_delete=models.CASCADE, related_name='access')
+    as_ta = models.BooleanField(default=False)
+    as_coordinator = models.BooleanField(default=False)
+    as_executive = models.BooleanField(default=False)
+    can_write = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'group'],
+                                    name='one_access_per_user_per_group'),
+        ]
+
+
+class GroupRecordUser(models.Model):
+    group = models.ForeignKey(
+        Group, on_delete=models.CASCADE, related_name='record_users')
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='record_groups')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'user'],
+                                    name='one_record_user_per_group'),
+        ]
+
+
+class AttendanceCounter(models.Model):
+    absent = models.IntegerField(default=0)
+    late = models.IntegerField(default=0)
+    attended = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class SessionAttendance(AttendanceCounter):
+    session = models.OneToOneField(
+        BaseSession, on_delete=models.CASCADE, related_name='attendance')
+
+
+class GroupWeekAttendance(AttendanceCounter):
+    group = models.ForeignKey(
+        Group, on_delete=models.CASCADE, related_name='weekly_attendance')
+    week = models.ForeignKey(
+        Week, on_delete=models.CASCADE, related_name='group_attendance')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['group', 'week'],
+                                    name='one_attendance_per_group_per_week'),
+        ]
+
+
+class CourseAttendance(AttendanceCounter):
+    course = models.OneToOneField(
+        Course, on_delete=models.CASCADE, related_name='attendance')
+
+
+class StudentCourseAttendance(AttendanceCounter):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='course_attendance')
+    course = models.ForeignKey(
+        Course, on_delete=models.CASCADE, related_name='student_attendance')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'course'],
+                                    name='one_attendance_per_student_per_course'),
+        ]
+
+
+class TableVersion(models.Model):
+    table = models.CharField(max_length=32, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.table} v{self.version}'
+
+
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=32, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+
+class UserTokenCutoff(models.Model):
+    # the tokens of the user issued before not_before are refused
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='token_cutoff')
+    not_before = models.DateTimeField(db_index=True)
+
+
+class ArchivedSession(AttendanceCounter):
+    """
+    A session of a closed semester moved out of BaseSession, see
+    be_api/archive.py. Keeps its id, the fields of its subtype (week for a
+    regular session, lab to end_time for a special one) and the counters of
+    its SessionAttendance.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    group = models.ForeignKey(
+        Group, on_delete=models.PROTECT, related_name='archived_sessions')
+    check_in_ddl_mins = models.IntegerField()
+    allow_late_check_in = models.BooleanField()
+    compulsory = models.BooleanField()
+    active = models.BooleanField()
+    effective_lab = models.ForeignKey(
+        Lab, on_delete=models.PROTECT, null=True, related_name='+')
+    effective_room = models.IntegerField(null=True)
+    effective_date = models.DateField(null=True)
+    effective_start = models.TimeField(null=True)
+    effective_end = models.TimeField(null=True)
+    week = models.ForeignKey(
+        Week, on_delete=models.PROTECT, null=True, related_name='+')
+    lab = models.ForeignKey(
+        Lab, on_delete=models.PROTECT, null=True, related_name='+')
+    lab_room = models.IntegerField(null=True)
+    lab_date = models.DateField(null=True)
+    start_time = models.TimeField(null=True)
+    end_time = models.TimeField(null=True)
+
+
+class ArchivedCheckInRecord(models.Model):
+    """
+    A CheckInRecord of an ArchivedSession, with the same id and columns.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    session = models.ForeignKey(
+        ArchivedSession, on_delete=models.PROTECT, related_name='check_in_records')
+    user = models.ForeignKey(
+        User, on_delete=models.PROTECT, related_name='archived_attendance_records')
+    user_type = models.IntegerField(choices=CheckInRecord.USER_TYPE_CHOICES)
+    check_in_state = models.IntegerField(
+        choices=CheckInRecord.CHECK_IN_STATE_CHOICES)
+    check_in_time = models.DateTimeField(null=True)
+    last_modify_time = models.DateTimeField()
+    remark = models.CharField(max_length=256, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_modify_time', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'user'],
+                                    name='one_archived_record_per_user_per_session'),
+        ]
@@ -0,0 +1,120 @@
+import heapq
+from django.core import signing
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+_CURSOR_SALT = 'be_api.pagination'
+
+
+class BadPageRequest(ValueError):
+    pass
+
+
+def encode_cursor(values: list) -> str:
+    return signing.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values],
+                         salt=_CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token: str, model, order_fields) -> list:
+    try:
+        values = signing.loads(token, salt=_CURSOR_SALT)
+    except signing.BadSignature:
+        raise BadPageRequest('invalid cursor')
+    if not isinstance(values, list) or len(values) != len(order_fields):
+        raise BadPageRequest('invalid cursor')
+    try:
+        return [model._meta.get_field(f).to_python(v) for f, v in zip(order_fields, values)]
+    except Exception:
+        raise BadPageRequest('invalid cursor')
+
+
+def page_params(params, model, order_fields) -> tuple:
+    """
+    Read `limit` and `cursor` from the query string, returns (after, limit)
+    where `after` is the decoded key of the last row of the previous page.
+    """
+    try:
+        limit = int(params.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise BadPageRequest('invalid limit')
+    if limit < 1:
+        raise BadPageRequest('invalid limit')
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    after = None
+    if params.get('cursor'):
+        after = decode_cursor(params['cursor'], model, order_fields)
+    return after, limit
+
+
+def after_key(order_fields, after: list) -> Q:
+    # (a, b, c) > (x, y, z)  <=>  a > x or (a = x and (b > y or (b = y and c > z)))
+    cond = Q(**{f'{order_fields[-1]}__gt': after[-1]})
+    for field, value in zip(reversed(order_fields[:-1]), reversed(after[:-1])):
+        cond = Q(**{f'{field}__gt': value}) | (Q(**{field: value}) & cond)
+    return cond
+
+
+def fetch_page(queryset, order_fields, after, limit: int) -> tuple:
+    """
+    One page of a .values() or .values_list() queryset in `order_fields`
+    order, returns (rows, has_more). The queryset must select the order
+    fields.
+    """
+    queryset = queryset.order_by(*order_fields)
+    if after is not None:
+        queryset = queryset.filter(after_key(order_fields, after))
+    rows = list(queryset[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def paginate(queryset, params, order_fields=('id',), columns=None) -> tuple:
+    """
+    Keyset pagination of a .values() queryset, or of a .values_list()
+    queryset whose columns are named by `columns`. Returns (rows,
+    next_cursor); next_cursor is None on the last page.
+    """
+    order_fields = list(order_fields)
+    after, limit = page_params(params, queryset.model, order_fields)
+    rows, has_more = fetch_page(queryset, order_fields, after, limit)
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(_row_key(order_fields, columns)(rows[-1]))
+    return rows, next_cursor
+
+
+def _row_key(order_fields, columns=None):
+    keys = order_fields if columns is None else [list(columns).index(f) for f in order_fields]
+    return lambda row: [row[k] for k in keys]
+
+
+def paginate_merged(querysets: list, params, order_fields=('id',), columns=None) -> tuple:
+    """
+    Keyset pagination over several querysets, as for paginate(), that share
+    one key space, e.g. the subtypes of a model or a table and its archive.
+    Rows are merged in key order.
+    """
+    if not querysets:
+        return [], None
+    order_fields = list(order_fields)
+    after, limit = page_params(params, querysets[0].model, order_fields)
+
+    pages = []
+    has_more = False
+    for queryset in querysets:
+        rows, more = fetch_page(queryset, order_fields, after, limit)
+        pages.append(rows)
+        has_more = has_more or more
+
+    key = _row_key(order_fields, columns)
+    rows = list(heapq.merge(*pages, key=key))
+    has_more = has_more or len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(key(rows[-1]))
+    return rows, next_cursor
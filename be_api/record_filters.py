@@ -0,0 +1,69 @@
+"""
+Summary behind list_record_filters: which users have check in records in
+which groups. Kept up to date as records are written, so the filter options
+visible to a user can be read without touching the record table.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from .access import readable_groups
+from .etags import bump
+from .models import Course, Group, BaseSession, CheckInRecord, GroupRecordUser
+
+
+def add_record_users(pairs):
+    """
+    Register (group_id, user_id) pairs that just got a record.
+    """
+    pairs = set(pairs)
+    if pairs:
+        GroupRecordUser.objects.bulk_create([
+            GroupRecordUser(group_id=group_id, user_id=user_id) for group_id, user_id in pairs
+        ], ignore_conflicts=True, batch_size=1000)
+        bump('record_users')
+
+
+def add_session_record_users(session_user_pairs):
+    session_user_pairs = list(session_user_pairs)
+    groups = dict(BaseSession.objects.filter(
+        id__in={session_id for session_id, _ in session_user_pairs}).values_list('id', 'group_id'))
+    add_record_users((groups[session_id], user_id)
+                     for session_id, user_id in session_user_pairs)
+
+
+def refresh_record_users(group_ids=None):
+    """
+    Recompute the summary of the given groups (all groups when None) from
+    the records.
+    """
+    records = CheckInRecord.objects.all()
+    summary = GroupRecordUser.objects.all()
+    if group_ids is not None:
+        group_ids = list(group_ids)
+        records = records.filter(session__group_id__in=group_ids)
+        summary = summary.filter(group_id__in=group_ids)
+
+    with transaction.atomic():
+        summary.delete()
+        add_record_users(records.values_list(
+            'session__group_id', 'user_id').distinct())
+        bump('record_users')
+
+
+def filter_options(user: User) -> dict:
+    if user.is_superuser:
+        visible = GroupRecordUser.objects.all()
+    else:
+        visible = GroupRecordUser.objects.filter(
+            Q(user=user) | Q(group_id__in=readable_groups(user)))
+
+    users = User.objects.filter(
+        id__in=visible.values('user_id')).values('id', 'username')
+    courses = Course.objects.filter(
+        id__in=Group.objects.filter(id__in=visible.values('group_id')).values('course_id')
+    ).values('id', 'course_code', 'title')
+
+    return {
+        'users': list(users),
+        'courses': list(courses),
+    }
@@ -0,0 +1,184 @@
+from django.db import transaction
+from django.db.models import Exists, OuterRef, F, Q, Value, IntegerField
+from django.utils import timezone
+from datetime import date, timedelta
+from .models import BaseSession, RegularSession, SpecialSession, CheckInRecord, MaterializedDay, modify_stamp
+from .academic_calendar import week_of
+from .etags import bump
+from .lab_cache import invalidate_sessions
+from .live import publish_records
+from .record_filters import add_record_users
+from .rollups import apply_record_changes
+
+MATERIALIZE_BATCH_SIZE = 1000
+
+
+def _missing_records(sessions, relation: str, user_type: int):
+    existing = CheckInRecord.objects.filter(
+        session_id=OuterRef('id'), user_id=OuterRef(f'group__{relation}'))
+
+    return sessions.filter(**{f'group__{relation}__is_active': True}).annotate(
+        member_id=F(f'group__{relation}'),
+        member_type=Value(user_type, output_field=IntegerField()),
+    ).filter(~Exists(existing)).values_list('id', 'group_id', 'member_id', 'member_type')
+
+
+def missing_record_keys(session_ids) -> list:
+    """
+    (session_id, group_id, user_id, user_type) of every active student and TA of the
+    given sessions that has no check in record yet. A user who is both a
+    student and a TA of a group is reported once, as a student.
+    """
+    sessions = BaseSession.objects.filter(id__in=session_ids)
+
+    students = _missing_records(sessions, 'students', CheckInRecord.STUDENT)
+    tas = _missing_records(sessions, 'teaching_assistants', CheckInRecord.TA)
+
+    keys, seen = [], set()
+    for session_id, group_id, user_id, user_type in students.union(tas, all=True).order_by('member_type'):
+        if (session_id, user_id) in seen:
+            continue
+        seen.add((session_id, user_id))
+        keys.append((session_id, group_id, user_id, user_type))
+    return keys
+
+
+def materialize_absent_records(session_ids, batch_size: int = MATERIALIZE_BATCH_SIZE) -> int:
+    """
+    Create an absent record for every member of the given sessions that does
+    not have one yet. Safe to call repeatedly and concurrently: calls for
+    the same sessions take turns, rows created by other writers in between
+    are skipped by the unique constraint, and only the rows this call
+    inserted are counted in the rollups. Returns the number of rows created.
+    """
+    session_ids = list(session_ids)
+    if not session_ids:
+        return 0
+
+    with transaction.atomic():
+        # a concurrent call waits here until this one commits and then
+        # finds the records already there
+        list(BaseSession.objects.filter(id__in=session_ids).order_by(
+            'id').select_for_update().values_list('id', flat=True))
+        keys = missing_record_keys(session_ids)
+        if not keys:
+            return 0
+
+        now = modify_stamp()
+        stamped = CheckInRecord.objects.filter(session_id__in=session_ids, last_modify_time=now)
+        # rows that carry the same stamp already were not inserted by this call
+        earlier = set(stamped.values_list('session_id', 'user_id'))
+        CheckInRecord.objects.bulk_create([
+            CheckInRecord(session_id=session_id, user_id=user_id, user_type=user_type,
+                          check_in_state=CheckInRecord.ABSENT, last_modify_time=now)
+            for session_id, _, user_id, user_type in keys
+        ], batch_size=batch_size, ignore_conflicts=True)
+        # ignore_conflicts does not tell which rows went in: a key whose row
+        # carries another stamp was created by someone else
+        wanted = {(session_id, user_id): (group_id, user_type) for session_id, group_id, user_id, user_type in keys}
+        ids, inserted = [], []
+        for id, session_id, user_id in stamped.values_list('id', 'session_id', 'user_id'):
+            if (session_id, user_id) in wanted and (session_id, user_id) not in earlier:
+                ids.append(id)
+                inserted.append((session_id, user_id, *wanted[(session_id, user_id)]))
+        if not inserted:
+            return 0
+
+        bump('record')
+        invalidate_sessions(session_ids)
+        add_record_users((group_id, user_id) for _, user_id, group_id, _ in inserted)
+        apply_record_changes(added=[(session_id, user_id, user_type, CheckInRecord.ABSENT)
+                                    for session_id, user_id, _, user_type in inserted])
+        publish_records(CheckInRecord.objects.filter(pk__in=ids))
+
+    return len(inserted)
+
+
+def sessions_of_day(day: date, lab_id: int = None):
+    """
+    The (regular, special) active sessions that are shown for a lab on a day:
+    the regular sessions of the week containing the day and the special
+    sessions held on the day. All labs when lab_id is None.
+    """
+    week = week_of(day)
+    if week:
+        re_sessions = RegularSession.objects.filter(active=True, effective_date__range=(
+            week.monday_date, week.sunday_date))
+    else:
+        re_sessions = RegularSession.objects.none()
+    sp_sessions = SpecialSession.objects.filter(
+        active=True, effective_date=day)
+
+    if lab_id is not None:
+        re_sessions = re_sessions.filter(effective_lab_id=lab_id)
+        sp_sessions = sp_sessions.filter(effective_lab_id=lab_id)
+
+    return re_sessions, sp_sessions
+
+
+def day_is_materialized(day: date) -> bool:
+    return MaterializedDay.objects.filter(date=day).exists()
+
+
+def invalidate_materialized_days(since: date = None):
+    """
+    Forget the coverage of every day from `since` (default today) on, so the
+    read path materializes again until the next scheduled run.
+    """
+    if since is None:
+        since = date.today()
+    MaterializedDay.objects.filter(date__gte=since).delete()
+
+
+def materialize_day(day: date, batch_size: int = MATERIALIZE_BATCH_SIZE) -> int:
+    re_sessions, sp_sessions = sessions_of_day(day)
+    session_ids = BaseSession.objects.filter(
+        Q(id__in=re_sessions.values('id')) | Q(id__in=sp_sessions.values('id'))
+    ).order_by('id').values_list('id', flat=True)
+
+    # keyset over session ids so each batch is a bounded query
+    created, last_id = 0, 0
+    while True:
+        batch = list(session_ids.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        created += materialize_absent_records(batch, batch_size=batch_size)
+        last_id = batch[-1]
+
+    MaterializedDay.objects.update_or_create(
+        date=day, defaults={'materialized_time': timezone.now()})
+    return created
+
+
+def materialize_days(start: date, end: date, batch_size: int = MATERIALIZE_BATCH_SIZE,
+                     force: bool = False, log=None) -> dict:
+    """
+    Materialize the records of every session from `start` to `end`
+    (inclusive) across all labs. Days already covered are skipped unless
+    `force` is set, so an interrupted run resumes where it stopped.
+    """
+    covered = set(MaterializedDay.objects.filter(
+        date__gte=start, date__lte=end).values_list('date', flat=True))
+
+    stats = {'days': 0, 'skipped_days': 0, 'records': 0}
+    day = start
+    while day <= end:
+        if day in covered and not force:
+            stats['skipped_days'] += 1
+        else:
+            created = materialize_day(day, batch_size=batch_size)
+            stats['days'] += 1
+            stats['records'] += created
+            if log:
+                log(f'{day}: {created} records')
+        day += timedelta(days=1)
+    return stats
+
+
+def run_scheduled_materialization(days_ahead: int = 7, batch_size: int = MATERIALIZE_BATCH_SIZE) -> dict:
+    """
+    Entry point for cron/celery style schedulers: cover today and the next
+    `days_ahead` days.
+    """
+    today = date.today()
+    return materialize_days(today, today + timedelta(days=days_ahead), batch_size=batch_size)
@@ -0,0 +1,95 @@
+"""
+Reads of selected views from read replicas.
+
+Replicas are the databases in settings.REPLICA_DATABASES, copies of
+`default` kept up to date by the database's own replication. Views wrapped
+with read_from_replica() run their queries against a randomly picked
+replica; everything else, and every write, uses `default`.
+
+Replication lags, so a client that just wrote something must not read
+from a replica before the write reached it. After any successful write
+request the client gets a cookie that pins its reads to `default` for
+REPLICA_STICKY_SECONDS, which should be comfortably above the replication
+lag. Requests inside a transaction on `default`, e.g. the operations of a
+batch, read from `default` as well.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpRequest
+from . import metrics
+
+STICKY_COOKIE = 'read_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of the current context to the replica picked by
+    read_from_replica(), if any. Writes and migrations go to `default`.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as default
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def _pinned_to_primary(request: HttpRequest) -> bool:
+    return request.method not in SAFE_METHODS or STICKY_COOKIE in request.COOKIES or \
+        connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+@contextmanager
+def reading_from(alias: str):
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def read_from_replica(view):
+    """
+    Run the queries of `view` on a random replica unless the request is
+    pinned to the primary.
+    """
+    @wraps(view)
+    def f(request: HttpRequest, *args, **kwargs):
+        if not settings.REPLICA_DATABASES or _pinned_to_primary(request):
+            metrics.inc('primary_reads')
+            return view(request, *args, **kwargs)
+        metrics.inc('replica_reads')
+        with reading_from(random.choice(settings.REPLICA_DATABASES)):
+            return view(request, *args, **kwargs)
+    return f
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Pins the reads of a client to the primary for REPLICA_STICKY_SECONDS
+    after each successful write request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if settings.REPLICA_DATABASES and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
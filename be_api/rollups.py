@@ -0,0 +1,170 @@
+"""
+Attendance rollups: absent/late/attended counts of student records per
+session, per group and week, per course and per student and course.
+
+Counters are moved incrementally by every write path of CheckInRecord:
+record rows that disappear from a bucket are passed as `removed`, rows that
+appear as `added`, each as (session_id, user_id, user_type, check_in_state).
+rebuild_rollups() recomputes everything from the records to fix any drift;
+archived records still count towards all but the per session counters.
+"""
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F, Q
+from .academic_calendar import weeks_of_dates
+from .etags import bump
+from .models import (BaseSession, CheckInRecord, SessionAttendance, GroupWeekAttendance,
+                     CourseAttendance, StudentCourseAttendance, ArchivedCheckInRecord)
+
+STATE_FIELDS = {
+    CheckInRecord.ABSENT: 'absent',
+    CheckInRecord.LATE: 'late',
+    CheckInRecord.ATTENDED: 'attended',
+}
+
+# (model, key fields)
+ROLLUPS = [
+    (SessionAttendance, ('session_id',)),
+    (GroupWeekAttendance, ('group_id', 'week_id')),
+    (CourseAttendance, ('course_id',)),
+    (StudentCourseAttendance, ('user_id', 'course_id')),
+]
+
+UPDATE_BATCH_SIZE = 200
+
+
+def _session_scopes(session_ids) -> dict:
+    rows = BaseSession.objects.filter(id__in=session_ids).values_list(
+        'id', 'group_id', 'group__course_id', 'regularsession__week_id', 'specialsession__lab_date')
+    rows = list(rows)
+    weeks = weeks_of_dates(lab_date for *_, lab_date in rows)
+    return {
+        session_id: (group_id, course_id, week_id or weeks.get(lab_date))
+        for session_id, group_id, course_id, week_id, lab_date in rows
+    }
+
+
+def _deltas(removed, added) -> dict:
+    changes = [(row, -1) for row in removed] + [(row, 1) for row in added]
+    changes = [(row, sign) for row, sign in changes
+               if row[2] == CheckInRecord.STUDENT and row[3] in STATE_FIELDS]
+    if not changes:
+        return {}
+
+    scopes = _session_scopes({row[0] for row, _ in changes})
+    deltas = {model: defaultdict(lambda: defaultdict(int)) for model, _ in ROLLUPS}
+    for (session_id, user_id, _, state), sign in changes:
+        if session_id not in scopes:
+            continue
+        group_id, course_id, week_id = scopes[session_id]
+        field = STATE_FIELDS[state]
+        deltas[SessionAttendance][(session_id,)][field] += sign
+        if week_id:
+            deltas[GroupWeekAttendance][(group_id, week_id)][field] += sign
+        deltas[CourseAttendance][(course_id,)][field] += sign
+        deltas[StudentCourseAttendance][(user_id, course_id)][field] += sign
+    return deltas
+
+
+def _apply(model, key_fields, deltas: dict):
+    model.objects.bulk_create([
+        model(**dict(zip(key_fields, key))) for key in deltas
+    ], ignore_conflicts=True, batch_size=1000)
+
+    # keys that move by the same amounts share one UPDATE
+    by_change = defaultdict(list)
+    for key, fields in deltas.items():
+        change = tuple(sorted((f, n) for f, n in fields.items() if n))
+        if change:
+            by_change[change].append(key)
+
+    for change, keys in by_change.items():
+        increments = {f: F(f) + n for f, n in change}
+        for i in range(0, len(keys), UPDATE_BATCH_SIZE):
+            cond = Q()
+            for key in keys[i:i+UPDATE_BATCH_SIZE]:
+                cond |= Q(**dict(zip(key_fields, key)))
+            model.objects.filter(cond).update(**increments)
+
+
+def apply_record_changes(removed=(), added=()):
+    deltas = _deltas(list(removed), list(added))
+    if not deltas:
+        return
+    with transaction.atomic():
+        for model, key_fields in ROLLUPS:
+            if deltas[model]:
+                _apply(model, key_fields, deltas[model])
+        bump('attendance')
+
+
+def record_rows(record_ids) -> list:
+    return list(CheckInRecord.objects.filter(id__in=record_ids).values_list(
+        'session_id', 'user_id', 'user_type', 'check_in_state'))
+
+
+def _counts(records, *group_by):
+    return records.values(*group_by).annotate(
+        absent=Count('id', filter=Q(check_in_state=CheckInRecord.ABSENT)),
+        late=Count('id', filter=Q(check_in_state=CheckInRecord.LATE)),
+        attended=Count('id', filter=Q(check_in_state=CheckInRecord.ATTENDED)),
+    ).order_by()
+
+
+# (records, week lookup, lab date lookup) of the hot and the archived records
+RECORD_SOURCES = [
+    (CheckInRecord, 'session__regularsession__week_id', 'session__specialsession__lab_date'),
+    (ArchivedCheckInRecord, 'session__week_id', 'session__lab_date'),
+]
+
+
+def _add_counts(totals: dict, rows, key):
+    for row in rows:
+        counts = totals[key(row)]
+        for i, f in enumerate(('absent', 'late', 'attended')):
+            counts[i] += row[f]
+
+
+def rebuild_rollups():
+    records = CheckInRecord.objects.filter(user_type=CheckInRecord.STUDENT)
+    counts = ('absent', 'late', 'attended')
+
+    group_weeks = defaultdict(lambda: [0, 0, 0])
+    courses = defaultdict(lambda: [0, 0, 0])
+    student_courses = defaultdict(lambda: [0, 0, 0])
+    for model, week_lookup, date_lookup in RECORD_SOURCES:
+        source = model.objects.filter(user_type=CheckInRecord.STUDENT)
+        _add_counts(group_weeks, _counts(source.filter(**{f'{week_lookup}__isnull': False}),
+                                         'session__group_id', week_lookup),
+                    lambda row: (row['session__group_id'], row[week_lookup]))
+        special = list(_counts(source.filter(**{f'{date_lookup}__isnull': False}),
+                               'session__group_id', date_lookup))
+        weeks = weeks_of_dates(row[date_lookup] for row in special)
+        _add_counts(group_weeks, [row for row in special if weeks.get(row[date_lookup])],
+                    lambda row: (row['session__group_id'], weeks[row[date_lookup]]))
+        _add_counts(courses, _counts(source, 'session__group__course_id'),
+                    lambda row: row['session__group__course_id'])
+        _add_counts(student_courses, _counts(source, 'user_id', 'session__group__course_id'),
+                    lambda row: (row['user_id'], row['session__group__course_id']))
+
+    with transaction.atomic():
+        for model, _ in ROLLUPS:
+            model.objects.all().delete()
+
+        SessionAttendance.objects.bulk_create([
+            SessionAttendance(session_id=row['session_id'], **{f: row[f] for f in counts})
+            for row in _counts(records, 'session_id')
+        ], batch_size=1000)
+        GroupWeekAttendance.objects.bulk_create([
+            GroupWeekAttendance(group_id=group_id, week_id=week_id, **dict(zip(counts, totals)))
+            for (group_id, week_id), totals in group_weeks.items()
+        ], batch_size=1000)
+        CourseAttendance.objects.bulk_create([
+            CourseAttendance(course_id=course_id, **dict(zip(counts, totals)))
+            for course_id, totals in courses.items()
+        ], batch_size=1000)
+        StudentCourseAttendance.objects.bulk_create([
+            StudentCourseAttendance(user_id=user_id, course_id=course_id, **dict(zip(counts, totals)))
+            for (user_id, course_id), totals in student_courses.items()
+        ], batch_size=1000)
+        bump('attendance')
@@ -0,0 +1,183 @@
+"""
+Bulk import of users and their group enrolments.
+
+A roster is a list of users, each with username, password, first_name,
+last_name, email, is_ta and the ids of the groups they are a student
+(`student_groups`) or a TA (`ta_groups`) of. In CSV the group ids are
+separated by ';'. Users that exist already keep their account and only get
+the enrolments. Passwords are hashed by a process pool when imported by
+the import_roster command, inline when imported through the API, and all
+rows are written with bulk inserts, so the signals that keep the derived
+tables in sync are replaced by explicit refreshes at the end.
+"""
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from .access import refresh_group_access
+from .etags import bump
+from .lab_cache import invalidate_groups
+from .models import Profile, Group
+from .records import invalidate_materialized_days
+
+IMPORT_BATCH_SIZE = 1000
+# below this many passwords starting the pool costs more than it saves
+POOL_THRESHOLD = 32
+
+USER_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+
+class RosterError(ValueError):
+    pass
+
+
+def _group_ids(value) -> list:
+    if value is None or value == '':
+        return []
+    if isinstance(value, str):
+        value = [v for v in value.split(';') if v.strip()]
+    return [int(v) for v in value]
+
+
+def _flag(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+def normalize_rows(rows) -> list:
+    users = []
+    for n, row in enumerate(rows, 1):
+        try:
+            username = str(row['username']).strip()
+            if not username:
+                raise ValueError('empty username')
+            users.append({
+                'username': username,
+                'password': row.get('password') or None,
+                'first_name': row.get('first_name') or '',
+                'last_name': row.get('last_name') or '',
+                'email': row.get('email') or '',
+                'is_ta': _flag(row.get('is_ta', False)),
+                'student_groups': _group_ids(row.get('student_groups')),
+                'ta_groups': _group_ids(row.get('ta_groups')),
+            })
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            raise RosterError(f'row {n}: {e}')
+    return users
+
+
+def parse_roster(text: str, fmt: str) -> list:
+    if fmt == 'csv':
+        return normalize_rows(csv.DictReader(io.StringIO(text)))
+    if fmt == 'json':
+        try:
+            rows = json.loads(text)
+        except ValueError as e:
+            raise RosterError(str(e))
+        if not isinstance(rows, list):
+            raise RosterError('expected a list of users')
+        return normalize_rows(rows)
+    raise RosterError(f'unknown format {fmt}')
+
+
+def _hash_chunk(passwords: list) -> list:
+    return [make_password(p) for p in passwords]
+
+
+def hash_passwords(passwords: list, workers: int = None) -> list:
+    """
+    make_password() of every password, spread over `workers` processes.
+    """
+    workers = workers or settings.ROSTER_HASH_WORKERS or os.cpu_count() or 1
+    if workers <= 1 or len(passwords) < POOL_THRESHOLD:
+        return _hash_chunk(passwords)
+
+    size = max(1, len(passwords) // (workers * 4))
+    chunks = [passwords[i:i+size] for i in range(0, len(passwords), size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        return [h for hashed in pool.map(_hash_chunk, chunks) for h in hashed]
+
+
+def _user_ids(usernames) -> dict:
+    usernames = list(usernames)
+    ids = {}
+    for i in range(0, len(usernames), IMPORT_BATCH_SIZE):
+        ids.update(User.objects.filter(
+            username__in=usernames[i:i+IMPORT_BATCH_SIZE]).values_list('username', 'id'))
+    return ids
+
+
+def import_roster(users: list, workers: int = None, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    Create the users of a normalized roster that do not exist yet and add
+    every user to their groups. Returns counts and the throughput.
+    """
+    started = time.perf_counter()
+
+    by_username = {}
+    for user in users:
+        if user['username'] in by_username:
+            raise RosterError(f'duplicate username {user["username"]}')
+        by_username[user['username']] = user
+
+    group_ids = {g for user in users for g in user['student_groups'] + user['ta_groups']}
+    missing = group_ids - set(Group.objects.filter(id__in=group_ids).values_list('id', flat=True))
+    if missing:
+        raise RosterError(f'unknown groups {sorted(missing)}')
+
+    existing = _user_ids(by_username)
+    new_users = [user for user in users if user['username'] not in existing]
+
+    with_password = [user for user in new_users if user['password']]
+    hashed = dict(zip((user['username'] for user in with_password),
+                      hash_passwords([user['password'] for user in with_password], workers)))
+    hashed_at = time.perf_counter()
+
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(password=hashed.get(user['username']) or make_password(None),
+                 **{f: user[f] for f in USER_FIELDS})
+            for user in new_users
+        ], batch_size=batch_size)
+        ids = {**existing, **_user_ids(user['username'] for user in new_users)}
+
+        Profile.objects.bulk_create([
+            Profile(user_id=ids[user['username']], is_ta=user['is_ta']) for user in new_users
+        ], batch_size=batch_size, ignore_conflicts=True)
+
+        students = Group.students.through
+        students.objects.bulk_create([
+            students(group_id=group_id, user_id=ids[user['username']])
+            for user in users for group_id in user['student_groups']
+        ], batch_size=batch_size, ignore_conflicts=True)
+        tas = Group.teaching_assistants.through
+        tas.objects.bulk_create([
+            tas(group_id=group_id, user_id=ids[user['username']])
+            for user in users for group_id in user['ta_groups']
+        ], batch_size=batch_size, ignore_conflicts=True)
+
+        # the bulk inserts above bypass the signals that keep these in sync
+        refresh_group_access({g for user in users for g in user['ta_groups']})
+        if group_ids:
+            invalidate_materialized_days()
+            invalidate_groups(group_ids)
+        bump('user', 'group_members')
+
+    elapsed = time.perf_counter() - started
+    return {
+        'users': len(users),
+        'created': len(new_users),
+        'existing': len(existing),
+        'enrolments': sum(len(user['student_groups']) + len(user['ta_groups']) for user in users),
+        'hash_seconds': round(hashed_at - started, 3),
+        'seconds': round(elapsed, 3),
+        'users_per_second': round(len(users) / elapsed, 1) if elapsed else None,
+    }
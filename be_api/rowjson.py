@@ -0,0 +1,179 @@
+"""
+JSON encoding of values_list() rows by encoders compiled per column list.
+
+JsonResponse runs every value of every row through DjangoJSONEncoder, which
+turns each date, time and datetime into a string with a Python level
+default() call, after the rows were first built into dicts. A RowEncoder
+looks up the type of each column once, picks a converter for it and encodes
+the tuples of a values_list() queryset straight into text with one format
+string per row. The output is byte for byte what JsonResponse writes for
+the same rows as dicts.
+"""
+import json
+from functools import lru_cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+
+STREAM_BATCH_SIZE = 500
+# compiled encoders kept, one per model and column list
+ENCODER_CACHE_SIZE = 256
+
+_default = DjangoJSONEncoder()
+_string = json.encoder.encode_basestring_ascii
+
+
+def _datetime(value) -> str:
+    r = value.isoformat()
+    if value.microsecond:
+        r = r[:23] + r[26:]
+    if r.endswith('+00:00'):
+        r = r[:-6] + 'Z'
+    return '"' + r + '"'
+
+
+def _date(value) -> str:
+    return '"' + value.isoformat() + '"'
+
+
+def _time(value) -> str:
+    if value.utcoffset() is not None:
+        # DjangoJSONEncoder refuses aware times, let it raise the same error
+        return _default.encode(value)
+    r = value.isoformat()
+    if value.microsecond:
+        r = r[:12]
+    return '"' + r + '"'
+
+
+def _bool(value) -> str:
+    return 'true' if value else 'false'
+
+
+def _nullable(convert):
+    def convert_nullable(value):
+        return 'null' if value is None else convert(value)
+    return convert_nullable
+
+
+def _converter(field):
+    if field is None:
+        return _default.encode
+    null = field.null
+    if isinstance(field, models.ForeignKey):
+        field = field.target_field
+    # DateTimeField subclasses DateField, so it goes first
+    if isinstance(field, models.DateTimeField):
+        convert = _datetime
+    elif isinstance(field, models.DateField):
+        convert = _date
+    elif isinstance(field, models.TimeField):
+        convert = _time
+    elif isinstance(field, models.BooleanField):
+        convert = _bool
+    elif isinstance(field, (models.AutoField, models.IntegerField)):
+        convert = int.__repr__
+    elif isinstance(field, (models.CharField, models.TextField)):
+        convert = _string
+    else:
+        return _default.encode
+    return _nullable(convert) if null else convert
+
+
+def _field(model, lookup: str):
+    """
+    The model field a values_list() lookup ends at, None when it cannot be
+    resolved (e.g. an annotation); such columns use the generic encoder.
+    """
+    try:
+        field = None
+        for part in lookup.split('__'):
+            if field is not None:
+                model = field.related_model
+            field = model._meta.get_field(part)
+    except (FieldDoesNotExist, AttributeError):
+        return None
+    if field.is_relation and not field.concrete:
+        return None
+    return field
+
+
+class RowEncoder:
+    """
+    Encodes rows of `lookups` of `model`, as objects keyed by `names`
+    (the lookups themselves by default) or as arrays.
+    """
+
+    def __init__(self, model, lookups, names=None):
+        self.lookups = list(lookups)
+        self.names = list(names or lookups)
+        self._converters = []
+        for lookup in self.lookups:
+            convert = _converter(_field(model, lookup))
+            # a value from across a relation is null when the join is empty
+            self._converters.append(_nullable(convert) if '__' in lookup else convert)
+
+        self._object = '{' + ', '.join(_string(name).replace('%', '%%') + ': %s'
+                                       for name in self.names) + '}'
+        self._array = '[' + ', '.join(['%s'] * len(self.lookups)) + ']'
+        self._columns = json.dumps(self.names)
+
+    def _values(self, row) -> tuple:
+        return tuple([convert(value) for convert, value in zip(self._converters, row)])
+
+    def encode_object(self, row) -> str:
+        return self._object % self._values(row)
+
+    def encode_array(self, row) -> str:
+        return self._array % self._values(row)
+
+    def encode_objects(self, rows) -> str:
+        """
+        The rows as a list of objects, the same text JsonResponse writes.
+        """
+        template, values = self._object, self._values
+        return '[' + ', '.join([template % values(row) for row in rows]) + ']'
+
+    def encode_columnar(self, rows) -> str:
+        """
+        The rows as {"columns": [...], "rows": [[...], ...]}, see
+        encoding.columnar().
+        """
+        template, values = self._array, self._values
+        return '{"columns": ' + self._columns + ', "rows": [' + \
+            ', '.join([template % values(row) for row in rows]) + ']}'
+
+    def encode(self, rows, as_columnar: bool = False) -> str:
+        return self.encode_columnar(rows) if as_columnar else self.encode_objects(rows)
+
+    def stream_objects(self, rows, batch_size: int = STREAM_BATCH_SIZE):
+        """
+        Chunks of the text of encode_objects() for an iterator of rows,
+        `batch_size` rows at a time.
+        """
+        template, values = self._object, self._values
+        batch = []
+        prefix = '['
+        for row in rows:
+            batch.append(template % values(row))
+            if len(batch) >= batch_size:
+                yield prefix + ', '.join(batch)
+                batch = []
+                prefix = ', '
+        if batch:
+            yield prefix + ', '.join(batch) + ']'
+        else:
+            yield '[]' if prefix == '[' else ']'
+
+
+@lru_cache(maxsize=ENCODER_CACHE_SIZE)
+def _compiled(model, lookups: tuple, names: tuple) -> RowEncoder:
+    return RowEncoder(model, lookups, names)
+
+
+def row_encoder(model, lookups, names=None) -> RowEncoder:
+    """
+    The encoder of rows of `lookups` of `model`, compiled once per model
+    and column list.
+    """
+    return _compiled(model, tuple(lookups), tuple(names or lookups))
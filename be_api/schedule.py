@@ -0,0 +1,57 @@
+"""
+Upkeep of the effective schedule columns of BaseSession.
+
+Sessions fill them in on save(). Writes that bypass save(), queryset
+updates of sessions and changes to the group or week a regular session
+takes its schedule from, are followed by refresh_effective_schedule().
+"""
+from .etags import bump
+from .models import BaseSession, session_date
+
+REFRESH_BATCH_SIZE = 500
+
+
+def _desired_schedule(row: tuple):
+    (monday, day_of_week, group_lab, group_room, group_start, group_end,
+     sp_lab, sp_room, sp_date, sp_start, sp_end) = row
+    if monday is not None:
+        return group_lab, group_room, session_date(monday, day_of_week), group_start, group_end
+    if sp_lab is not None:
+        return sp_lab, sp_room, sp_date, sp_start, sp_end
+    return None
+
+
+def refresh_effective_schedule(session_ids=None, group_ids=None, week_ids=None) -> int:
+    """
+    Recompute the effective schedule of the given sessions, the sessions of
+    the given groups or the regular sessions of the given weeks (all
+    sessions when none is given). Returns the number of rows changed.
+    """
+    sessions = BaseSession.objects.all()
+    if session_ids is not None:
+        sessions = sessions.filter(id__in=list(session_ids))
+    if group_ids is not None:
+        sessions = sessions.filter(group_id__in=list(group_ids))
+    if week_ids is not None:
+        sessions = sessions.filter(regularsession__week_id__in=list(week_ids))
+
+    rows = sessions.values_list(
+        'id', 'effective_lab_id', 'effective_room', 'effective_date', 'effective_start', 'effective_end',
+        'regularsession__week__monday_date', 'group__day_of_week', 'group__lab_id', 'group__lab_room',
+        'group__start_time', 'group__end_time', 'specialsession__lab_id', 'specialsession__lab_room',
+        'specialsession__lab_date', 'specialsession__start_time', 'specialsession__end_time')
+
+    changed = []
+    for row in rows.iterator(chunk_size=2000):
+        desired = _desired_schedule(row[6:])
+        if desired is None or desired == row[1:6]:
+            continue
+        lab_id, room, day, start, end = desired
+        changed.append(BaseSession(id=row[0], effective_lab_id=lab_id, effective_room=room,
+                                   effective_date=day, effective_start=start, effective_end=end))
+
+    BaseSession.objects.bulk_update(
+        changed, BaseSession.EFFECTIVE_FIELDS, batch_size=REFRESH_BATCH_SIZE)
+    if changed:
+        bump('session')
+    return len(changed)
@@ -0,0 +1,200 @@
+"""
+Synthetic campus data for development and benchmarks.
+"""
+import random
+from datetime import date, datetime, time, timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from .access import refresh_group_access
+from .etags import bump, TABLES
+from .lab_cache import invalidate_all
+from .models import (Profile, Week, Lab, Course, Group, RegularSession, SpecialSession, MakeUpSession,
+                     CheckInRecord, modify_stamp, session_date)
+from .record_filters import refresh_record_users
+from .rollups import rebuild_rollups
+
+SEED_PASSWORD = 'password'
+
+DEFAULTS = {
+    'labs': 4,
+    'rooms': 4,
+    'courses': 10,
+    'groups_per_course': 4,
+    'students_per_group': 30,
+    'tas_per_group': 2,
+    'weeks': 13,
+    'special_sessions_per_group': 1,
+    'make_ups_per_group': 2,
+    'records': True,
+}
+
+
+@transaction.atomic
+def seed_campus(first_monday: date = None, seed: int = 0, log=None, **options) -> dict:
+    """
+    Create labs, courses, groups with students and TAs, a semester of
+    weeks starting at `first_monday`, regular and special sessions, make
+    ups and, for sessions before today, check in records. Every seeded user
+    has the password SEED_PASSWORD. Returns the ids of a few seeded objects
+    of each kind.
+    """
+    opts = {**DEFAULTS, **{k: v for k, v in options.items() if v is not None}}
+    rnd = random.Random(seed)
+    today = timezone.localdate()
+    if first_monday is None:
+        first_monday = today - timedelta(days=today.weekday())
+    now = modify_stamp()
+    password = make_password(SEED_PASSWORD)
+    prefix = f'seed{seed}-'
+
+    def say(msg):
+        if log:
+            log(msg)
+
+    group_count = opts['courses'] * opts['groups_per_course']
+    student_count = group_count * opts['students_per_group']
+    ta_count = group_count * opts['tas_per_group']
+    staff_count = opts['labs'] + opts['courses']
+
+    User.objects.bulk_create(
+        [User(username=f'{prefix}student{i}', password=password, first_name='Student', last_name=str(i))
+         for i in range(student_count)] +
+        [User(username=f'{prefix}ta{i}', password=password, first_name='TA', last_name=str(i))
+         for i in range(ta_count)] +
+        [User(username=f'{prefix}staff{i}', password=password, first_name='Staff', last_name=str(i),
+              is_staff=True) for i in range(staff_count)] +
+        [User(username=f'{prefix}admin', password=password, is_staff=True, is_superuser=True)],
+        batch_size=1000)
+    users = User.objects.filter(username__startswith=prefix)
+    students = list(users.filter(
+        username__startswith=f'{prefix}student').order_by('id'))
+    tas = list(users.filter(username__startswith=f'{prefix}ta').order_by('id'))
+    staff = list(users.filter(
+        username__startswith=f'{prefix}staff').order_by('id'))
+    Profile.objects.bulk_create(
+        [Profile(user=u, is_ta=False) for u in students] +
+        [Profile(user=u, is_ta=True) for u in tas] +
+        [Profile(user=u, is_ta=False) for u in staff], batch_size=1000)
+    say(f'{student_count} students, {ta_count} TAs, {staff_count} staff')
+
+    Lab.objects.bulk_create([Lab(lab_name=f'{prefix[:-1][:11]}L{i}', room_count=opts['rooms'])
+                             for i in range(opts['labs'])])
+    labs = list(Lab.objects.filter(
+        lab_name__startswith=prefix[:-1][:11]).order_by('id'))
+    for i, lab in enumerate(labs):
+        lab.lab_executives.add(staff[i])
+
+    Course.objects.bulk_create([Course(course_code=f'{prefix}C{i}', title=f'Course {i}')
+                                for i in range(opts['courses'])])
+    courses = list(Course.objects.filter(
+        course_code__startswith=prefix).order_by('id'))
+    for i, course in enumerate(courses):
+        course.course_coordinators.add(staff[opts['labs'] + i])
+
+    groups = []
+    for c, course in enumerate(courses):
+        for g in range(opts['groups_per_course']):
+            n = len(groups)
+            start = 8 + n % 9
+            groups.append(Group(
+                course=course, group_name=f'G{g}', lab=labs[n % len(labs)],
+                lab_room=1 + (n // len(labs)) % opts['rooms'], day_of_week=1 + n % 7,
+                start_time=time(start), end_time=time(start + 2)))
+    Group.objects.bulk_create(groups)
+    groups = list(Group.objects.filter(
+        course__in=courses).order_by('id'))
+
+    spg, tpg = opts['students_per_group'], opts['tas_per_group']
+    Group.students.through.objects.bulk_create([
+        Group.students.through(group_id=group.id, user_id=u.id)
+        for n, group in enumerate(groups) for u in students[n * spg:(n + 1) * spg]
+    ], batch_size=2000)
+    Group.teaching_assistants.through.objects.bulk_create([
+        Group.teaching_assistants.through(group_id=group.id, user_id=u.id)
+        for n, group in enumerate(groups) for u in tas[n * tpg:(n + 1) * tpg]
+    ], batch_size=2000)
+    say(f'{len(labs)} labs, {len(courses)} courses, {len(groups)} groups')
+
+    weeks = []
+    for i in range(opts['weeks']):
+        weeks.append(Week.objects.get_or_create(
+            monday_date=first_monday + timedelta(weeks=i))[0])
+
+    # (session, date, group index)
+    sessions = []
+    for n, group in enumerate(groups):
+        for week in weeks:
+            session = RegularSession.objects.create(
+                group=group, week=week, check_in_ddl_mins=15)
+            sessions.append(
+                (session, session_date(week.monday_date, group.day_of_week), n))
+        for s in range(opts['special_sessions_per_group']):
+            lab_date = first_monday + \
+                timedelta(days=rnd.randrange(7 * max(opts['weeks'], 1)))
+            session = SpecialSession.objects.create(
+                group=group, check_in_ddl_mins=15, lab=group.lab, lab_room=group.lab_room,
+                lab_date=lab_date, start_time=time(18), end_time=time(20))
+            sessions.append((session, lab_date, n))
+    say(f'{len(sessions)} sessions')
+
+    make_ups = []
+    for n, group in enumerate(groups):
+        regular = [s for s, _, g in sessions if g == n and isinstance(
+            s, RegularSession)]
+        special = [s for s, _, g in sessions if g == n and isinstance(
+            s, SpecialSession)]
+        if not regular or not special:
+            continue
+        members = students[n * spg:(n + 1) * spg]
+        for student in rnd.sample(members, min(opts['make_ups_per_group'], len(members))):
+            make_ups.append(MakeUpSession(student=student, original_session=rnd.choice(regular),
+                                          make_up_session=rnd.choice(special)))
+    MakeUpSession.objects.bulk_create(make_ups)
+
+    record_count = 0
+    if opts['records']:
+        records = []
+        for session, day, n in sessions:
+            if day >= today:
+                continue
+            start = timezone.make_aware(datetime.combine(day, time(8)))
+            members = [(u, CheckInRecord.STUDENT) for u in students[n * spg:(n + 1) * spg]] + \
+                [(u, CheckInRecord.TA) for u in tas[n * tpg:(n + 1) * tpg]]
+            for user, user_type in members:
+                state = rnd.choices((CheckInRecord.ABSENT, CheckInRecord.LATE, CheckInRecord.ATTENDED),
+                                    weights=(1, 1, 8))[0]
+                check_in_time = None if state == CheckInRecord.ABSENT else \
+                    start + timedelta(minutes=rnd.randrange(30))
+                records.append(CheckInRecord(session_id=session.id, user=user, user_type=user_type,
+                                             check_in_state=state, check_in_time=check_in_time,
+                                             last_modify_time=now))
+            if len(records) >= 5000:
+                CheckInRecord.objects.bulk_create(records)
+                record_count += len(records)
+                records = []
+        CheckInRecord.objects.bulk_create(records)
+        record_count += len(records)
+    say(f'{record_count} check in records')
+
+    # the bulk inserts above bypass the signals that keep these in sync
+    refresh_group_access([g.id for g in groups])
+    refresh_record_users([g.id for g in groups])
+    rebuild_rollups()
+    bump(*TABLES)
+    invalidate_all()
+
+    return {
+        'admin': f'{prefix}admin',
+        'lab_executive': staff[0].username,
+        'course_coordinator': staff[opts['labs']].username,
+        'ta': tas[0].username,
+        'student': students[0].username,
+        'lab_id': labs[0].id,
+        'course_id': courses[0].id,
+        'group_id': groups[0].id,
+        'week_id': weeks[0].id if weeks else None,
+        'session_id': sessions[0][0].id if sessions else None,
+        'record_id': CheckInRecord.objects.filter(session__group=groups[0]).values_list('id', flat=True).first(),
+    }
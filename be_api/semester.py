@@ -0,0 +1,132 @@
+"""
+Bulk set up of the regular sessions of a semester.
+
+generate_regular_sessions() creates the RegularSession of every given
+group in every week of a range that does not have one yet, current or
+archived. The pairs that exist already are found with one query per table
+and skipped. The new sessions are written with one bulk insert of
+BaseSession rows, their effective schedule filled in, and one
+executemany of the RegularSession rows, inside a transaction. The signals
+that keep the derived data in sync do not fire for bulk inserts, so the
+refreshes are run explicitly at the end.
+"""
+import time
+from django.db import connection, transaction
+from .etags import bump
+from .lab_cache import invalidate_groups
+from .models import Week, Group, BaseSession, RegularSession, ArchivedSession, session_date
+from .records import invalidate_materialized_days
+
+GENERATE_BATCH_SIZE = 1000
+# the dry run output lists at most this many sessions
+DRY_RUN_LIST_SIZE = 1000
+
+GROUP_FIELDS = ('id', 'lab_id', 'lab_room', 'day_of_week', 'start_time', 'end_time')
+
+
+class SemesterError(ValueError):
+    pass
+
+
+def _weeks(first_week_id: int, last_week_id: int) -> list:
+    ends = dict(Week.objects.filter(
+        id__in=[first_week_id, last_week_id]).values_list('id', 'monday_date'))
+    if first_week_id not in ends or last_week_id not in ends:
+        raise SemesterError('unknown week')
+    if ends[first_week_id] > ends[last_week_id]:
+        raise SemesterError('the first week is after the last week')
+    return list(Week.objects.filter(monday_date__range=(
+        ends[first_week_id], ends[last_week_id])).order_by('monday_date').values_list('id', 'monday_date'))
+
+
+def _insert_regular_rows(rows: list):
+    table = connection.ops.quote_name(RegularSession._meta.db_table)
+    ptr = connection.ops.quote_name(
+        RegularSession._meta.get_field('basesession_ptr').column)
+    week = connection.ops.quote_name(
+        RegularSession._meta.get_field('week').column)
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), GENERATE_BATCH_SIZE):
+            cursor.executemany(f'INSERT INTO {table} ({ptr}, {week}) VALUES (%s, %s)',
+                               rows[i:i+GENERATE_BATCH_SIZE])
+
+
+def _fill_ids(sessions: list):
+    # for backends that do not return the ids of bulk inserted rows: the
+    # new rows are the ones without a subtype yet, and a group has one
+    # session per date
+    ids = dict(((group_id, day), id) for id, group_id, day in BaseSession.objects.filter(
+        group_id__in={session.group_id for session in sessions},
+        regularsession__isnull=True, specialsession__isnull=True).values_list('id', 'group_id', 'effective_date'))
+    for session in sessions:
+        session.pk = ids[(session.group_id, session.effective_date)]
+
+
+def generate_regular_sessions(group_ids, first_week_id: int, last_week_id: int, check_in_ddl_mins: int = 15,
+                              allow_late_check_in: bool = True, compulsory: bool = True,
+                              dry_run: bool = False) -> dict:
+    """
+    Create the missing regular sessions of the groups (all active groups
+    when `group_ids` is None) in the weeks from `first_week_id` to
+    `last_week_id`. With `dry_run` nothing is written and the sessions that
+    would be created are listed. Returns counts and the time taken.
+    """
+    started = time.perf_counter()
+    if check_in_ddl_mins <= 0:
+        raise SemesterError('check in deadline should be greater than 0 minutes')
+
+    weeks = _weeks(first_week_id, last_week_id)
+    groups = Group.objects.filter(active=True) if group_ids is None else \
+        Group.objects.filter(id__in=list(group_ids))
+    groups = {row[0]: row for row in groups.values_list(*GROUP_FIELDS)}
+    if group_ids is not None and len(groups) != len(set(group_ids)):
+        raise SemesterError(f'unknown groups {sorted(set(group_ids) - set(groups))}')
+
+    with transaction.atomic():
+        week_ids = [week_id for week_id, _ in weeks]
+        # a week whose session was archived is not missing it either
+        existing = set(RegularSession.objects.filter(
+            group_id__in=groups, week_id__in=week_ids).values_list('group_id', 'week_id')) | \
+            set(ArchivedSession.objects.filter(
+                group_id__in=groups, week_id__in=week_ids).values_list('group_id', 'week_id'))
+        missing = [(group_id, week_id, monday)
+                   for group_id in groups for week_id, monday in weeks
+                   if (group_id, week_id) not in existing]
+
+        stats = {
+            'groups': len(groups),
+            'weeks': len(weeks),
+            'existing': len(existing),
+            'created': 0 if dry_run else len(missing),
+        }
+        if dry_run:
+            stats['missing'] = len(missing)
+            stats['sessions'] = [{'group_id': group_id, 'week_id': week_id}
+                                 for group_id, week_id, _ in missing[:DRY_RUN_LIST_SIZE]]
+            stats['seconds'] = round(time.perf_counter() - started, 3)
+            return stats
+
+        sessions = []
+        for group_id, week_id, monday in missing:
+            _, lab_id, lab_room, day_of_week, start_time, end_time = groups[group_id]
+            sessions.append(BaseSession(
+                group_id=group_id, check_in_ddl_mins=check_in_ddl_mins,
+                allow_late_check_in=allow_late_check_in, compulsory=compulsory,
+                effective_lab_id=lab_id, effective_room=lab_room,
+                effective_date=session_date(monday, day_of_week),
+                effective_start=start_time, effective_end=end_time))
+        # bulk_create() does not support multi-table inheritance, the child
+        # rows are written separately
+        BaseSession.objects.bulk_create(sessions, batch_size=GENERATE_BATCH_SIZE)
+        if sessions and sessions[0].pk is None:
+            _fill_ids(sessions)
+        _insert_regular_rows([(session.pk, week_id)
+                              for session, (_, week_id, _) in zip(sessions, missing)])
+
+        if missing:
+            bump('session')
+            invalidate_materialized_days()
+            invalidate_groups({group_id for group_id, _, _ in missing})
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return stats
@@ -0,0 +1,212 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Profile, Week, Lab, Course, Group, BaseSession, RegularSession, SpecialSession, CheckInRecord, ArchivedSession, ArchivedCheckInRecord
+from .live import publish_records
+from .academic_calendar import invalidate_calendar
+from .etags import bump
+from .lab_cache import invalidate_all, invalidate_groups, invalidate_sessions
+from .access import refresh_group_access, refresh_course_access, refresh_lab_access, refresh_user_access
+from .record_filters import add_session_record_users, refresh_record_users
+from .records import invalidate_materialized_days
+from .rollups import apply_record_changes, record_rows
+from .schedule import refresh_effective_schedule
+from .tokens import TOKEN_USER_FIELDS, revoke_user_tokens
+
+
+TABLE_OF_MODEL = {
+    User: 'user',
+    Profile: 'user',
+    Lab: 'lab',
+    Course: 'course',
+    Group: 'group',
+    Week: 'week',
+    BaseSession: 'session',
+    RegularSession: 'session',
+    SpecialSession: 'session',
+    CheckInRecord: 'record',
+    ArchivedSession: 'session',
+    ArchivedCheckInRecord: 'record',
+    Lab.lab_executives.through: 'lab_executives',
+    Course.course_coordinators.through: 'course_coordinators',
+    Group.students.through: 'group_members',
+    Group.teaching_assistants.through: 'group_members',
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def table_changed(sender, update_fields=None, **kwargs):
+    # a login only stamps last_login, which no response shows
+    if sender is User and update_fields and set(update_fields) <= {'last_login'}:
+        return
+    table = TABLE_OF_MODEL.get(sender)
+    if table:
+        bump(table)
+
+
+@receiver(m2m_changed)
+def relation_changed(sender, action, **kwargs):
+    table = TABLE_OF_MODEL.get(sender)
+    if table and action in ('post_add', 'post_remove', 'post_clear'):
+        bump(table)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=RegularSession)
+@receiver(post_save, sender=SpecialSession)
+@receiver(post_delete, sender=RegularSession)
+@receiver(post_delete, sender=SpecialSession)
+def schedule_changed(sender, **kwargs):
+    invalidate_materialized_days()
+
+
+@receiver(m2m_changed, sender=Group.students.through)
+@receiver(m2m_changed, sender=Group.teaching_assistants.through)
+def group_members_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_materialized_days()
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, **kwargs):
+    refresh_group_access([instance.id])
+    refresh_effective_schedule(group_ids=[instance.id])
+
+
+@receiver(post_save, sender=Week)
+def week_saved(sender, instance, **kwargs):
+    refresh_effective_schedule(week_ids=[instance.id])
+
+
+@receiver(post_save, sender=Week)
+@receiver(post_delete, sender=Week)
+def calendar_changed(sender, **kwargs):
+    invalidate_calendar()
+
+
+def _staff_changed(refresh, action, instance, reverse, pk_set):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # changed from the user side, e.g. user.lab_executive_of.add(lab)
+        refresh_user_access([instance.id])
+    else:
+        refresh([instance.id])
+
+
+@receiver(m2m_changed, sender=Group.teaching_assistants.through)
+def group_tas_changed(sender, action, instance, reverse, pk_set, **kwargs):
+    _staff_changed(refresh_group_access, action, instance, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=Course.course_coordinators.through)
+def course_coordinators_changed(sender, action, instance, reverse, pk_set, **kwargs):
+    _staff_changed(refresh_course_access, action, instance, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=Lab.lab_executives.through)
+def lab_executives_changed(sender, action, instance, reverse, pk_set, **kwargs):
+    _staff_changed(refresh_lab_access, action, instance, reverse, pk_set)
+
+
+def _record_row(record: CheckInRecord) -> tuple:
+    return (record.session_id, record.user_id, record.user_type, record.check_in_state)
+
+
+@receiver(pre_save, sender=CheckInRecord)
+def record_saving(sender, instance, **kwargs):
+    instance._rollup_old_rows = record_rows([instance.pk]) if instance.pk else []
+
+
+@receiver(post_save, sender=CheckInRecord)
+def record_saved(sender, instance, created, **kwargs):
+    if created:
+        add_session_record_users([(instance.session_id, instance.user_id)])
+    apply_record_changes(removed=getattr(instance, '_rollup_old_rows', []),
+                         added=[_record_row(instance)])
+    publish_records(CheckInRecord.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=CheckInRecord)
+def record_deleted(sender, instance, **kwargs):
+    refresh_record_users(BaseSession.objects.filter(
+        id=instance.session_id).values_list('group_id', flat=True))
+    apply_record_changes(removed=[_record_row(instance)])
+
+
+# lab day cache: the labs a change is shown in, both before and after it
+
+@receiver(pre_save, sender=RegularSession)
+@receiver(pre_save, sender=SpecialSession)
+@receiver(pre_delete, sender=RegularSession)
+@receiver(pre_delete, sender=SpecialSession)
+@receiver(post_save, sender=RegularSession)
+@receiver(post_save, sender=SpecialSession)
+def session_lab_changed(sender, instance, **kwargs):
+    if instance.pk:
+        invalidate_sessions([instance.pk])
+
+
+@receiver(pre_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+@receiver(post_save, sender=Group)
+def group_lab_changed(sender, instance, **kwargs):
+    if instance.pk:
+        invalidate_groups([instance.pk])
+
+
+@receiver(post_save, sender=Course)
+def course_lab_changed(sender, instance, **kwargs):
+    invalidate_groups(instance.groups.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=CheckInRecord)
+@receiver(post_delete, sender=CheckInRecord)
+def record_lab_changed(sender, instance, **kwargs):
+    invalidate_sessions([instance.session_id])
+
+
+@receiver(m2m_changed, sender=Group.students.through)
+@receiver(m2m_changed, sender=Group.teaching_assistants.through)
+def group_members_lab_changed(sender, action, instance, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_groups([instance.id])
+    elif pk_set:
+        invalidate_groups(pk_set)
+    else:
+        # cleared from the user side, the groups are gone already
+        invalidate_all()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Week)
+@receiver(post_delete, sender=Week)
+def users_or_weeks_changed(sender, update_fields=None, **kwargs):
+    if sender is User and update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_all()
+
+
+# the fields a token carries or depends on, see be_api/tokens.py
+TOKEN_FIELDS = {User: TOKEN_USER_FIELDS, Profile: ('is_ta',)}
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Profile)
+def token_fields_saving(sender, instance, update_fields=None, **kwargs):
+    fields = TOKEN_FIELDS[sender]
+    instance._old_token_fields = None
+    if instance.pk and not (update_fields and not set(update_fields) & set(fields)):
+        instance._old_token_fields = sender.objects.filter(pk=instance.pk).values_list(*fields).first()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Profile)
+def token_fields_saved(sender, instance, **kwargs):
+    old = getattr(instance, '_old_token_fields', None)
+    if old is not None and old != tuple(getattr(instance, f) for f in TOKEN_FIELDS[sender]):
+        revoke_user_tokens([instance.pk if sender is User else instance.user_id])
+
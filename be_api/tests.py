@@ -1,3 +1,620 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import tempfile
+from datetime import time, timedelta
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.db import transaction
+from django.db.models import Q
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from .models import Profile, Week, Lab, Course, Group, BaseSession, RegularSession, SpecialSession, \
+    CheckInRecord, SessionAttendance, ArchivedSession, ArchivedCheckInRecord, TableVersion, \
+    RevokedToken, modify_stamp
+from . import metrics, rowjson, views
+from .archive import archive_sessions
+from .etags import bump
+from .records import materialize_absent_records, missing_record_keys
+from .replicas import STICKY_COOKIE
+from .rollups import ROLLUPS, rebuild_rollups
+from .semester import generate_regular_sessions
+from .tokens import deny_list
+from .views import BATCH_WRITE_ROUTES
 
-# Create your tests here.
+PASSWORD = 'password'
+
+
+class CampusTestCase(TestCase):
+    """
+    A lab with one group of two students and a TA, a regular session in
+    each of two past weeks and a special session open all of today.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            'admin', password=PASSWORD, is_staff=True, is_superuser=True)
+        cls.students = [User.objects.create_user(f'student{i}', password=PASSWORD) for i in range(2)]
+        cls.ta = User.objects.create_user('ta', password=PASSWORD)
+        cls.outsider = User.objects.create_user('outsider', password=PASSWORD)
+        for user in cls.students + [cls.outsider]:
+            Profile.objects.create(user=user, is_ta=False)
+        Profile.objects.create(user=cls.ta, is_ta=True)
+
+        cls.lab = Lab.objects.create(lab_name='L1', room_count=2)
+        cls.course = Course.objects.create(course_code='C1', title='Course 1')
+        cls.group = Group.objects.create(course=cls.course, group_name='G1', lab=cls.lab, lab_room=1,
+                                         day_of_week=1, start_time=time(9), end_time=time(11))
+        cls.group.students.add(*cls.students)
+        cls.group.teaching_assistants.add(cls.ta)
+
+        today = timezone.localdate()
+        monday = today - timedelta(days=today.weekday())
+        cls.weeks = [Week.objects.create(monday_date=monday - timedelta(weeks=n)) for n in (2, 1)]
+        cls.regular = [RegularSession.objects.create(group=cls.group, week=week, check_in_ddl_mins=15)
+                       for week in cls.weeks]
+        cls.special = SpecialSession.objects.create(
+            group=cls.group, check_in_ddl_mins=24 * 60, lab=cls.lab, lab_room=1, lab_date=today,
+            start_time=time(0), end_time=time(23, 59, 59))
+
+    def login(self, user: User):
+        self.client.login(username=user.username, password=PASSWORD)
+
+    def get(self, route: str, **params):
+        return self.client.get(f'/api/{route}', params)
+
+    def post(self, route: str, query: dict):
+        return self.client.post(f'/api/{route}', json.dumps(query), content_type='application/json')
+
+
+@override_settings(CHECK_IN_COALESCE=False)
+class UpdateRecordsTests(CampusTestCase):
+
+    def test_update_of_checked_in_record(self):
+        self.login(self.students[0])
+        resp = self.post('check_in', {'lab_id': self.lab.id, 'lab_room': 1})
+        self.assertTrue(resp.json()['ok'])
+        record_id = resp.json()['data']['record_id']
+
+        self.login(self.admin)
+        records = self.get('list_record', session_id=self.special.id).json()['data']
+        record = next(r for r in records if r['id'] == record_id)
+        self.assertEqual(record['check_in_state'], CheckInRecord.ATTENDED)
+
+        resp = self.post('update_records', {'records': [
+            {'id': record_id, 'last_modify_time': record['last_modify_time'].replace('Z', '+00:00'),
+             'remark': 'checked'},
+        ]}).json()
+        self.assertEqual(resp['data']['results'], [{'id': record_id, 'status': 'ok'}])
+        self.assertEqual(CheckInRecord.objects.get(pk=record_id).remark, 'checked')
+
+    def test_stale_update_conflicts(self):
+        record = CheckInRecord.objects.create(
+            session=self.regular[0], user=self.students[0], user_type=CheckInRecord.STUDENT,
+            check_in_state=CheckInRecord.ABSENT, last_modify_time=timezone.now())
+        self.login(self.admin)
+        resp = self.post('update_records', {'records': [
+            {'id': record.id, 'last_modify_time': '2000-01-01T00:00:00+00:00', 'remark': 'late'},
+        ]}).json()
+        self.assertEqual(resp['data']['results'][0]['status'], 'conflict')
+        self.assertEqual(CheckInRecord.objects.get(pk=record.id).remark, '')
+
+
+class MaterializeTests(CampusTestCase):
+
+    def test_absent_records_of_members(self):
+        session = self.regular[0]
+        self.assertEqual(materialize_absent_records([session.id]), 3)
+        self.assertEqual(set(CheckInRecord.objects.filter(session=session).values_list('user_id', 'user_type')),
+                         {(self.students[0].id, CheckInRecord.STUDENT), (self.students[1].id, CheckInRecord.STUDENT),
+                          (self.ta.id, CheckInRecord.TA)})
+        # the rollups count student records only
+        self.assertEqual(SessionAttendance.objects.get(session=session).absent, 2)
+        self.assertEqual(materialize_absent_records([session.id]), 0)
+
+    def test_rows_inserted_concurrently_are_not_counted(self):
+        session = self.regular[0]
+        keys = missing_record_keys([session.id])
+        # another request creates one of the records after the keys were read
+        CheckInRecord.objects.create(session=session, user=self.students[0], user_type=CheckInRecord.STUDENT,
+                                     check_in_state=CheckInRecord.ATTENDED, check_in_time=timezone.now(),
+                                     last_modify_time=timezone.now())
+        with mock.patch('be_api.records.missing_record_keys', return_value=keys):
+            self.assertEqual(materialize_absent_records([session.id]), 2)
+        counts = SessionAttendance.objects.get(session=session)
+        self.assertEqual((counts.absent, counts.attended), (1, 1))
+
+    def test_calls_with_the_same_stamp_count_once(self):
+        session = self.regular[0]
+        keys = missing_record_keys([session.id])
+        stamp = modify_stamp()
+        # two calls that read the same missing keys in the same millisecond
+        with mock.patch('be_api.records.missing_record_keys', return_value=keys), \
+                mock.patch('be_api.records.modify_stamp', return_value=stamp):
+            self.assertEqual(materialize_absent_records([session.id]), 3)
+            self.assertEqual(materialize_absent_records([session.id]), 0)
+        self.assertEqual(SessionAttendance.objects.get(session=session).absent, 2)
+
+
+class UpdateRecordTests(CampusTestCase):
+
+    def setUp(self):
+        self.record = CheckInRecord.objects.create(
+            session=self.regular[0], user=self.students[0], user_type=CheckInRecord.STUDENT,
+            check_in_state=CheckInRecord.ABSENT, last_modify_time=timezone.now())
+        self.login(self.admin)
+
+    def test_server_stamps_last_modify_time(self):
+        before = timezone.now()
+        resp = self.post('update_record', {
+            'id': self.record.id, 'last_modify_time': '2100-01-01T00:00:00+00:00', 'remark': 'sick'}).json()
+        self.assertTrue(resp['ok'])
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.remark, 'sick')
+        self.assertLess(self.record.last_modify_time, before + timedelta(minutes=1))
+        self.assertEqual(self.record.last_modify_time.microsecond % 1000, 0)
+
+    def test_rollups_follow_the_update(self):
+        self.post('update_record', {'id': self.record.id, 'last_modify_time': '2100-01-01T00:00:00+00:00',
+                                    'check_in_state': CheckInRecord.LATE})
+        counts = SessionAttendance.objects.get(session=self.regular[0])
+        self.assertEqual((counts.absent, counts.late), (0, 1))
+
+    def test_update_that_matches_no_row(self):
+        with mock.patch('django.db.models.query.QuerySet.update', return_value=0):
+            resp = self.post('update_record', {'id': self.record.id, 'last_modify_time': '2100-01-01T00:00:00+00:00',
+                                               'check_in_state': CheckInRecord.LATE})
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(SessionAttendance.objects.get(session=self.regular[0]).absent, 1)
+
+    def test_stale_update_is_rejected(self):
+        resp = self.post('update_record', {
+            'id': self.record.id, 'last_modify_time': '2000-01-01T00:00:00+00:00', 'remark': 'sick'}).json()
+        self.assertFalse(resp['ok'])
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.remark, '')
+
+
+def _failing_view(request):
+    raise RuntimeError('boom')
+
+
+class BatchTests(CampusTestCase):
+
+    def setUp(self):
+        self.record = CheckInRecord.objects.create(
+            session=self.regular[0], user=self.students[0], user_type=CheckInRecord.STUDENT,
+            check_in_state=CheckInRecord.ABSENT, last_modify_time=timezone.now())
+        self.login(self.admin)
+
+    def batch(self, atomic: bool):
+        return self.post('batch', {'atomic': atomic, 'operations': [
+            {'route': 'update_records', 'params': {'records': [
+                {'id': self.record.id, 'last_modify_time': '2100-01-01T00:00:00+00:00', 'remark': 'sick'}]}},
+            {'route': 'update_record', 'params': {}},
+            {'route': 'list_lab'},
+        ]}).json()['data']
+
+    def test_atomic_batch_rolls_back(self):
+        with mock.patch.dict(BATCH_WRITE_ROUTES, {'update_record': _failing_view}), \
+                mock.patch('traceback.print_exc'):
+            data = self.batch(atomic=True)
+        self.assertFalse(data['committed'])
+        self.assertEqual([r['status'] for r in data['results']], [200, 500, None])
+        self.assertEqual(CheckInRecord.objects.get(pk=self.record.id).remark, '')
+
+    def test_failed_operation_leaves_the_others(self):
+        with mock.patch.dict(BATCH_WRITE_ROUTES, {'update_record': _failing_view}), \
+                mock.patch('traceback.print_exc'):
+            data = self.batch(atomic=False)
+        self.assertTrue(data['committed'])
+        self.assertEqual([r['ok'] for r in data['results']], [True, False, True])
+        self.assertEqual(CheckInRecord.objects.get(pk=self.record.id).remark, 'sick')
+
+    def test_atomic_must_be_a_boolean(self):
+        resp = self.post('batch', {'atomic': 'false', 'operations': [{'route': 'list_lab'}]})
+        self.assertEqual(resp.status_code, 400)
+
+
+class ArchiveTests(CampusTestCase):
+
+    def test_archive_and_merged_pages(self):
+        today = timezone.localdate()
+        stats = archive_sessions(today - timedelta(days=today.weekday()))
+        self.assertEqual(stats, {'sessions': 2, 'records': 6})
+        self.assertFalse(BaseSession.objects.filter(id__in=[s.id for s in self.regular]).exists())
+        self.assertEqual(ArchivedSession.objects.get(id=self.regular[0].id).absent, 2)
+        materialize_absent_records([self.special.id])
+
+        self.login(self.admin)
+        self.assertEqual(len(self.get('list_record').json()['data']), 3)
+        ids, cursor = [], None
+        while True:
+            params = {'include_archived': 1, 'limit': 4, **({'cursor': cursor} if cursor else {})}
+            resp = self.get('list_record', **params).json()
+            ids += [r['id'] for r in resp['data']]
+            cursor = resp['next']
+            if not cursor:
+                break
+        self.assertEqual(sorted(ids), sorted(
+            list(CheckInRecord.objects.values_list('id', flat=True)) +
+            list(ArchivedCheckInRecord.objects.values_list('id', flat=True))))
+        self.assertEqual(len(ids), 9)
+
+
+class GenerateSessionsTests(CampusTestCase):
+
+    def test_archived_weeks_are_not_generated_again(self):
+        today = timezone.localdate()
+        archive_sessions(today - timedelta(days=today.weekday()))
+        stats = generate_regular_sessions([self.group.id], self.weeks[0].id, self.weeks[1].id)
+        self.assertEqual((stats['existing'], stats['created']), (2, 0))
+        self.assertFalse(RegularSession.objects.filter(group=self.group).exists())
+
+    def test_generate_missing_sessions(self):
+        self.login(self.admin)
+        week = Week.objects.create(monday_date=self.weeks[1].monday_date + timedelta(weeks=1))
+        query = {'group_ids': [self.group.id], 'first_week_id': self.weeks[0].id, 'last_week_id': week.id}
+        resp = self.post('generate_regular_sessions', {**query, 'dry_run': True}).json()
+        self.assertEqual(resp['data']['sessions'], [{'group_id': self.group.id, 'week_id': week.id}])
+        self.assertFalse(RegularSession.objects.filter(week=week).exists())
+
+        resp = self.post('generate_regular_sessions', query).json()
+        self.assertEqual((resp['data']['existing'], resp['data']['created']), (2, 1))
+        session = RegularSession.objects.get(week=week)
+        self.assertEqual((session.effective_lab_id, session.effective_date, session.effective_start),
+                         (self.lab.id, week.monday_date, time(9)))
+
+    def test_flags_must_be_booleans(self):
+        self.login(self.admin)
+        resp = self.post('generate_regular_sessions', {
+            'first_week_id': self.weeks[0].id, 'last_week_id': self.weeks[1].id, 'dry_run': 'false'})
+        self.assertEqual(resp.status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportRosterTests(CampusTestCase):
+
+    def test_import_through_api_hashes_inline(self):
+        self.login(self.admin)
+        users = [{'username': f'new{i}', 'password': 'secret', 'student_groups': [self.group.id]}
+                 for i in range(40)]
+        with mock.patch('be_api.roster.ProcessPoolExecutor') as pool:
+            resp = self.post('import_roster', {'users': users}).json()
+        self.assertTrue(resp['ok'])
+        pool.assert_not_called()
+        self.assertTrue(User.objects.get(username='new0').check_password('secret'))
+        self.assertEqual(self.group.students.filter(username__startswith='new').count(), 40)
+
+    @override_settings(ROSTER_API_MAX_USERS=10)
+    def test_large_rosters_are_refused(self):
+        self.login(self.admin)
+        users = [{'username': f'new{i}', 'password': 'secret'} for i in range(11)]
+        resp = self.post('import_roster', {'users': users})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('import_roster', resp.json()['error']['msg'])
+        self.assertFalse(User.objects.filter(username__startswith='new').exists())
+
+
+class ETagTests(CampusTestCase):
+
+    def test_unchanged_list_gets_304(self):
+        self.login(self.admin)
+        etag = self.get('list_user')['ETag']
+        resp = self.client.get('/api/list_user', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+    def test_login_keeps_etag(self):
+        self.login(self.admin)
+        etag = self.get('list_user')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Client().login(username=self.students[0].username, password=PASSWORD)
+        self.assertEqual(self.client.get('/api/list_user', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_write_changes_etag(self):
+        self.login(self.admin)
+        etag = self.get('list_user')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('another', password=PASSWORD)
+        self.assertEqual(self.client.get('/api/list_user', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_removed_coordinator_loses_course_stats(self):
+        # no groups, so group access does not change with the coordinators
+        course = Course.objects.create(course_code='C2', title='Course 2')
+        with self.captureOnCommitCallbacks(execute=True):
+            course.course_coordinators.add(self.outsider)
+        self.login(self.outsider)
+        etag = self.get('attendance_stats', course_id=course.id)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            course.course_coordinators.remove(self.outsider)
+        resp = self.client.get('/api/attendance_stats', {'course_id': course.id},
+                               HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_bumps_of_a_transaction_are_coalesced(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                bump('user')
+                bump('record', 'user')
+        self.assertEqual(len(callbacks), 1)
+        before = dict(TableVersion.objects.values_list('table', 'version'))
+        callbacks[0]()
+        after = dict(TableVersion.objects.values_list('table', 'version'))
+        self.assertEqual(after['user'], before.get('user', 0) + 1)
+        self.assertEqual(after['record'], before.get('record', 0) + 1)
+
+
+class LabTodayTests(CampusTestCase):
+
+    def test_records_keep_their_ids(self):
+        self.login(self.admin)
+        data = self.get('records_of_lab_today', lab_id=self.lab.id, fields='check_in_state').json()['data']
+        self.assertEqual(len(data['records']), 3)
+        self.assertTrue(all(set(r) == {'id', 'check_in_state'} for r in data['records']))
+
+    def test_delta_after_watermark(self):
+        self.login(self.admin)
+        watermark = self.get('records_of_lab_today', lab_id=self.lab.id).json()['data']['watermark']
+        # older than the watermark's slack
+        CheckInRecord.objects.update(last_modify_time=timezone.now() - timedelta(hours=1))
+        record = CheckInRecord.objects.get(session=self.special, user=self.students[1])
+        self.post('update_records', {'records': [
+            {'id': record.id, 'last_modify_time': '2100-01-01T00:00:00+00:00', 'remark': 'sick'}]})
+
+        data = self.get('records_of_lab_today', lab_id=self.lab.id, since=watermark).json()['data']
+        self.assertFalse(data['full'])
+        self.assertEqual([r['id'] for r in data['records']], [record.id])
+        self.assertEqual([u['id'] for u in data['users']], [self.students[1].id])
+        self.assertNotIn('sessions', data)
+
+
+class MetricsTests(TestCase):
+
+    def write_snapshot(self, directory: str, pid: int, age: float) -> str:
+        path = os.path.join(directory, f'metrics-{pid}-1.json')
+        with open(path, 'w') as f:
+            json.dump({'routes': {}, 'counters': {'replica_reads': 1}}, f)
+        then = os.path.getmtime(path) - age
+        os.utime(path, (then, then))
+        return path
+
+    def test_snapshots_of_exited_processes_are_folded(self):
+        children = [subprocess.Popen(['true']) for _ in range(2)]
+        for child in children:
+            child.wait()
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            gone = [self.write_snapshot(directory, child.pid, age=3600) for child in children]
+            recent = self.write_snapshot(directory, children[0].pid + 1000000, age=0)
+            alive = self.write_snapshot(directory, os.getppid(), age=3600)
+            registry = metrics.MetricsRegistry()
+
+            def total():
+                return metrics._merge(registry.collect())[1]['replica_reads']
+
+            self.assertEqual(total(), 4)
+            self.assertFalse(any(os.path.exists(path) for path in gone))
+            self.assertTrue(os.path.exists(recent))
+            self.assertTrue(os.path.exists(alive))
+            with open(os.path.join(directory, metrics.EXITED_SNAPSHOT)) as f:
+                self.assertEqual(json.load(f)['counters'], {'replica_reads': 2})
+            self.assertEqual(total(), 4)
+
+
+class ExportTests(CampusTestCase):
+
+    def test_csv_header_is_the_first_chunk(self):
+        materialize_absent_records([self.regular[0].id])
+        self.login(self.admin)
+        resp = self.get('export_record', format='csv', session_id=self.regular[0].id)
+        chunks = [chunk.decode() for chunk in resp.streaming_content]
+        self.assertEqual(chunks[0].count('\n'), 1)
+        self.assertTrue(chunks[0].startswith('id,'))
+        self.assertEqual(''.join(chunks[1:]).count('\n'), 3)
+
+
+class TokenTests(CampusTestCase):
+
+    def setUp(self):
+        # the deny-list cached by an earlier test is rolled back in the database
+        deny_list.invalidate()
+
+    def token(self) -> str:
+        return self.post('login', {'username': self.ta.username, 'password': PASSWORD,
+                                   'token': True}).json()['data']['token']
+
+    def test_token_authenticates(self):
+        token = self.token()
+        client = Client()
+        resp = client.get('/api/user_info', HTTP_AUTHORIZATION=f'Bearer {token}').json()
+        self.assertEqual(resp['data']['username'], self.ta.username)
+        self.assertEqual(client.get('/api/user_info', HTTP_AUTHORIZATION='Bearer x').status_code, 401)
+
+    def test_revoked_token_is_refused(self):
+        token = self.token()
+        issued = signing.b62_decode(token.rsplit(':', 2)[1])
+        client = Client()
+        self.assertTrue(client.post('/api/logout', HTTP_AUTHORIZATION=f'Bearer {token}').json()['ok'])
+        self.assertEqual(client.get('/api/user_info', HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 401)
+        revoked = RevokedToken.objects.get()
+        self.assertEqual(revoked.expires_at.timestamp(), issued + settings.AUTH_TOKEN_MAX_AGE)
+
+    def test_role_change_revokes_earlier_tokens(self):
+        token = self.token()
+        self.ta.is_staff = True
+        self.ta.save()
+        self.assertEqual(Client().get('/api/user_info', HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 401)
+
+    def test_password_change_through_the_api_revokes_tokens(self):
+        token = self.token()
+        self.login(self.admin)
+        self.assertTrue(self.post('update_user', {'id': self.ta.id, 'password': 'new'}).json()['ok'])
+        self.assertEqual(Client().get('/api/user_info', HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 401)
+
+    def test_other_saves_keep_tokens(self):
+        token = self.token()
+        self.ta.first_name = 'Teaching'
+        self.ta.save()
+        self.assertEqual(Client().get('/api/user_info', HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 200)
+
+
+class PaginationTests(CampusTestCase):
+
+    def test_cursor_walks_every_row_once(self):
+        self.login(self.admin)
+        ids, cursor = [], None
+        while True:
+            resp = self.get('list_user', limit=2, **({'cursor': cursor} if cursor else {})).json()
+            self.assertLessEqual(len(resp['data']), 2)
+            ids += [u['id'] for u in resp['data']]
+            cursor = resp['next']
+            if not cursor:
+                break
+        self.assertEqual(ids, sorted(User.objects.values_list('id', flat=True)))
+
+    def test_bad_cursor(self):
+        self.login(self.admin)
+        self.assertEqual(self.get('list_user', cursor='x').status_code, 400)
+        self.assertEqual(self.get('list_user', limit=0).status_code, 400)
+
+
+# the permission conditions before GroupAccess, joined over the staff
+# relations directly
+OLD_READ = {
+    Course: lambda user: Q(course_coordinators=user) | Q(groups__teaching_assistants=user),
+    Group: lambda user: Q(course__course_coordinators=user) | Q(lab__lab_executives=user) |
+    Q(teaching_assistants=user),
+    BaseSession: lambda user: Q(group__course__course_coordinators=user) | Q(group__lab__lab_executives=user) |
+    Q(group__teaching_assistants=user),
+    CheckInRecord: lambda user: Q(user=user) | Q(session__group__teaching_assistants=user) |
+    Q(session__group__course__course_coordinators=user) | Q(session__group__lab__lab_executives=user),
+}
+OLD_WRITE = {
+    Course: lambda user: Q(course_coordinators=user),
+    Group: lambda user: Q(course__course_coordinators=user) | Q(lab__lab_executives=user),
+    BaseSession: lambda user: Q(group__course__course_coordinators=user) | Q(group__lab__lab_executives=user),
+    CheckInRecord: lambda user: Q(session__group__course__course_coordinators=user) |
+    Q(session__group__lab__lab_executives=user),
+}
+NEW_READ = {
+    Course: views.course_can_read_by,
+    Group: views.group_can_read_by,
+    BaseSession: views.session_can_read_by,
+    CheckInRecord: views.record_can_read_by,
+}
+NEW_WRITE = {
+    Course: views.course_can_write_by,
+    Group: views.group_can_write_by,
+    BaseSession: views.session_can_write_by,
+    CheckInRecord: views.record_can_write_by,
+}
+
+
+class AccessTests(CampusTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.coordinator = User.objects.create_user('coordinator', password=PASSWORD)
+        cls.executive = User.objects.create_user('executive', password=PASSWORD)
+        cls.course.course_coordinators.add(cls.coordinator)
+        other_lab = Lab.objects.create(lab_name='L2', room_count=1)
+        other_lab.lab_executives.add(cls.executive)
+        other_course = Course.objects.create(course_code='C2', title='Course 2')
+        cls.other_group = Group.objects.create(course=other_course, group_name='G1', lab=other_lab, lab_room=1,
+                                               day_of_week=2, start_time=time(9), end_time=time(11))
+        cls.other_group.students.add(cls.students[1])
+        SpecialSession.objects.create(group=cls.other_group, check_in_ddl_mins=15, lab=other_lab, lab_room=1,
+                                      lab_date=timezone.localdate(), start_time=time(9), end_time=time(11))
+        materialize_absent_records(BaseSession.objects.values_list('id', flat=True))
+
+    def assert_same_access(self):
+        users = [self.ta, self.coordinator, self.executive, self.outsider] + self.students
+        for user in users:
+            for model in OLD_READ:
+                for old, new in ((OLD_READ, NEW_READ), (OLD_WRITE, NEW_WRITE)):
+                    self.assertEqual(set(model.objects.filter(old[model](user)).values_list('id', flat=True)),
+                                     set(model.objects.filter(new[model](user)).values_list('id', flat=True)),
+                                     f'{model.__name__} of {user.username}')
+
+    def test_same_rows_as_the_joins(self):
+        self.assert_same_access()
+
+    def test_same_rows_after_staff_changes(self):
+        self.group.teaching_assistants.remove(self.ta)
+        self.other_group.teaching_assistants.add(self.ta)
+        self.executive.lab_executive_of.add(self.lab)
+        self.course.course_coordinators.clear()
+        self.other_group.lab = self.lab
+        self.other_group.save()
+        self.assert_same_access()
+
+
+@override_settings(CHECK_IN_COALESCE=False)
+class RollupTests(CampusTestCase):
+
+    def counters(self) -> dict:
+        return {model: {row[:-3]: row[-3:] for row in model.objects.values_list(*keys, 'absent', 'late', 'attended')
+                        if any(row[-3:])}
+                for model, keys in ROLLUPS}
+
+    def test_deltas_match_a_rebuild(self):
+        materialize_absent_records([s.id for s in self.regular])
+        self.login(self.students[0])
+        self.post('check_in', {'lab_id': self.lab.id, 'lab_room': 1})
+
+        self.login(self.admin)
+        records = list(CheckInRecord.objects.filter(session=self.regular[0]).order_by('id'))
+        self.post('update_records', {'records': [
+            {'id': r.id, 'last_modify_time': '2100-01-01T00:00:00+00:00', 'check_in_state': CheckInRecord.LATE}
+            for r in records]})
+        self.post('update_record', {'id': records[0].id, 'last_modify_time': '2100-01-01T00:00:00+00:00',
+                                    'check_in_state': CheckInRecord.ATTENDED})
+        incremental = self.counters()
+        self.assertEqual(incremental[SessionAttendance][(self.regular[0].id,)], (0, 1, 1))
+
+        rebuild_rollups()
+        self.assertEqual(self.counters(), incremental)
+
+
+# `default` stands in for a replica: reads only leave it outside a
+# transaction, so these requests must not run inside one
+@override_settings(REPLICA_DATABASES=['default'])
+class ReplicaTests(TransactionTestCase):
+
+    def setUp(self):
+        User.objects.create_user('admin', password=PASSWORD, is_superuser=True)
+        self.client.login(username='admin', password=PASSWORD)
+
+    def reads(self) -> tuple:
+        counters = metrics.registry.snapshot()['counters']
+        return counters.get('replica_reads', 0), counters.get('primary_reads', 0)
+
+    def test_reads_are_pinned_after_a_write(self):
+        replica, primary = self.reads()
+        self.client.get('/api/list_lab')
+        self.assertEqual(self.reads(), (replica + 1, primary))
+
+        resp = self.client.post('/api/add_lab', json.dumps({'lab_name': 'L1', 'room_count': 1}),
+                                content_type='application/json')
+        self.assertIn(STICKY_COOKIE, resp.cookies)
+        self.client.get('/api/list_lab')
+        self.assertEqual(self.reads(), (replica + 1, primary + 1))
+
+        del self.client.cookies[STICKY_COOKIE]
+        self.client.get('/api/list_lab')
+        self.assertEqual(self.reads(), (replica + 2, primary + 1))
+
+
+class FieldSelectionTests(CampusTestCase):
+
+    def test_field_order_does_not_matter(self):
+        self.login(self.admin)
+        materialize_absent_records([self.regular[0].id])
+        rowjson._compiled.cache_clear()
+        bodies = {self.get('list_record', fields=fields).content
+                  for fields in ('check_in_state,user_id', 'user_id,check_in_state', 'user_id,id,check_in_state')}
+        self.assertEqual(len(bodies), 1)
+        self.assertEqual(rowjson._compiled.cache_info().currsize, 1)
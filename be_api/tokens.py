@@ -0,0 +1,134 @@
+"""
+Signed, expiring auth tokens.
+
+login issues a token on request; clients send it as `Authorization: Bearer
+<token>`. The token carries the user id, username and role flags, so
+TokenAuthMiddleware builds request.user without reading the session or the
+user table. The flags are those at issue time and stay valid until the token
+expires (AUTH_TOKEN_MAX_AGE) or is revoked. A logout revokes its token,
+kept in RevokedToken until it expires; a change of a user's roles, active
+flag or password revokes every token issued to them before, through a
+cutoff time in UserTokenCutoff. Each process holds the deny-list in memory
+and reloads it at most every AUTH_TOKEN_DENY_LIST_TTL seconds.
+"""
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.utils import timezone
+from .models import Profile, RevokedToken, UserTokenCutoff
+
+TOKEN_SALT = 'be_api.auth-token'
+# changing one of these revokes the user's tokens
+TOKEN_USER_FIELDS = ('is_staff', 'is_superuser', 'is_active', 'password')
+
+
+def issue_token(user: User) -> str:
+    is_ta = Profile.objects.filter(
+        user=user).values_list('is_ta', flat=True).first() or False
+    return signing.dumps({
+        'u': user.id,
+        'n': user.get_username(),
+        's': user.is_staff,
+        'a': user.is_superuser,
+        't': is_ta,
+        'j': secrets.token_hex(8),
+    }, salt=TOKEN_SALT)
+
+
+class _DenyList:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jtis = frozenset()
+        self._cutoffs = {}
+        self._loaded = None
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = None
+
+    def _load(self) -> tuple:
+        now = time.monotonic()
+        with self._lock:
+            if self._loaded is not None and now - self._loaded < settings.AUTH_TOKEN_DENY_LIST_TTL:
+                return self._jtis, self._cutoffs
+        current = timezone.now()
+        jtis = frozenset(RevokedToken.objects.filter(
+            expires_at__gt=current).values_list('jti', flat=True))
+        # older cutoffs only refuse tokens that expired anyway
+        cutoffs = {user_id: not_before.timestamp() for user_id, not_before in UserTokenCutoff.objects.filter(
+            not_before__gt=current - timedelta(seconds=settings.AUTH_TOKEN_MAX_AGE)).values_list(
+                'user_id', 'not_before')}
+        with self._lock:
+            self._jtis, self._cutoffs, self._loaded = jtis, cutoffs, now
+        return jtis, cutoffs
+
+    def refuses(self, payload: dict) -> bool:
+        jtis, cutoffs = self._load()
+        # issue times are whole seconds, a token of the second of the
+        # cutoff is refused as well
+        return payload['j'] in jtis or payload['issued'] <= cutoffs.get(payload['u'], -1)
+
+
+deny_list = _DenyList()
+
+
+def _issued_at(token: str) -> int:
+    # signing.dumps() signs "<payload>:<timestamp>", the timestamp being
+    # seconds in base 62
+    return signing.b62_decode(token.rsplit(':', 2)[1])
+
+
+def read_token(token: str):
+    """
+    The payload of a valid, unexpired and unrevoked token, or None. The
+    time the token was issued is added as `issued`.
+    """
+    try:
+        payload = signing.loads(
+            token, salt=TOKEN_SALT, max_age=settings.AUTH_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    payload['issued'] = _issued_at(token)
+    if deny_list.refuses(payload):
+        return None
+    return payload
+
+
+def token_user(payload: dict) -> User:
+    user = User(id=payload['u'], username=payload['n'], is_staff=payload['s'],
+                is_superuser=payload['a'], is_active=True)
+    user._state.adding = False
+    user.is_ta = payload['t']
+    return user
+
+
+def revoke_token(payload: dict):
+    # the token is deny-listed until it would have expired anyway
+    expires_at = datetime.fromtimestamp(
+        payload['issued'] + settings.AUTH_TOKEN_MAX_AGE, tz=dt_timezone.utc)
+    RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    RevokedToken.objects.get_or_create(jti=payload['j'], defaults={
+        'expires_at': expires_at})
+    deny_list.invalidate()
+
+
+def revoke_user_tokens(user_ids):
+    """
+    Refuse every token issued so far to the given users, e.g. after their
+    roles changed.
+    """
+    now = timezone.now()
+    for user_id in set(user_ids):
+        UserTokenCutoff.objects.update_or_create(user_id=user_id, defaults={'not_before': now})
+    deny_list.invalidate()
+
+
+def bearer_token(authorization: str):
+    scheme, _, token = authorization.partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    return token.strip()
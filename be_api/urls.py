@@ -10,6 +10,7 @@ urlpatterns = [
     path('list_user', views.list_user_view, name='list_user'),
     path('add_user', views.add_user_view, name='add_user'),
     path('update_user', views.update_user_view, name='update_user'),
+    path('import_roster', views.import_roster_view, name='import_roster'),
     path('get_lab', views.get_lab_view, name='get_lab'),
     path('list_lab', views.list_lab_view, name='list_lab'),
     path('add_lab', views.add_lab_view, name='add_lab'),
@@ -26,14 +27,23 @@ urlpatterns = [
     path('list_session', views.list_session_view, name='list_session'),
     path('add_regular_session', views.add_regular_session_view,
          name='add_regular_session'),
+    path('generate_regular_sessions', views.generate_regular_sessions_view,
+         name='generate_regular_sessions'),
     path('add_special_session', views.add_special_session_view,
          name='add_special_session'),
     path('update_session', views.update_session_view, name='update_session'),
     path('get_record', views.get_record_view, name='get_record'),
     path('list_record', views.list_record_view, name='list_record'),
+    path('export_record', views.export_record_view, name='export_record'),
     path('update_record', views.update_record_view, name='update_record'),
+    path('update_records', views.update_records_view, name='update_records'),
+    path('attendance_stats', views.attendance_stats_view,
+         name='attendance_stats'),
     path('list_record_filters', views.list_record_filters_view,
          name='list_record_filters'),
     path('records_of_lab_today', views.records_of_lab_today_view,
          name='records_of_lab_today'),
+    path('check_in', views.check_in_view, name='check_in'),
+    path('batch', views.batch_view, name='batch'),
+    path('metrics', views.metrics_view, name='metrics'),
 ]
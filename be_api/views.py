@@ -1,18 +1,45 @@
-from django.http import HttpResponse, HttpRequest, JsonResponse
+from django.http import HttpResponse, HttpRequest, JsonResponse, StreamingHttpResponse, QueryDict
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect
 from django.conf import settings
-from .models import Profile, Week, Lab, Course, Group, BaseSession, RegularSession, SpecialSession, MakeUpSession, CheckInRecord
+from .models import Profile, Week, Lab, Course, Group, BaseSession, RegularSession, SpecialSession, MakeUpSession, CheckInRecord, SessionAttendance, GroupWeekAttendance, CourseAttendance, StudentCourseAttendance, ArchivedSession, ArchivedCheckInRecord, modify_stamp, to_milliseconds
+from .access import readable_groups, writable_groups, ta_courses, coordinated_courses, refresh_group_access
+from .checkin import check_in, CheckInRejected
+from .encoding import BadFieldsRequest, model_fields, requested_fields, wants_columnar, encode_rows
+from .archive import wants_archived
+from .etags import bump, conditional_get
+from .replicas import read_from_replica
+from .rowjson import row_encoder
+from .lab_cache import cached_snapshot, invalidate_all, invalidate_groups, invalidate_labs, invalidate_sessions, labs_of_sessions
+from .export import export_stream, EXPORT_FORMATS
+from . import metrics
+from .live import publish_records
+from .metrics import render_prometheus
+from .pagination import paginate, paginate_merged, BadPageRequest
+from .record_filters import filter_options, refresh_record_users
+from .roster import parse_roster, normalize_rows, import_roster, RosterError
+from .rollups import apply_record_changes, record_rows
+from .tokens import TOKEN_USER_FIELDS, issue_token, revoke_token, revoke_user_tokens
+from .schedule import refresh_effective_schedule
+from .semester import generate_regular_sessions
+from .watermarks import make_watermark, read_watermark, watermark_fingerprint
+from .records import materialize_absent_records, sessions_of_day, day_is_materialized, invalidate_materialized_days
+import copy
 import traceback
-from django.db.models import Q, F
+from django.db import transaction
+from django.db.models import Q, F, Case, When, Value, IntegerField, CharField
 from django.forms.models import model_to_dict
 from django.core.exceptions import ObjectDoesNotExist
 from django.db.utils import IntegrityError
 import json
 from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
 from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+from django.urls import resolve, reverse
+from django.utils.crypto import constant_time_compare
 from datetime import datetime, date, time, timedelta
 
 VISIBLE_USER_FIELDS = ['id', 'username', 'is_superuser',
@@ -29,6 +56,20 @@ def ok_resp(data: any = None) -> JsonResponse:
     })
 
 
+def page_resp(data: list, next_cursor: str = None) -> JsonResponse:
+    return JsonResponse({
+        'ok': True,
+        'data': data,
+        'next': next_cursor,
+    })
+
+
+def encoded_page_resp(data: str, next_cursor: str = None) -> HttpResponse:
+    # page_resp() with `data` already encoded to JSON
+    return HttpResponse('{"ok": true, "data": ' + data + ', "next": ' + json.dumps(next_cursor) + '}',
+                        content_type='application/json')
+
+
 def err_resp(err_code: int, err_msg: str, http_status: int = 200) -> JsonResponse:
     return JsonResponse({
         'ok': False,
@@ -93,6 +134,11 @@ def login_api_view(request: HttpRequest, query: dict):
 
     user = authenticate(request, username=username, password=password)
     if user is not None:
+        if query.get('token'):
+            return ok_resp({
+                'token': issue_token(user),
+                'expires_in': settings.AUTH_TOKEN_MAX_AGE,
+            })
         login(request, user)
         return ok_resp()
     else:
@@ -100,6 +146,7 @@ def login_api_view(request: HttpRequest, query: dict):
 
 
 @require_login
+@conditional_get('user')
 def user_info_view(request: HttpRequest):
     username = request.user.get_username()
 
@@ -111,7 +158,10 @@ def user_info_view(request: HttpRequest):
 
 @require_login
 def logout_api_view(request: HttpRequest):
-    logout(request)
+    if getattr(request, 'auth_token', None):
+        revoke_token(request.auth_token)
+    else:
+        logout(request)
     return ok_resp()
 
 
@@ -133,6 +183,8 @@ def user_can_write_by(user: User) -> Q:
 
 
 @require_login
+@read_from_replica
+@conditional_get('user')
 def get_user_view(request: HttpRequest):
     if 'id' in request.GET:
         user_id = int(request.GET['id'])
@@ -152,6 +204,8 @@ def get_user_view(request: HttpRequest):
 
 
 @require_login
+@read_from_replica
+@conditional_get('user')
 def list_user_view(request: HttpRequest):
     user = request.user
     if 'q' in request.GET:
@@ -166,7 +220,12 @@ def list_user_view(request: HttpRequest):
     users = User.objects.filter(read_perm, search_query).values(
         'id', 'username', 'first_name', 'last_name')
 
-    return ok_resp(list(users))
+    try:
+        page, next_cursor = paginate(users, request.GET)
+    except BadPageRequest:
+        return bad_request_400()
+
+    return page_resp(page, next_cursor)
 
 
 @require_login
@@ -206,9 +265,41 @@ def update_user_view(request: HttpRequest, query: dict):
         traceback.print_exc()
         return bad_request_400()
 
+    # a queryset update sends no signals
+    if set(TOKEN_USER_FIELDS) & query.keys():
+        revoke_user_tokens([uid])
+    bump('user')
+    invalidate_all()
     return ok_resp()
 
 
+@require_login
+@json_post_request
+def import_roster_view(request: HttpRequest, query: dict):
+    if not request.user.is_superuser:
+        return unauthorized_401()
+
+    try:
+        if 'users' in query:
+            users = normalize_rows(query['users'])
+        else:
+            users = parse_roster(query['data'], query.get('format', 'csv'))
+    except (KeyError, TypeError, RosterError) as e:
+        return err_resp(400, str(e), 400)
+    # forking a pool from a threaded server process is unsafe, so the
+    # request hashes inline and larger rosters go through the command
+    if len(users) > settings.ROSTER_API_MAX_USERS:
+        return err_resp(400, f'at most {settings.ROSTER_API_MAX_USERS} users per request, '
+                        'import larger rosters with manage.py import_roster', 400)
+
+    try:
+        stats = import_roster(users, workers=1)
+    except (KeyError, TypeError, RosterError) as e:
+        return err_resp(400, str(e), 400)
+
+    return ok_resp(stats)
+
+
 def lab_can_read_by(user: User) -> Q:
     if user.is_staff or user.is_superuser:
         return Q()  # can read all lab
@@ -222,6 +313,8 @@ def lab_can_write_by(user: User) -> Q:
 
 
 @require_login
+@read_from_replica
+@conditional_get('lab', 'lab_executives')
 def get_lab_view(request: HttpRequest):
     if 'id' in request.GET:
         lab_id = int(request.GET['id'])
@@ -242,6 +335,8 @@ def get_lab_view(request: HttpRequest):
 
 
 @require_login
+@read_from_replica
+@conditional_get('lab', 'lab_executives')
 def list_lab_view(request: HttpRequest):
     user = request.user
     if 'q' in request.GET:
@@ -255,7 +350,12 @@ def list_lab_view(request: HttpRequest):
     labs = Lab.objects.filter(read_perm, search_query).values(
         'id', 'lab_name', 'room_count', 'active')
 
-    return ok_resp(list(labs))
+    try:
+        page, next_cursor = paginate(labs, request.GET)
+    except BadPageRequest:
+        return bad_request_400()
+
+    return page_resp(page, next_cursor)
 
 
 @require_login
@@ -288,22 +388,25 @@ def update_lab_view(request: HttpRequest, query: dict):
         traceback.print_exc()
         return bad_request_400()
 
+    bump('lab')
     return ok_resp()
 
 
 def course_can_read_by(user: User) -> Q:
     if user.is_staff or user.is_superuser:
         return Q()  # can read all course
-    return Q(course_coordinators=user) | Q(groups__teaching_assistants=user)
+    return Q(id__in=coordinated_courses(user)) | Q(id__in=ta_courses(user))
 
 
 def course_can_write_by(user: User) -> Q:
     if user.is_superuser:
         return Q()  # can modify all course
-    return Q(course_coordinators=user)
+    return Q(id__in=coordinated_courses(user))
 
 
 @require_login
+@read_from_replica
+@conditional_get('course', 'course_coordinators', 'group_access')
 def get_course_view(request: HttpRequest):
     if 'id' in request.GET:
         id = int(request.GET['id'])
@@ -323,6 +426,8 @@ def get_course_view(request: HttpRequest):
 
 
 @require_login
+@read_from_replica
+@conditional_get('course', 'course_coordinators', 'group_access')
 def list_course_view(request: HttpRequest):
     user = request.user
     if 'q' in request.GET:
@@ -336,7 +441,12 @@ def list_course_view(request: HttpRequest):
     objs = Course.objects.filter(read_perm, search_query).values(
         'id', 'course_code', 'title')
 
-    return ok_resp(list(objs))
+    try:
+        page, next_cursor = paginate(objs, request.GET)
+    except BadPageRequest:
+        return bad_request_400()
+
+    return page_resp(page, next_cursor)
 
 
 @require_login
@@ -369,22 +479,27 @@ def update_course_view(request: HttpRequest, query: dict):
         traceback.print_exc()
         return bad_request_400()
 
+    bump('course')
+    invalidate_groups(Group.objects.filter(
+        course_id=id).values_list('id', flat=True))
     return ok_resp()
 
 
 def group_can_read_by(user: User) -> Q:
     if user.is_staff or user.is_superuser:
         return Q()  # can read all group
-    return Q(course__course_coordinators=user) | Q(lab__lab_executives=user) | Q(teaching_assistants=user)
+    return Q(id__in=readable_groups(user))
 
 
 def group_can_write_by(user: User) -> Q:
     if user.is_superuser:
         return Q()  # can modify all group
-    return Q(course__course_coordinators=user) | Q(lab__lab_executives=user)
+    return Q(id__in=writable_groups(user))
 
 
 @require_login
+@read_from_replica
+@conditional_get('group', 'group_access')
 def get_group_view(request: HttpRequest):
     if 'id' in request.GET:
         id = int(request.GET['id'])
@@ -405,21 +520,32 @@ def get_group_view(request: HttpRequest):
 
 
 @require_login
+@read_from_replica
+@conditional_get('group', 'group_access')
 def list_group_view(request: HttpRequest):
     user = request.user
     query_condition = Q()
     if 'q' in request.GET:
         q = request.GET['q']
         query_condition &= Q(group_name__contains=q)
-    if 'crouse_id' in request.GET:
+    if 'course_id' in request.GET:
         course_id = int(request.GET['course_id'])
         query_condition &= Q(course_id=course_id)
 
     read_perm = group_can_read_by(user)
 
-    objs = Group.objects.filter(read_perm, query_condition).values()
+    try:
+        fields = requested_fields(
+            request.GET, model_fields(Group), required=('id',))
+        as_columnar = wants_columnar(request.GET)
+        columns = fields or model_fields(Group)
+        objs = Group.objects.filter(
+            read_perm, query_condition).values_list(*columns)
+        page, next_cursor = paginate(objs, request.GET, columns=columns)
+    except (BadPageRequest, BadFieldsRequest):
+        return bad_request_400()
 
-    return ok_resp(list(objs))
+    return encoded_page_resp(row_encoder(Group, columns).encode(page, as_columnar), next_cursor)
 
 
 @require_login
@@ -445,6 +571,8 @@ def update_group_view(request: HttpRequest, query: dict):
     obj = Group.objects.filter(group_can_write_by(request.user), pk=id)
     if obj.count() < 1:
         return not_found_404()
+    # the labs it is held in before the update
+    invalidate_groups([id])
 
     try:
         obj.update(**query)
@@ -452,22 +580,86 @@ def update_group_view(request: HttpRequest, query: dict):
         traceback.print_exc()
         return bad_request_400()
 
+    bump('group')
+    refresh_effective_schedule(group_ids=[id])
+    invalidate_groups([id])
+    refresh_group_access([id])
+    invalidate_materialized_days()
     return ok_resp()
 
 
 def session_can_read_by(user: User) -> Q:
     if user.is_staff or user.is_superuser:
         return Q()  # can read all course
-    return Q(group__course__course_coordinators=user) | Q(group__lab__lab_executives=user) | Q(group__teaching_assistants=user)
+    return Q(group_id__in=readable_groups(user))
 
 
 def session_can_write_by(user: User) -> Q:
     if user.is_superuser:
         return Q()  # can modify all course
-    return Q(group__course__course_coordinators=user) | Q(group__lab__lab_executives=user)
+    return Q(group_id__in=writable_groups(user))
+
+
+REGULAR_SESSION_FIELDS = {
+    'week_id': 'regularsession__week_id',
+}
+SPECIAL_SESSION_FIELDS = {
+    'lab_id': 'specialsession__lab_id',
+    'lab_room': 'specialsession__lab_room',
+    'lab_date': 'specialsession__lab_date',
+    'start_time': 'specialsession__start_time',
+    'end_time': 'specialsession__end_time',
+}
+
+
+SESSION_FIELDS = model_fields(BaseSession) + ['basesession_ptr_id'] + \
+    list(REGULAR_SESSION_FIELDS) + list(SPECIAL_SESSION_FIELDS)
+
+
+def _session_columns(fields: list = None) -> tuple:
+    base_fields = model_fields(BaseSession)
+    subtype_fields = {**REGULAR_SESSION_FIELDS, **SPECIAL_SESSION_FIELDS}
+    if fields is not None:
+        base_fields = [f for f in base_fields if f in fields or f == 'id']
+        subtype_fields = {name: path for name, path in subtype_fields.items()
+                          if name in fields or name == 'week_id'}
+    return base_fields, subtype_fields
+
+
+def session_values(sessions, fields: list = None):
+    """
+    .values() of BaseSession rows with the fields of their subtype joined
+    in, so sessions of both kinds are read with one query. Only `fields`
+    (and what tells the subtypes apart) are selected when given.
+    """
+    base_fields, subtype_fields = _session_columns(fields)
+    return sessions.values(*base_fields, **{name: F(path) for name, path in subtype_fields.items()})
+
+
+def archived_session_values(sessions, fields: list = None):
+    """
+    session_values() of ArchivedSession rows.
+    """
+    base_fields, subtype_fields = _session_columns(fields)
+    return sessions.values(*base_fields, *subtype_fields)
+
+
+def session_row(row: dict, fields: list = None) -> dict:
+    """
+    A row of session_values() as .values() of its subtype returns it.
+    """
+    regular = row['week_id'] is not None
+    for name in (SPECIAL_SESSION_FIELDS if regular else REGULAR_SESSION_FIELDS):
+        row.pop(name, None)
+    row['basesession_ptr_id'] = row['id']
+    if fields is not None:
+        row = {name: row[name] for name in fields if name in row}
+    return row
 
 
 @require_login
+@read_from_replica
+@conditional_get('session', 'group', 'group_access')
 def get_session_view(request: HttpRequest):
     if 'id' in request.GET:
         id = int(request.GET['id'])
@@ -477,16 +669,19 @@ def get_session_view(request: HttpRequest):
 
     condition = key_query & session_can_read_by(request.user)
 
-    obj = RegularSession.objects.filter(condition).values().first()
-    if not obj:
-        obj = SpecialSession.objects.filter(condition).values().first()
+    obj = session_values(BaseSession.objects.filter(condition)).first()
+    if not obj and wants_archived(request.GET):
+        obj = archived_session_values(
+            ArchivedSession.objects.filter(condition)).first()
     if not obj:
         return not_found_404()
 
-    return ok_resp(obj)
+    return ok_resp(session_row(obj))
 
 
 @require_login
+@read_from_replica
+@conditional_get('session', 'group', 'group_access')
 def list_session_view(request: HttpRequest):
     query_condition = Q()
 
@@ -501,27 +696,35 @@ def list_session_view(request: HttpRequest):
     if not query_condition:
         return bad_request_400()
 
-    include_sp, include_reg = True, True
-
+    archived_condition = query_condition
     if 'special' in request.GET:
-        special = int(request.GET.get['special'])
-        if special:
-            include_sp, include_reg = True, False
-        else:
-            include_sp, include_reg = False, True
+        special = int(request.GET['special'])
+        query_condition &= Q(specialsession__isnull=not special)
+        archived_condition &= Q(lab_date__isnull=not special)
 
     user = request.user
     read_perm = session_can_read_by(user)
 
     condition = read_perm & query_condition
 
-    reg, sp = [], []
-    if include_reg:
-        reg = list(RegularSession.objects.filter(condition).values())
-    if include_sp:
-        sp = list(SpecialSession.objects.filter(condition).values())
+    try:
+        fields = requested_fields(
+            request.GET, SESSION_FIELDS, required=('id',))
+        as_columnar = wants_columnar(request.GET)
+        sessions = session_values(
+            BaseSession.objects.filter(condition), fields)
+        if wants_archived(request.GET):
+            archived = archived_session_values(
+                ArchivedSession.objects.filter(read_perm & archived_condition), fields)
+            page, next_cursor = paginate_merged(
+                [archived, sessions], request.GET)
+        else:
+            page, next_cursor = paginate(sessions, request.GET)
+    except (BadPageRequest, BadFieldsRequest):
+        return bad_request_400()
 
-    return ok_resp(reg+sp)
+    rows = [session_row(row, fields) for row in page]
+    return page_resp(encode_rows(rows, as_columnar, fields), next_cursor)
 
 
 @require_login
@@ -536,6 +739,36 @@ def add_regular_session_view(request: HttpRequest, query: dict):
     return ok_resp()
 
 
+def _flag(query: dict, key: str, default: bool) -> bool:
+    # bool("false") is True, so only JSON booleans are accepted
+    value = query.get(key, default)
+    if not isinstance(value, bool):
+        raise ValueError(f'{key} should be true or false')
+    return value
+
+
+@require_login
+@json_post_request
+def generate_regular_sessions_view(request: HttpRequest, query: dict):
+    if not request.user.is_superuser:
+        return unauthorized_401()
+
+    try:
+        group_ids = query.get('group_ids')
+        if group_ids is not None:
+            group_ids = [int(group_id) for group_id in group_ids]
+        stats = generate_regular_sessions(
+            group_ids, int(query['first_week_id']), int(query['last_week_id']),
+            check_in_ddl_mins=int(query.get('check_in_ddl_mins', 15)),
+            allow_late_check_in=_flag(query, 'allow_late_check_in', True),
+            compulsory=_flag(query, 'compulsory', True),
+            dry_run=_flag(query, 'dry_run', False))
+    except (KeyError, TypeError, ValueError):
+        return bad_request_400()
+
+    return ok_resp(stats)
+
+
 @require_login
 @json_post_request
 def add_special_session_view(request: HttpRequest, query: dict):
@@ -556,12 +789,12 @@ def update_session_view(request: HttpRequest, query: dict):
     except:
         return bad_request_400()
 
-    condition = session_can_write_by(request.user) & Q(pk=id)
-    obj = RegularSession.objects.filter(condition)
-    if obj.count() < 1:
-        obj = SpecialSession.objects.filter(condition)
-    if obj.count() < 1:
+    old = BaseSession.objects.filter(session_can_write_by(request.user), pk=id).values(
+        'group_id', 'effective_lab_id', 'regularsession__week_id').first()
+    if not old:
         return not_found_404()
+    session_model = RegularSession if old['regularsession__week_id'] is not None else SpecialSession
+    obj = session_model.objects.filter(pk=id)
 
     try:
         obj.update(**query)
@@ -569,22 +802,32 @@ def update_session_view(request: HttpRequest, query: dict):
         traceback.print_exc()
         return bad_request_400()
 
+    bump('session')
+    refresh_effective_schedule(session_ids=[id])
+    invalidate_labs({old['effective_lab_id']} | labs_of_sessions([id]))
+    if {'group', 'group_id'} & query.keys():
+        refresh_record_users(
+            [old['group_id']] + list(obj.values_list('group_id', flat=True)))
+
+    invalidate_materialized_days()
     return ok_resp()
 
 
 def record_can_read_by(user: User) -> Q:
     if user.is_superuser:
         return Q()  # can read all record
-    return Q(user=user) | Q(session__group__teaching_assistants=user) | Q(session__group__course__course_coordinators=user) | Q(session__group__lab__lab_executives=user)
+    return Q(user=user) | Q(session__group_id__in=readable_groups(user))
 
 
 def record_can_write_by(user: User) -> Q:
     if user.is_superuser:
         return Q()  # can modify all record
-    return Q(session__group__course__course_coordinators=user) | Q(session__group__lab__lab_executives=user)
+    return Q(session__group_id__in=writable_groups(user))
 
 
 @require_login
+@read_from_replica
+@conditional_get('record', 'session', 'group', 'group_access')
 def get_record_view(request: HttpRequest):
     if 'id' in request.GET:
         id = int(request.GET['id'])
@@ -594,35 +837,85 @@ def get_record_view(request: HttpRequest):
 
     obj = CheckInRecord.objects.filter(
         key_query, record_can_read_by(request.user)).values().first()
+    if not obj and wants_archived(request.GET):
+        obj = ArchivedCheckInRecord.objects.filter(
+            key_query, record_can_read_by(request.user)).values().first()
     if not obj:
         return not_found_404()
 
     return ok_resp(obj)
 
 
-@require_login
-def list_record_view(request: HttpRequest):
-    user = request.user
+def record_query_condition(params) -> Q:
     query_condition = Q()
-    if 'session_id' in request.GET:
-        session_id = int(request.GET['session_id'])
+    if 'session_id' in params:
+        session_id = int(params['session_id'])
         query_condition &= Q(session_id=session_id)
-    elif 'group_id' in request.GET:
-        course_id = int(request.GET['group_id'])
+    elif 'group_id' in params:
+        group_id = int(params['group_id'])
         query_condition &= Q(session__group_id=group_id)
-    elif 'crouse_id' in request.GET:
-        course_id = int(request.GET['course_id'])
+    elif 'course_id' in params:
+        course_id = int(params['course_id'])
         query_condition &= Q(session__group__course_id=course_id)
 
-    if 'user_id' in request.GET:
-        user_id = int(request.GET['user_id'])
+    if 'user_id' in params:
+        user_id = int(params['user_id'])
         query_condition &= Q(user_id=user_id)
 
+    return query_condition
+
+
+@require_login
+@read_from_replica
+@conditional_get('record', 'session', 'group', 'group_access')
+def list_record_view(request: HttpRequest):
+    user = request.user
+    query_condition = record_query_condition(request.GET)
+
     read_perm = record_can_read_by(user)
 
-    objs = CheckInRecord.objects.filter(read_perm, query_condition).values()
+    try:
+        fields = requested_fields(request.GET, model_fields(
+            CheckInRecord), required=('last_modify_time', 'id'))
+        as_columnar = wants_columnar(request.GET)
+        columns = fields or model_fields(CheckInRecord)
+        objs = CheckInRecord.objects.filter(
+            read_perm, query_condition).values_list(*columns)
+        if wants_archived(request.GET):
+            # the archive has the same columns
+            archived = ArchivedCheckInRecord.objects.filter(
+                read_perm, query_condition).values_list(*columns)
+            page, next_cursor = paginate_merged(
+                [archived, objs], request.GET, order_fields=('last_modify_time', 'id'), columns=columns)
+        else:
+            page, next_cursor = paginate(
+                objs, request.GET, order_fields=('last_modify_time', 'id'), columns=columns)
+    except (BadPageRequest, BadFieldsRequest):
+        return bad_request_400()
 
-    return ok_resp(list(objs))
+    return encoded_page_resp(row_encoder(CheckInRecord, columns).encode(page, as_columnar), next_cursor)
+
+
+@require_login
+@conditional_get('record', 'session', 'group', 'course', 'user', 'group_access')
+def export_record_view(request: HttpRequest):
+    fmt = request.GET.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return bad_request_400()
+    expand = request.GET.get('expand', '0') not in ('', '0', 'false')
+
+    try:
+        query_condition = record_query_condition(request.GET)
+    except ValueError:
+        return bad_request_400()
+
+    records = CheckInRecord.objects.filter(
+        record_can_read_by(request.user), query_condition)
+
+    content_type, stream = export_stream(records, fmt, expand)
+    resp = StreamingHttpResponse(stream, content_type=content_type)
+    resp['Content-Disposition'] = f'attachment; filename="records.{fmt}"'
+    return resp
 
 
 @require_login
@@ -636,40 +929,258 @@ def update_record_view(request: HttpRequest, query: dict):
     except:
         return bad_request_400()
 
+    # the client's last_modify_time carries milliseconds only
     obj = CheckInRecord.objects.filter(record_can_write_by(
-        request.user), pk=id, last_modify_time__lte=last_modify_time)
-    if obj.count() < 1:
-        return not_found_404()
+        request.user), pk=id, last_modify_time__lt=last_modify_time + timedelta(milliseconds=1))
+    query = {k: v for k, v in query.items() if k != 'last_modify_time'}
+    stamp = modify_stamp()
+    with transaction.atomic():
+        # locked so no other write lands between reading the old row and
+        # the update
+        old_rows = list(obj.select_for_update().values_list(
+            'session_id', 'user_id', 'user_type', 'check_in_state'))
+        if len(old_rows) < 1:
+            return not_found_404()
 
+        try:
+            with transaction.atomic():
+                updated = obj.update(**query, last_modify_time=stamp)
+        except:
+            traceback.print_exc()
+            return bad_request_400()
+        if updated != 1:
+            return not_found_404()
+
+        bump('record')
+        new_rows = record_rows([id])
+        apply_record_changes(removed=old_rows, added=new_rows)
+        publish_records(CheckInRecord.objects.filter(pk=id))
+        invalidate_sessions([r[0] for r in old_rows + new_rows])
+        if {'session', 'session_id', 'user', 'user_id'} & query.keys():
+            refresh_record_users(BaseSession.objects.filter(
+                id__in=[r[0] for r in old_rows + new_rows]).values_list('group_id', flat=True))
+
+    return ok_resp({'last_modify_time': stamp})
+
+
+UPDATE_RECORDS_MAX = 500
+RECORD_STATES = {state for state, _ in CheckInRecord.CHECK_IN_STATE_CHOICES}
+
+
+def _record_change(change: dict) -> tuple:
+    """
+    (id, expected last_modify_time, {field: value}) of one change of an
+    update_records request, raises ValueError when it is malformed.
+    """
+    id = int(change['id'])
+    expected = datetime.fromisoformat(change['last_modify_time'])
+    if not expected.tzinfo:
+        raise ValueError('naive last_modify_time')
+    values = {}
+    if 'check_in_state' in change:
+        if change['check_in_state'] not in RECORD_STATES:
+            raise ValueError('bad check_in_state')
+        values['check_in_state'] = change['check_in_state']
+    if 'remark' in change:
+        remark = change['remark']
+        if not isinstance(remark, str) or len(remark) > CheckInRecord._meta.get_field('remark').max_length:
+            raise ValueError('bad remark')
+        values['remark'] = remark
+    if not values:
+        raise ValueError('nothing to change')
+    return id, expected, values
+
+
+@require_login
+@json_post_request
+def update_records_view(request: HttpRequest, query: dict):
+    """
+    Apply many {id, last_modify_time, check_in_state?, remark?} changes
+    with one UPDATE. A change is applied only if the record was not
+    modified after its last_modify_time; every applied record gets the same
+    server side last_modify_time, which is returned.
+    """
     try:
-        obj.update(**query)
+        changes = {}
+        for change in query['records']:
+            id, expected, values = _record_change(change)
+            if id in changes:
+                return bad_request_400()
+            changes[id] = (expected, values)
     except:
-        traceback.print_exc()
+        return bad_request_400()
+    if not changes or len(changes) > UPDATE_RECORDS_MAX:
         return bad_request_400()
 
-    return ok_resp()
+    stamp = modify_stamp()
+    status = {id: 'not_found' for id in changes}
+    current = {}
+    with transaction.atomic():
+        rows = CheckInRecord.objects.filter(record_can_write_by(request.user), pk__in=changes.keys()) \
+            .select_for_update().values_list('id', 'last_modify_time', 'session_id', 'user_id', 'user_type', 'check_in_state')
+        old_rows = []
+        for id, last_modify_time, *row in rows:
+            # rows stamped before stamps were cut to milliseconds still
+            # carry microseconds the client never saw
+            if to_milliseconds(last_modify_time) > changes[id][0]:
+                status[id] = 'conflict'
+                current[id] = last_modify_time
+            else:
+                status[id] = 'ok'
+                old_rows.append(tuple(row))
+
+        ok_ids = [id for id in changes if status[id] == 'ok']
+        if ok_ids:
+            def case(field, output_field):
+                whens = [When(pk=id, then=Value(changes[id][1][field]))
+                         for id in ok_ids if field in changes[id][1]]
+                return Case(*whens, default=F(field), output_field=output_field) if whens else F(field)
+
+            CheckInRecord.objects.filter(pk__in=ok_ids).update(
+                check_in_state=case('check_in_state', IntegerField()),
+                remark=case('remark', CharField()),
+                last_modify_time=stamp,
+            )
+
+            bump('record')
+            apply_record_changes(removed=old_rows, added=record_rows(ok_ids))
+            publish_records(CheckInRecord.objects.filter(pk__in=ok_ids, last_modify_time=stamp))
+            invalidate_sessions({row[0] for row in old_rows})
+
+    return ok_resp({
+        'last_modify_time': stamp if ok_ids else None,
+        'results': [{'id': id, 'status': status[id], **({'last_modify_time': current[id]} if id in current else {})}
+                    for id in changes],
+    })
+
+
+def metrics_view(request: HttpRequest):
+    token = settings.METRICS_TOKEN
+    auth = request.headers.get('Authorization', '')
+    if not (token and constant_time_compare(auth, f'Bearer {token}')) and \
+            not (request.user.is_authenticated and request.user.is_superuser):
+        return unauthorized_401()
+
+    return HttpResponse(render_prometheus(metrics.registry.collect()),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_login
+@conditional_get('attendance', 'session', 'group', 'course', 'course_coordinators', 'group_access')
+def attendance_stats_view(request: HttpRequest):
+    user = request.user
+    try:
+        if 'session_id' in request.GET:
+            session_id = int(request.GET['session_id'])
+            scope = BaseSession.objects.filter(
+                session_can_read_by(user), pk=session_id)
+            counters = SessionAttendance.objects.filter(session_id=session_id)
+            if wants_archived(request.GET) and not scope.exists():
+                # an archived session keeps its counters
+                scope = counters = ArchivedSession.objects.filter(
+                    session_can_read_by(user), pk=session_id)
+        elif 'group_id' in request.GET and 'week_id' in request.GET:
+            group_id = int(request.GET['group_id'])
+            week_id = int(request.GET['week_id'])
+            scope = Group.objects.filter(group_can_read_by(user), pk=group_id)
+            counters = GroupWeekAttendance.objects.filter(
+                group_id=group_id, week_id=week_id)
+        elif 'course_id' in request.GET:
+            course_id = int(request.GET['course_id'])
+            scope = Course.objects.filter(
+                course_can_read_by(user), pk=course_id)
+            if 'user_id' in request.GET:
+                user_id = int(request.GET['user_id'])
+                if user_id == user.id:
+                    scope = Course.objects.filter(pk=course_id)
+                counters = StudentCourseAttendance.objects.filter(
+                    user_id=user_id, course_id=course_id)
+            else:
+                counters = CourseAttendance.objects.filter(course_id=course_id)
+        else:
+            return bad_request_400()
+    except ValueError:
+        return bad_request_400()
+
+    if not scope.exists():
+        return not_found_404()
+
+    counts = counters.values('absent', 'late', 'attended').first()
+    return ok_resp(counts or {'absent': 0, 'late': 0, 'attended': 0})
 
 
 @require_login
+@read_from_replica
+@conditional_get('record_users', 'user', 'course', 'group', 'group_access')
 def list_record_filters_view(request: HttpRequest):
-    records = CheckInRecord.objects.filter(record_can_read_by(request.user))
-
-    user_cond = (Q(attendance_records__user_id=F('id')) |
-                 Q(attendance_records__session__group__teaching_assistants=F('id')) |
-                 Q(attendance_records__session__group__course__course_coordinators=F('id')) |
-                 Q(attendance_records__session__group__lab__lab_executives=F('id')))
-    course_cond = (Q(groups__sessions__check_in_records__user_id=F('id')) |
-                   Q(groups__sessions__check_in_records__session__group__teaching_assistants=F('id')) |
-                   Q(groups__sessions__check_in_records__session__group__course__course_coordinators=F('id')) |
-                   Q(groups__sessions__check_in_records__session__group__lab__lab_executives=F('id')))
-    users = User.objects.filter(user_cond).values('id', 'username').distinct()
-    courses = Course.objects.filter(
-        course_cond).values('id', 'course_code', 'title').distinct()
+    return ok_resp(filter_options(request.user))
 
-    return ok_resp({
+
+def lab_today_readable_by(user: User, lab_id: int) -> bool:
+    if user.is_superuser:
+        return True
+    return User.objects.filter(lab_executive_of=lab_id, id=user.id).exists()
+
+
+def lab_today_snapshot(lab_id: int, since: str = None, record_fields: list = None) -> dict:
+    """
+    The sessions of a lab today with their groups, courses, records and
+    users, plus a watermark. Given the watermark of an earlier response as
+    `since`, only the records changed after it and their users are returned,
+    and sessions/groups/courses only if they changed.
+    """
+    issued = timezone.now()
+    today = date.today()
+    re_sessions, sp_sessions = sessions_of_day(today, lab_id)
+
+    all_session_id = list(re_sessions.values_list('id', flat=True)) + \
+        list(sp_sessions.values_list('id', flat=True))
+    if not day_is_materialized(today):
+        materialize_absent_records(all_session_id)
+
+    sessions = list(re_sessions.values())+list(sp_sessions.values())
+    groups = list(Group.objects.filter(
+        sessions__in=all_session_id).distinct().values())
+
+    groups_id = [g['id'] for g in groups]
+    courses = list(Course.objects.filter(
+        groups__in=groups_id).distinct().values())
+
+    static = {
+        'sessions': sessions,
+        'groups': groups,
+        'courses': courses,
+    }
+    fingerprint = watermark_fingerprint(static)
+    mark = read_watermark(since, lab_id, today) if since else None
+
+    records = CheckInRecord.objects.filter(session__in=all_session_id)
+    if mark:
+        changed_after, old_fingerprint = mark
+        records = records.filter(last_modify_time__gt=changed_after)
+        if old_fingerprint == fingerprint:
+            static = {}
+    users = User.objects.filter(
+        id__in=records.values('user_id')).values(*VISIBLE_USER_FIELDS)
+
+    return {
+        'records': list(records.values(*(record_fields or ()))),
+        **static,
         'users': list(users),
-        'courses': list(courses),
-    })
+        'full': not mark,
+        'watermark': make_watermark(issued, lab_id, today, fingerprint),
+    }
+
+
+def encode_snapshot(snapshot: dict, as_columnar: bool) -> dict:
+    return {k: encode_rows(v, as_columnar) if isinstance(v, list) else v
+            for k, v in snapshot.items()}
+
+
+def cached_lab_today_snapshot(lab_id: int, record_fields: list = None, as_columnar: bool = False) -> str:
+    variant = f'{",".join(record_fields or ())}:{int(as_columnar)}'
+    return cached_snapshot(lab_id, date.today(), lambda: json.dumps(encode_snapshot(
+        lab_today_snapshot(lab_id, record_fields=record_fields), as_columnar), cls=DjangoJSONEncoder), variant)
 
 
 @require_login
@@ -685,66 +1196,157 @@ def records_of_lab_today_view(request: HttpRequest):
     else:
         return bad_request_400()
 
-    if not request.user.is_superuser:
-        user = User.objects.filter(
-            lab_executive_of=lab_id, id=request.user.id).first()
-        if not user:
-            return not_found_404()
+    if not lab_today_readable_by(request.user, lab_id):
+        return not_found_404()
 
-    today = date.today()
-    week_before = today - timedelta(days=7)
-    week = Week.objects.filter(
-        monday_date__lte=today, monday_date__gt=week_before).first()
+    try:
+        # fields= applies to the records, which deltas are merged by
+        record_fields = requested_fields(
+            request.GET, model_fields(CheckInRecord), required=('id',))
+        as_columnar = wants_columnar(request.GET)
+    except BadFieldsRequest:
+        return bad_request_400()
+
+    since = request.GET.get('since')
+    if since:
+        return ok_resp(encode_snapshot(lab_today_snapshot(lab_id, since, record_fields), as_columnar))
+
+    snapshot = cached_lab_today_snapshot(lab_id, record_fields, as_columnar)
+    return HttpResponse(f'{{"ok": true, "data": {snapshot}}}', content_type='application/json')
+
+
+@require_login
+@json_post_request
+def check_in_view(request: HttpRequest, query: dict):
+    try:
+        if 'lab_id' in query:
+            lab_id = int(query['lab_id'])
+        else:
+            lab = Lab.objects.filter(lab_name=str(query['lab_name'])).first()
+            if not lab:
+                return not_found_404()
+            lab_id = lab.id
+        lab_room = int(query['lab_room'])
+    except:
+        return bad_request_400()
 
-    if week:
-        re_sessions = RegularSession.objects.filter(
-            group__lab_id=lab_id, active=True, week=week)
+    try:
+        result = check_in(request.user, lab_id, lab_room)
+    except CheckInRejected as e:
+        return err_resp(403, str(e), 403)
+
+    return ok_resp(result)
+
+
+BATCH_MAX_OPERATIONS = 100
+
+# routes a batch may address, check_in is left out because its writes are
+# coalesced outside the batch transaction
+BATCH_READ_ROUTES = {
+    'user_info': user_info_view,
+    'get_user': get_user_view,
+    'list_user': list_user_view,
+    'get_lab': get_lab_view,
+    'list_lab': list_lab_view,
+    'get_course': get_course_view,
+    'list_course': list_course_view,
+    'get_group': get_group_view,
+    'list_group': list_group_view,
+    'get_session': get_session_view,
+    'list_session': list_session_view,
+    'get_record': get_record_view,
+    'list_record': list_record_view,
+    'attendance_stats': attendance_stats_view,
+    'list_record_filters': list_record_filters_view,
+    'records_of_lab_today': records_of_lab_today_view,
+}
+BATCH_WRITE_ROUTES = {
+    'add_user': add_user_view,
+    'update_user': update_user_view,
+    'add_lab': add_lab_view,
+    'update_lab': update_lab_view,
+    'add_course': add_course_view,
+    'update_course': update_course_view,
+    'add_group': add_group_view,
+    'update_group': update_group_view,
+    'add_regular_session': add_regular_session_view,
+    'add_special_session': add_special_session_view,
+    'update_session': update_session_view,
+    'update_record': update_record_view,
+    'update_records': update_records_view,
+}
+
+
+class _OperationFailed(Exception):
+    pass
+
+
+def _sub_request(request: HttpRequest, route: str, params: dict) -> HttpRequest:
+    sub = copy.copy(request)
+    sub.META = {k: v for k, v in request.META.items()
+                if k != 'HTTP_IF_NONE_MATCH'}
+    sub.path = sub.path_info = reverse(route)
+    sub.resolver_match = resolve(sub.path)
+    sub.GET = QueryDict(mutable=True)
+    if route in BATCH_WRITE_ROUTES:
+        sub.method = 'POST'
+        sub._body = json.dumps(params).encode()
     else:
-        re_sessions = RegularSession.objects.none()
-    sp_sessions = SpecialSession.objects.filter(
-        lab_id=lab_id, active=True, lab_date=today)
-
-    all_sessions = list(re_sessions) + list(sp_sessions)
-
-    for session in all_sessions:
-        for student in session.group.students.all():
-            if not student.is_active:
-                continue
-            try:
-                CheckInRecord.objects.create(
-                    user=student, session=session, user_type=CheckInRecord.STUDENT,
-                    last_modify_time=datetime.utcnow(), check_in_state=CheckInRecord.ABSENT)
-            except:
-                traceback.print_exc()
-        for ta in session.group.teaching_assistants.all():
-            if not ta.is_active:
-                continue
-            try:
-                CheckInRecord.objects.create(
-                    user=ta, session=session, user_type=CheckInRecord.TA,
-                    last_modify_time=datetime.utcnow(), check_in_state=CheckInRecord.ABSENT)
-            except:
-                traceback.print_exc()
-
-    all_session_id = [s.id for s in all_sessions]
-    records = list(CheckInRecord.objects.filter(
-        session__in=all_session_id,
-    ).distinct().values())
-    groups = list(Group.objects.filter(
-        sessions__in=all_session_id).distinct().values())
+        sub.method = 'GET'
+        for k, v in params.items():
+            if isinstance(v, list):
+                sub.GET.setlist(k, [str(i) for i in v])
+            else:
+                sub.GET[k] = str(v)
+    return sub
 
-    groups_id = [g['id'] for g in groups]
-    courses = list(Course.objects.filter(
-        groups__in=groups_id).distinct().values())
 
-    records_id = [r['id'] for r in records]
-    users = list(User.objects.filter(
-        attendance_records__in=records_id).distinct().values(*VISIBLE_USER_FIELDS))
+def _run_operation(request: HttpRequest, route: str, params: dict) -> dict:
+    handler = BATCH_READ_ROUTES.get(route) or BATCH_WRITE_ROUTES[route]
+    resp = handler(_sub_request(request, route, params))
+    return {'route': route, 'status': resp.status_code, **json.loads(resp.content)}
 
-    return ok_resp({
-        'records': records,
-        'sessions': list(re_sessions.values())+list(sp_sessions.values()),
-        'groups': groups,
-        'courses': courses,
-        'users': users,
-    })
+
+@require_login
+@json_post_request
+def batch_view(request: HttpRequest, query: dict):
+    try:
+        atomic = _flag(query, 'atomic', False)
+        operations = [(str(op['route']), op.get('params', {}))
+                      for op in query['operations']]
+    except:
+        return bad_request_400()
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        return bad_request_400()
+    for route, params in operations:
+        if (route not in BATCH_READ_ROUTES and route not in BATCH_WRITE_ROUTES) or not isinstance(params, dict):
+            return bad_request_400()
+
+    # one transaction for the whole batch, each operation in a savepoint so
+    # a failed one leaves no partial writes behind
+    results = []
+    committed = True
+    try:
+        with transaction.atomic():
+            for route, params in operations:
+                try:
+                    with transaction.atomic():
+                        try:
+                            result = _run_operation(request, route, params)
+                        except Exception:
+                            # the error leaves the batch like any failed
+                            # operation, its savepoint is rolled back
+                            traceback.print_exc()
+                            result = {'route': route, 'status': 500, 'ok': False}
+                        results.append(result)
+                        if not result['ok']:
+                            raise _OperationFailed()
+                except _OperationFailed:
+                    if atomic:
+                        raise
+    except _OperationFailed:
+        committed = False
+
+    results += [{'route': route, 'status': None, 'ok': False, 'skipped': True}
+                for route, _ in operations[len(results):]]
+    return ok_resp({'committed': committed, 'results': results})
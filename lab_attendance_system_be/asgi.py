@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lab_attendance_system_be.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from be_api.live import lab_events_app  # noqa: E402 needs the apps loaded
+
+
+async def application(scope, receive, send):
+    # the live lab feed is a long lived stream served outside the Django
+    # request cycle, everything else goes through Django
+    if scope['type'] == 'http' and scope['path'] == '/api/lab_events':
+        await lab_events_app(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
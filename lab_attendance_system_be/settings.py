@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 from dj_database_url import parse as db_url
-from decouple import config
+from decouple import config, Csv
 
 from pathlib import Path
 
@@ -44,11 +44,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'be_api.middleware.MetricsMiddleware',
+    'be_api.replicas.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'be_api.middleware.TokenAuthMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -128,3 +131,88 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 STATICFILES_DIRS = [str(BASE_DIR / 'static')]
+
+# Check in
+# Concurrent check ins are buffered and written as one UPDATE every
+# CHECK_IN_FLUSH_INTERVAL seconds. Set CHECK_IN_COALESCE=False to write
+# each check in from its own request.
+CHECK_IN_COALESCE = config('CHECK_IN_COALESCE', default=True, cast=bool)
+CHECK_IN_FLUSH_INTERVAL = config(
+    'CHECK_IN_FLUSH_INTERVAL', default=0.005, cast=float)
+CHECK_IN_MAX_BATCH = config('CHECK_IN_MAX_BATCH', default=500, cast=int)
+
+# Metrics
+# With several worker processes set METRICS_DIR to a directory shared by
+# them, /api/metrics then reports the sum over all processes. The endpoint
+# is open to superusers and to requests bearing METRICS_TOKEN. Snapshots of
+# exited processes are merged into one METRICS_SNAPSHOT_MAX_AGE seconds
+# after their last write.
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config(
+    'METRICS_FLUSH_INTERVAL', default=1.0, cast=float)
+METRICS_SNAPSHOT_MAX_AGE = config(
+    'METRICS_SNAPSHOT_MAX_AGE', default=300.0, cast=float)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Lab day cache
+# records_of_lab_today snapshots are cached per lab and date, see
+# be_api/lab_cache.py. The local memory cache is per process; with several
+# worker processes set LAB_DAY_CACHE_LOCATION to a directory shared by them.
+LAB_DAY_CACHE_LOCATION = config('LAB_DAY_CACHE_LOCATION', default='')
+LAB_DAY_CACHE_MAX_ENTRIES = config(
+    'LAB_DAY_CACHE_MAX_ENTRIES', default=256, cast=int)
+LAB_DAY_CACHE_TIMEOUT = config('LAB_DAY_CACHE_TIMEOUT', default=86400, cast=int)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'lab_day': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache'
+        if LAB_DAY_CACHE_LOCATION else 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': LAB_DAY_CACHE_LOCATION or 'lab_day',
+        'TIMEOUT': LAB_DAY_CACHE_TIMEOUT,
+        'OPTIONS': {
+            # backstop for entries the in-process LRU does not know about,
+            # leaves room for the generation tokens
+            'MAX_ENTRIES': 2 * LAB_DAY_CACHE_MAX_ENTRIES + 1000,
+        },
+    },
+}
+
+# Academic calendar
+# Every process keeps the weeks in memory (be_api/academic_calendar.py) and
+# checks at most every CALENDAR_CHECK_INTERVAL seconds whether another
+# process changed them.
+CALENDAR_CHECK_INTERVAL = config(
+    'CALENDAR_CHECK_INTERVAL', default=10.0, cast=float)
+
+# Roster import
+# Processes hashing the passwords of users imported by the import_roster
+# command, 0 for the CPU count. The API hashes in the request's process,
+# so it accepts at most ROSTER_API_MAX_USERS users per request.
+ROSTER_HASH_WORKERS = config('ROSTER_HASH_WORKERS', default=0, cast=int)
+ROSTER_API_MAX_USERS = config('ROSTER_API_MAX_USERS', default=500, cast=int)
+
+# Auth tokens
+# login with {"token": true} returns a signed token valid for
+# AUTH_TOKEN_MAX_AGE seconds, see be_api/tokens.py. Revocations reach other
+# processes within AUTH_TOKEN_DENY_LIST_TTL seconds.
+AUTH_TOKEN_MAX_AGE = config('AUTH_TOKEN_MAX_AGE', default=12 * 3600, cast=int)
+AUTH_TOKEN_DENY_LIST_TTL = config(
+    'AUTH_TOKEN_DENY_LIST_TTL', default=5.0, cast=float)
+
+# Read replicas
+# Comma separated URLs of read replicas of DATABASE_URL. The get_* and
+# list_* views read from a random replica, except for clients that wrote
+# something in the last REPLICA_STICKY_SECONDS, see be_api/replicas.py.
+# Tests use the default database in place of the replicas.
+REPLICA_DATABASE_URLS = config('REPLICA_DATABASE_URLS', default='', cast=Csv())
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=5, cast=int)
+
+REPLICA_DATABASES = []
+for n, url in enumerate(REPLICA_DATABASE_URLS):
+    DATABASES[f'replica{n}'] = {**db_url(url), 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(f'replica{n}')
+
+DATABASE_ROUTERS = ['be_api.replicas.ReplicaRouter']